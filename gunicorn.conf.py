@@ -0,0 +1,64 @@
+"""
+Gunicorn configuration (read automatically when gunicorn is started from this directory).
+
+    gunicorn                     # WSGI, gthread workers
+    GUNICORN_WORKER_CLASS=login.workers.UvicornWorker gunicorn   # ASGI, see DEPLOYMENT.md
+
+Every setting can be overridden with the GUNICORN_* environment variables below (or on the
+command line). See DEPLOYMENT.md for sizing notes and measurements.
+"""
+import gc
+import multiprocessing
+import os
+
+_cpus = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# gthread: each worker process serves `threads` requests at once, so slow DB/SMTP waits
+# don't idle a whole process. ASGI deployments switch to login.workers.UvicornWorker.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('GUNICORN_WORKERS', str(_cpus * 2 + 1)))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+wsgi_app = 'login.asgi:application' if 'Uvicorn' in worker_class else 'login.wsgi:application'
+
+# Import Django and the app once in the master; workers share those pages copy-on-write
+# and recycled workers start instantly.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Recycle workers to cap slow memory growth; jitter keeps them from restarting together.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+# Keep-alive slightly above a typical proxy's upstream idle timeout.
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+
+# Worker heartbeat files on tmpfs, so a slow disk can't make healthy workers look hung.
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+if preload_app:
+    # No collections in the master while the app loads, so it leaves no freed "holes" in
+    # pages that workers would then copy (see the gc.freeze() docs).
+    gc.disable()
+
+
+def when_ready(server):
+    if preload_app:
+        from newlogin.warmup import warm_catalog
+        warm_catalog()
+        gc.freeze()
+        gc.enable()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        # Move everything loaded so far out of the collector's reach, so GC in the workers
+        # doesn't write to (and un-share) the master's objects.
+        gc.freeze()
@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'login.settings')
+# Each ASGI request runs its sync ORM work on its own thread, so persistent connections
+# would pile up per thread; close them at the end of every request unless overridden.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
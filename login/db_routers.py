@@ -0,0 +1,43 @@
+"""
+Primary/replica database routing.
+
+Writes always go to 'default'. Reads go to the 'replica' alias only while
+ReplicaRoutingMiddleware has marked the current request as replica-safe (a view that lists
+the current action in `read_replica_actions`, and the client has not written recently).
+Everything else, including management commands and background jobs, reads from 'default'.
+"""
+from contextvars import ContextVar
+
+REPLICA_ALIAS = 'replica'
+
+# Credentials and sessions are always read from the primary, so a token issued a moment
+# ago authenticates even if the replica is lagging.
+PRIMARY_ONLY_APPS = {'auth', 'authtoken', 'sessions', 'contenttypes'}
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def use_replica_for_reads():
+    """Route reads in the current request/context to the replica. Returns a token for reset_read_alias."""
+    return _read_alias.set(REPLICA_ALIAS)
+
+
+def reset_read_alias(token):
+    _read_alias.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return 'default'
+        return _read_alias.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
@@ -1,11 +1,62 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+from functools import lru_cache
+from urllib.parse import urlparse
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
 from django.http import HttpResponsePermanentRedirect
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from whitenoise.base import IsDirectoryError, MissingFileError
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.string_utils import ensure_leading_trailing_slash
+
+from .db_routers import reset_read_alias, use_replica_for_reads
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+profile_logger = logging.getLogger('login.query_profile')
+re_accepts_brotli = _lazy_re_compile(r'\bbr\b')
 
 
 class StripTrailingSpacesMiddleware:
+    # Runs natively under both WSGI and ASGI, so async views are not pushed onto a thread.
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        redirect = self._redirect(request)
+        if iscoroutinefunction(self):
+            return self._acall(request, redirect)
+        if redirect:
+            return redirect
+        return self.get_response(request)
+
+    async def _acall(self, request, redirect):
+        if redirect:
+            return redirect
+        return await self.get_response(request)
+
+    @staticmethod
+    def _redirect(request):
         path = request.path
         if path.endswith(' '):
             cleaned_path = path.rstrip(' ')
@@ -13,5 +64,349 @@ class StripTrailingSpacesMiddleware:
             if request.META.get('QUERY_STRING'):
                 new_url = f"{cleaned_path}?{request.META['QUERY_STRING']}"
             return HttpResponsePermanentRedirect(new_url)
+        return None
 
+
+class StaticMediaMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise for STATIC_ROOT (hashed, pre-compressed files from collectstatic) plus the
+    public catalog media in MEDIA_ROOT (MEDIA_PUBLIC_PREFIXES).
+
+    Uploaded media appears after start-up, so media URLs are looked up on disk per request
+    instead of from WhiteNoise's start-up file index. Media responses carry
+    `Cache-Control: max-age=MEDIA_CACHE_MAX_AGE, public, immutable`. Other media URLs (patient
+    and staff uploads) pass through untouched, so only DEBUG's static() route serves them.
+    WhiteNoise handles
+    ETag/Last-Modified conditional requests and Range requests for both. Served files never
+    reach URL resolution or the views. Works natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        # Set before WhiteNoise indexes STATIC_ROOT, which calls add_cache_headers().
+        self.media_prefix = ensure_leading_trailing_slash(urlparse(settings.MEDIA_URL).path)
+        self.media_root = os.path.abspath(settings.MEDIA_ROOT).rstrip(os.path.sep) + os.path.sep
+        self.media_public = tuple(self.media_prefix + prefix for prefix in settings.MEDIA_PUBLIC_PREFIXES)
+        self.media_max_age = settings.MEDIA_CACHE_MAX_AGE
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        static_file = self._find(request.path_info)
+        if iscoroutinefunction(self):
+            return self._acall(request, static_file)
+        if static_file is not None:
+            return self.serve(static_file, request)
         return self.get_response(request)
+
+    async def _acall(self, request, static_file):
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+    def _find(self, url):
+        if url.startswith(self.media_prefix):
+            return self._find_media(url) if url.startswith(self.media_public) else None
+        if self.autorefresh:
+            return self.find_file(url)
+        return self.files.get(url)
+
+    def _find_media(self, url):
+        if url.endswith('/') or not self.url_is_canonical(url):
+            return None
+        path = os.path.join(self.media_root, url[len(self.media_prefix):])
+        if os.path.commonprefix((self.media_root, path)) != self.media_root:
+            return None
+        try:
+            return self.get_static_file(path, url)
+        except (MissingFileError, IsDirectoryError):
+            return None
+
+    def add_cache_headers(self, headers, path, url):
+        if url.startswith(self.media_prefix):
+            headers['Cache-Control'] = f'max-age={self.media_max_age}, public, immutable'
+        else:
+            super().add_cache_headers(headers, path, url)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Negotiated brotli/gzip compression for responses of at least COMPRESS_MIN_SIZE bytes.
+
+    Clients that accept `br` get brotli (when the Brotli package is installed) for the JSON
+    API responses in BROTLI_CONTENT_TYPES, which carry no CSRF token or other page secret.
+    Brotli adds no BREACH padding, so HTML (admin, browsable API) and streaming responses fall
+    through to Django's gzip, including its BREACH-mitigating random padding. Small responses,
+    such as login, OTP and token payloads, and responses that advertise byte ranges are left
+    uncompressed.
+    Static files and media are served pre-compressed by StaticMediaMiddleware, which sits
+    above this one.
+    """
+    BROTLI_CONTENT_TYPES = ('application/json',)
+
+    def process_response(self, request, response):
+        if response.has_header('Accept-Ranges'):
+            # Byte ranges (invoice PDFs) index the uncompressed body.
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESS_MIN_SIZE:
+            return response
+        if (
+            brotli is None
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith(self.BROTLI_CONTENT_TYPES)
+            or not re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed_content = brotli.compress(response.content, quality=settings.COMPRESS_BROTLI_QUALITY)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(response.content))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Send reads for replica-safe views to the read replica (see login/db_routers.py).
+
+    A view opts in with `read_replica_actions`: viewset action names ('list', 'retrieve')
+    or, for plain APIViews, lower-case HTTP methods ('get'). After a successful write
+    (POST/PUT/PATCH/DELETE) the client is pinned to the primary for REPLICA_STICKY_SECONDS,
+    so a customer always reads back their own cart changes. The pin is keyed by the client's
+    credential (API token, else session cookie) and kept in CACHES, which must be shared by all
+    workers (e.g. Redis) for it to follow the client from one worker to the next. Anonymous
+    requests are never pinned.
+
+    Installed by settings only when a 'replica' database is configured. Works natively under
+    both WSGI and ASGI; the read alias is a ContextVar, so it follows the request into the
+    async ORM's worker thread.
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            self.process_view = self._aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        request._replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request._replica_token is not None:
+                reset_read_alias(request._replica_token)
+        key = self._sticky_key(request, response)
+        if key and self._is_write(request, response):
+            cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    async def _acall(self, request):
+        request._replica_token = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            if request._replica_token is not None:
+                reset_read_alias(request._replica_token)
+        key = self._sticky_key(request, response)
+        if key and self._is_write(request, response):
+            await cache.aset(key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self._replica_safe(request, view_func):
+            key = self._sticky_key(request)
+            if not (key and cache.get(key)):
+                request._replica_token = use_replica_for_reads()
+        return None
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if self._replica_safe(request, view_func):
+            key = self._sticky_key(request)
+            if not (key and await cache.aget(key)):
+                request._replica_token = use_replica_for_reads()
+        return None
+
+    def _is_write(self, request, response):
+        return request.method not in self.SAFE_METHODS and response.status_code < 400
+
+    def _replica_safe(self, request, view_func):
+        if request.method not in self.SAFE_METHODS:
+            return False
+        view_class = getattr(view_func, 'cls', None)
+        allowed = getattr(view_class, 'read_replica_actions', ())
+        if not allowed:
+            return False
+        method = request.method.lower()
+        actions = getattr(view_func, 'actions', None)
+        action = actions.get(method) if actions else method
+        return action in allowed
+
+    @staticmethod
+    def _sticky_key(request, response=None):
+        # Keyed by a secret the client holds (never by IP or X-Forwarded-For, which anyone can
+        # send), so one client can't see or set another's pin. A session started by this very
+        # response (login) is keyed by its new cookie.
+        ident = request.META.get('HTTP_AUTHORIZATION', '') or request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')
+        if not ident and response is not None and settings.SESSION_COOKIE_NAME in response.cookies:
+            ident = response.cookies[settings.SESSION_COOKIE_NAME].value
+        if not ident:
+            return None
+        return 'replica_sticky_' + hashlib.sha256(ident.encode()).hexdigest()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised (when QUERY_BUDGET_STRICT is on, e.g. in tests) if a view runs more queries than its budget."""
+
+
+class QueryProfilingMiddleware:
+    """
+    Per-request query count, SQL time, duplicate queries and wall time.
+
+    Always installed; does nothing unless QUERY_PROFILING is on, which is read per request so
+    tests can turn it on with override_settings. Results go out as a Server-Timing header and
+    one JSON log line per request on the 'login.query_profile' logger. Views may declare
+    `query_budget`: an int, or a dict keyed by viewset action / lower-case HTTP method. The
+    budget counts the view's own queries: those issued by the session and authentication
+    middleware and by DRF authentication classes (which depend on how the client
+    authenticated, and are cached for tokens) are logged but left out. Over-budget requests
+    log a warning, or raise QueryBudgetExceeded when QUERY_BUDGET_STRICT is set.
+
+    Runs natively under ASGI while profiling is off. A profiled async request is run on a
+    thread, where the execute_wrapper also sees the async ORM's queries.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        if not settings.QUERY_PROFILING:
+            return self.get_response(request)
+        return self._profile(request, self.get_response)
+
+    async def _acall(self, request):
+        if not settings.QUERY_PROFILING:
+            return await self.get_response(request)
+        return await sync_to_async(self._profile)(request, async_to_sync(self.get_response))
+
+    def _profile(self, request, get_response):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            by_auth = _issued_by_auth()
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append((context['connection'].alias, sql, _freeze(params), time.perf_counter() - started, by_auth))
+
+        request._query_budget = None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(record))
+            response = get_response(request)
+        wall = time.perf_counter() - started
+
+        sql_time = sum(q[3] for q in queries)
+        exact = Counter((q[0], q[1], q[2]) for q in queries)
+        similar = Counter((q[0], q[1]) for q in queries)
+        duplicates = sum(n - 1 for n in exact.values() if n > 1)
+        worst_sql, worst_count = similar.most_common(1)[0] if similar else ((None, None), 0)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={sql_time * 1000:.1f};desc="{len(queries)} queries, {duplicates} duplicate"',
+            f'app;dur={(wall - sql_time) * 1000:.1f}',
+            f'total;dur={wall * 1000:.1f}',
+        ])
+        budget = request._query_budget
+        auth_queries = sum(1 for q in queries if q[4])
+        view_queries = len(queries) - auth_queries
+        over_budget = budget is not None and view_queries > budget
+        profile_logger.log(
+            logging.WARNING if over_budget or duplicates else logging.INFO,
+            json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': getattr(request, '_query_view', None),
+                'status': response.status_code,
+                'queries': len(queries),
+                'auth_queries': auth_queries,
+                'duplicate_queries': duplicates,
+                'most_repeated_sql': worst_sql[1] if worst_count > 1 else None,
+                'most_repeated_count': worst_count if worst_count > 1 else 0,
+                'sql_ms': round(sql_time * 1000, 2),
+                'wall_ms': round(wall * 1000, 2),
+                'query_budget': budget,
+                'over_budget': over_budget,
+            }),
+        )
+        if over_budget and settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(
+                f'{request.method} {request.path} ran {view_queries} queries '
+                f'(+{auth_queries} for authentication); budget is {budget}.'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        request._query_view = view_class.__name__ if view_class else getattr(view_func, '__name__', None)
+        budget = getattr(view_class, 'query_budget', None)
+        if isinstance(budget, dict):
+            method = request.method.lower()
+            actions = getattr(view_func, 'actions', None)
+            budget = budget.get(actions.get(method) if actions else method)
+        request._query_budget = budget
+        return None
+
+
+@lru_cache(maxsize=None)
+def _auth_files():
+    """Source files whose queries are authentication's rather than the view's."""
+    from django.contrib.auth import middleware as auth_middleware
+    from django.contrib.sessions import middleware as session_middleware
+    from rest_framework import authentication as drf_authentication
+
+    from newlogin import authentication
+
+    return frozenset(m.__file__ for m in (auth_middleware, session_middleware, drf_authentication, authentication))
+
+
+def _issued_by_auth():
+    # The lazy request.user, session loading/saving and DRF's authenticators all run below
+    # one of these modules' frames; the view's own queries never do.
+    files = _auth_files()
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code.co_filename in files:
+            return True
+        frame = frame.f_back
+    return False
+
+
+def _freeze(params):
+    """Hashable form of query params, for duplicate detection."""
+    if isinstance(params, dict):
+        return tuple(sorted((k, repr(v)) for k, v in params.items()))
+    if isinstance(params, (list, tuple)):
+        return tuple(repr(p) for p in params)
+    return repr(params)
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    'whitenoise.runserver_nostatic',
     'django.contrib.staticfiles',
     'newlogin',
     'rest_framework',
@@ -45,8 +46,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'login.middleware.QueryProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'login.middleware.StaticMediaMiddleware',
+    'login.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'login.middleware.StripTrailingSpacesMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,15 +78,128 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'login.wsgi.application'
+ASGI_APPLICATION = 'login.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# DB_ENGINE selects the backend: 'sqlite' (default, local file) or 'mysql' (production).
+# MySQL uses mysqlclient, falling back to PyMySQL when mysqlclient isn't installed.
+# Connections persist for DB_CONN_MAX_AGE seconds and are health-checked before reuse.
+# SQLite runs in WAL mode with synchronous=NORMAL, a busy timeout and IMMEDIATE write
+# transactions, so concurrent gunicorn workers wait for the write lock instead of
+# failing with "database is locked". SQLITE_WAL=auto (default) leaves the committed dev
+# database (db.sqlite3 in the repo) in rollback-journal mode (with the default synchronous=FULL),
+# because switching to WAL rewrites its header and leaves -wal/-shm files next to it; point
+# DB_NAME at a deployment copy, or set SQLITE_WAL=1 / 0 to force it either way.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite').lower()
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+SQLITE_BUSY_TIMEOUT_SECONDS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_SECONDS', '20'))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_WAL = os.environ.get('SQLITE_WAL', 'auto').lower()
+
+if DB_ENGINE == 'mysql':
+    try:
+        import MySQLdb  # noqa: F401
+    except ImportError:
+        import pymysql
+        pymysql.install_as_MySQLdb()
+
+
+def _sqlite_wal(name):
+    if SQLITE_WAL in ('1', 'true', 'yes'):
+        return True
+    if SQLITE_WAL in ('0', 'false', 'no'):
+        return False
+    return Path(name).resolve() != (BASE_DIR / 'db.sqlite3').resolve()
+
+
+def _database(env_prefix, sqlite_name):
+    """Build one DATABASES entry from <env_prefix>_NAME/_USER/_PASSWORD/_HOST/_PORT (falling back to DB_*)."""
+    if DB_ENGINE == 'mysql':
+        return {
+            'ENGINE': 'django.db.backends.mysql',
+            'NAME': os.environ.get(f'{env_prefix}_NAME', os.environ.get('DB_NAME', 'kottakkal')),
+            'USER': os.environ.get(f'{env_prefix}_USER', os.environ.get('DB_USER', 'root')),
+            'PASSWORD': os.environ.get(f'{env_prefix}_PASSWORD', os.environ.get('DB_PASSWORD', '')),
+            'HOST': os.environ.get(f'{env_prefix}_HOST', os.environ.get('DB_HOST', '127.0.0.1')),
+            'PORT': os.environ.get(f'{env_prefix}_PORT', os.environ.get('DB_PORT', '3306')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'charset': 'utf8mb4',
+                'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+                'connect_timeout': 5,
+            },
+        }
+    name = os.environ.get(f'{env_prefix}_NAME', sqlite_name)
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Applied on every new connection (Django's connection-setup hook for SQLite).
+            # synchronous=NORMAL is only durable in WAL mode; the rollback journal keeps FULL.
+            'init_command': (
+                ('PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL;' if _sqlite_wal(name) else '')
+                + f'PRAGMA mmap_size={SQLITE_MMAP_SIZE};'
+                f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_SECONDS * 1000};'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+
+
 DATABASES = {
+    'default': _database('DB', BASE_DIR / 'db.sqlite3'),
+}
+
+# Query profiling (login.middleware.QueryProfilingMiddleware): per-request query count, SQL
+# time, duplicate queries and wall time as a Server-Timing header and a JSON log line on the
+# 'login.query_profile' logger. Views declare `query_budget`; with QUERY_BUDGET_STRICT an
+# over-budget request raises QueryBudgetExceeded (turn it on in tests), otherwise it logs a warning.
+# The middleware is always installed and reads both settings per request.
+QUERY_PROFILING = os.environ.get('QUERY_PROFILING', 'false').lower() in ('1', 'true', 'yes')
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', 'false').lower() in ('1', 'true', 'yes')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'login.query_profile': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'newlogin.warmup': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Optional read replica: set DB_REPLICA_NAME (SQLite file or MySQL schema) and, for MySQL,
+# DB_REPLICA_HOST/_PORT/_USER/_PASSWORD. Catalog list/retrieve and the admin order views
+# then read from it (login/db_routers.py, login.middleware.ReplicaRoutingMiddleware).
+# Clients (by API token or session) are pinned to the primary for REPLICA_STICKY_SECONDS after
+# any write. The pin lives in CACHES, so a shared cache (e.g. Redis) is required: with the default
+# per-process LocMemCache a client's next request may land on another worker and read stale data.
+# In tests the replica is a separate test database, so routing can be checked
+# (DB_REPLICA_NAME=replica.sqlite3 python manage.py test newlogin).
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '10'))
+if os.environ.get('DB_REPLICA_NAME') or os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = _database('DB_REPLICA', BASE_DIR / 'db.sqlite3')
+    DATABASE_ROUTERS = ['login.db_routers.PrimaryReplicaRouter']
+    MIDDLEWARE.append('login.middleware.ReplicaRoutingMiddleware')
+
+
+# Cache
+# Throttle counters (newlogin/throttling.py), token-cache version stamps (newlogin/authentication.py)
+# and the coupon index version (newlogin/coupons.py) live here. The default in-process LocMemCache
+# is per worker; point CACHE_BACKEND/CACHE_LOCATION at a shared cache in multi-worker
+# deployments, e.g. django.core.cache.backends.redis.RedisCache + redis://127.0.0.1:6379/1.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'kottakkal-default'),
     }
 }
 
@@ -106,6 +223,31 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# PASSWORD_HASHER picks the algorithm for new hashes: pbkdf2 (default), scrypt, or argon2
+# (argon2 needs `pip install argon2-cffi`). Costs below are optional; unset means Django's
+# default. Existing hashes keep verifying and are re-hashed at the new algorithm/cost on the
+# user's next successful login. Lower costs trade brute-force resistance for login CPU;
+# measure with `python manage.py bench_password_hashing` before changing them.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', '0')) or None
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', '0')) or None
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', '0')) or None
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', '0')) or None
+
+_TUNABLE_PASSWORD_HASHERS = {
+    'pbkdf2': 'newlogin.hashers.TunablePBKDF2PasswordHasher',
+    'scrypt': 'newlogin.hashers.TunableScryptPasswordHasher',
+    'argon2': 'newlogin.hashers.TunableArgon2PasswordHasher',
+}
+PASSWORD_HASHERS = [_TUNABLE_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _TUNABLE_PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/6.0/topics/i18n/
 
@@ -122,15 +264,70 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+# `python manage.py collectstatic` writes hashed, gzip/brotli pre-compressed copies here;
+# StaticMediaMiddleware (login/middleware.py) serves them with far-future immutable caching.
+STATIC_ROOT = os.environ.get('STATIC_ROOT', BASE_DIR / 'staticfiles')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Catalog media (item and category images/videos, the directories below) is served by
+# StaticMediaMiddleware in every mode with `Cache-Control: public, immutable`; lower the max-age
+# if files are ever replaced under the same name. Other uploads (patient photos, staff and doctor
+# biodata/photos, company logos) are never served publicly: only with DEBUG, by Django's static()
+# view.
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', str(365 * 24 * 60 * 60)))
+MEDIA_PUBLIC_PREFIXES = (
+    'category_images/',
+    'item_images/',
+    'medicalitem_images/',
+    'medicalitem_videos/',
+    'medicine_images/',
+    'medicine_videos/',
+)
+
+# Invoice PDFs (newlogin/invoices.py) hold customer details, so they are kept outside MEDIA_ROOT
+# and only served through the authenticated /api/orders/<order_no>/invoice.pdf endpoint.
+INVOICE_ROOT = os.environ.get('INVOICE_ROOT', BASE_DIR / 'invoices')
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+    'invoices': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': INVOICE_ROOT},
+    },
+}
 
 # When frontend runs on another host/port (e.g. Vite), set this so image URLs point to this server.
 # Example: PUBLIC_MEDIA_BASE_URL = 'http://127.0.0.1:8000'
 # Leave empty to use the request host (works when frontend proxies /api and /media to this server).
 PUBLIC_MEDIA_BASE_URL = os.environ.get('PUBLIC_MEDIA_BASE_URL', 'http://127.0.0.1:8000')
 
+# API responses of at least COMPRESS_MIN_SIZE bytes are compressed by CompressionMiddleware:
+# brotli for JSON, gzip (with BREACH padding) for HTML. Brotli quality 4 keeps compression
+# time well below render time.
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '4'))
+
+# Django REST framework
+REST_FRAMEWORK = {
+    # orjson-backed JSON (newlogin/renderers.py); same output as DRF's JSONRenderer.
+    'DEFAULT_RENDERER_CLASSES': [
+        'newlogin.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Sliding-window rates for the unauthenticated auth endpoints; see newlogin/throttling.py.
+    'DEFAULT_THROTTLE_RATES': {
+        'otp_ip': os.environ.get('THROTTLE_OTP_IP', '20/hour'),
+        'otp_mobile': os.environ.get('THROTTLE_OTP_MOBILE', '5/hour'),
+        'otp_email': os.environ.get('THROTTLE_OTP_EMAIL', '5/hour'),
+        'login_ip': os.environ.get('THROTTLE_LOGIN_IP', '30/min'),
+        'login_username': os.environ.get('THROTTLE_LOGIN_USERNAME', '10/min'),
+        'identify_ip': os.environ.get('THROTTLE_IDENTIFY_IP', '30/min'),
+        'identify_mobile': os.environ.get('THROTTLE_IDENTIFY_MOBILE', '10/min'),
+    },
+}
+
 # CORS settings (for frontend API access)
 CORS_ALLOW_ALL_ORIGINS = True  # Allow all origins in development
 CORS_ALLOW_CREDENTIALS = True
@@ -170,3 +367,51 @@ DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER or 'no
 SMS_GATEWAY_URL = ''  # e.g. 'https://your-sms-gateway.com/send?to={phone}&text={message}'
 SMS_GATEWAY_METHOD = 'GET'  # or 'POST'
 SMS_API_KEY = ''  # If your gateway needs an auth key in URL/body
+
+# OTP housekeeping (see newlogin/otp_utils.py and `manage.py purge_otps`).
+# Expired OTPs, and verified ones older than the retention window, are bulk-deleted in batches.
+# OTP_MAX_ROWS caps the table (oldest rows dropped first); 0 disables the cap.
+OTP_PURGE_BATCH_SIZE = int(os.environ.get('OTP_PURGE_BATCH_SIZE', '1000'))
+OTP_PURGE_INTERVAL_SECONDS = int(os.environ.get('OTP_PURGE_INTERVAL_SECONDS', '300'))
+OTP_VERIFIED_RETENTION_SECONDS = int(os.environ.get('OTP_VERIFIED_RETENTION_SECONDS', '0'))
+OTP_MAX_ROWS = int(os.environ.get('OTP_MAX_ROWS', '100000'))
+
+# Token auth cache (newlogin/authentication.py): bounded per-process LRU of token -> (user, profile).
+# Logout / password change / deactivation / account delete stamp a new per-user version in CACHES,
+# which every worker checks on each hit, so with a shared cache (e.g. Redis) they take effect
+# everywhere on the next request. With the default per-process cache other workers pick them up
+# within AUTH_TOKEN_CACHE_TTL seconds. Set either to 0 to disable.
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', '10000'))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', '60'))
+
+# Background worker pool (newlogin/background.py) for OTP purges, invoice rendering and similar
+# work kept off request threads. When BACKGROUND_QUEUE_SIZE jobs are pending, new jobs run inline.
+# BACKGROUND_WORKERS = 0 runs everything inline.
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', '2'))
+BACKGROUND_QUEUE_SIZE = int(os.environ.get('BACKGROUND_QUEUE_SIZE', '64'))
+
+# Stock ledger (newlogin/inventory.py). Movements and on-hand balances are always recorded; with
+# INVENTORY_ENFORCE_STOCK=1 add-to-cart, increment and order confirm refuse quantities that are
+# not on hand. Load opening stock (POST /api/stock/adjust/) before turning it on.
+INVENTORY_ENFORCE_STOCK = os.environ.get('INVENTORY_ENFORCE_STOCK', '0') == '1'
+
+# Seconds /api/medicalitems/bestsellers/ responses stay in the cache (CACHES). The ranking itself
+# changes only when `manage.py refresh_bestsellers` runs.
+BESTSELLERS_CACHE_TTL = int(os.environ.get('BESTSELLERS_CACHE_TTL', '60'))
+
+# Rows fetched per database round trip by the streaming exports (/api/exports/...). Memory per
+# export is about this many rows plus one 64 KB output chunk, whatever the export's size.
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '2000'))
+
+# Seconds each worker keeps its in-memory index of active coupons (newlogin/coupons.py). Saving
+# or deleting a coupon refreshes every worker sooner when CACHES is shared (e.g. Redis).
+COUPON_INDEX_TTL = int(os.environ.get('COUPON_INDEX_TTL', '300'))
+
+# Counter rows each coupon's redemption total is striped over (newlogin/coupons.py redeem()), so
+# concurrent checkouts with the same coupon rarely update the same row. Applies to coupons saved
+# after a change; existing ones keep their stripes until they are edited.
+COUPON_COUNTER_SHARDS = int(os.environ.get('COUPON_COUNTER_SHARDS', '16'))
+
+# Catalog rows serialized by the gunicorn start-up warm-up (newlogin/warmup.py, run once in the
+# preloading master so workers fork with warm imports and DB pages).
+WARMUP_CATALOG_ITEMS = int(os.environ.get('WARMUP_CATALOG_ITEMS', '1000'))
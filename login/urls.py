@@ -24,5 +24,7 @@ urlpatterns = [
     path('api/', include('newlogin.urls')),
 ]
 
+# Static files and catalog media are served by login.middleware.StaticMediaMiddleware; other
+# uploads (patient/staff/doctor files) only in development.
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,13 @@
+"""
+Gunicorn worker classes for running the ASGI application.
+
+    gunicorn login.asgi:application -k login.workers.UvicornWorker
+
+Django does not implement the ASGI lifespan protocol, so lifespan is turned off instead of
+letting uvicorn probe for it and log a warning on every worker boot.
+"""
+from uvicorn_worker import UvicornWorker as BaseUvicornWorker
+
+
+class UvicornWorker(BaseUvicornWorker):
+    CONFIG_KWARGS = {**BaseUvicornWorker.CONFIG_KWARGS, 'lifespan': 'off'}
@@ -29,11 +29,16 @@ class PurchaseOrderItemInline(admin.TabularInline):
 
 @admin.register(PurchaseOrder)
 class PurchaseOrderAdmin(admin.ModelAdmin):
-    list_display = ['purchase_order_no', 'date', 'supplier', 'emp', 'status', 'remarks']
+    list_display = ['purchase_order_no', 'date', 'supplier', 'emp', 'status', 'outstanding_lines', 'remarks']
     list_filter = ['date', 'status']
     search_fields = ['purchase_order_no']
     inlines = [PurchaseOrderItemInline]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Lines may have been edited in the inline; keep outstanding_lines/status in step.
+        form.instance.refresh_outstanding_lines()
+
 
 @admin.register(Supplier)
 class SupplierAdmin(admin.ModelAdmin):
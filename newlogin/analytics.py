@@ -0,0 +1,219 @@
+"""
+Daily sales rollups for reporting.
+
+DailySalesRollup holds revenue, units and order count per day for each item (mcode),
+category (catcode) and payment mode, so reports never scan OnlineOrderItem.
+- record_order() adds one confirmed order, inside ConfirmOrderAPIView's transaction.
+- rebuild() recomputes a date range from the orders (rebuild_sales_rollups command).
+- refresh_bestsellers() ranks items from the rollups into BestsellerRank (refresh_bestsellers
+  command), which /api/medicalitems/bestsellers/ serves.
+
+Item and category revenue is the sum of line amounts. Payment-mode revenue is the order's
+net_amount, after cart discount, so the daily totals match the order list.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Case, CharField, Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+
+from .models import BestsellerRank, Cart, Category, DailySalesRollup, MedicalItem, OnlineOrderItem
+
+ITEM = DailySalesRollup.DIMENSION_ITEM
+CATEGORY = DailySalesRollup.DIMENSION_CATEGORY
+PAYMENT_MODE = DailySalesRollup.DIMENSION_PAYMENT_MODE
+
+BESTSELLER_WINDOWS = (7, 30, 90)
+
+
+def record_order(cart, lines):
+    """Add a confirmed cart and its OnlineOrderItem lines to the rollups for cart.date."""
+    catcodes = dict(
+        MedicalItem.objects.filter(mcode__in={line.item_code for line in lines})
+        .values_list('mcode', 'category__catcode')
+    )
+    deltas = defaultdict(lambda: [0, Decimal('0'), 1])
+    for line in lines:
+        for key in ((ITEM, line.item_code), (CATEGORY, catcodes.get(line.item_code) or '')):
+            deltas[key][0] += line.qty
+            deltas[key][1] += line.amt
+    deltas[(PAYMENT_MODE, cart.payment_mode or '')] = [sum(line.qty for line in lines), cart.net_amount, 1]
+
+    with transaction.atomic():
+        DailySalesRollup.objects.bulk_create(
+            [DailySalesRollup(date=cart.date, dimension=dimension, key=key) for dimension, key in deltas],
+            ignore_conflicts=True,
+        )
+        row_deltas = {
+            pk: deltas[(dimension, key)]
+            for pk, dimension, key in DailySalesRollup.objects.filter(
+                date=cart.date, key__in={key for _, key in deltas}
+            ).values_list('id', 'dimension', 'key')
+            if (dimension, key) in deltas
+        }
+
+        def increment(column, index, output_field):
+            return F(column) + Case(
+                *[When(id=pk, then=Value(delta[index])) for pk, delta in row_deltas.items()],
+                default=Value(0),
+                output_field=output_field,
+            )
+
+        DailySalesRollup.objects.filter(id__in=row_deltas).update(
+            units=increment('units', 0, IntegerField()),
+            revenue=increment('revenue', 1, DecimalField(max_digits=14, decimal_places=2)),
+            orders=increment('orders', 2, IntegerField()),
+        )
+
+
+def _rollup_rows(start, end):
+    confirmed = Cart.objects.exclude(delivery_status='CART').filter(date__range=(start, end))
+    lines = OnlineOrderItem.objects.exclude(cart__delivery_status='CART').filter(cart__date__range=(start, end))
+    totals = dict(units=Sum('qty'), revenue=Sum('amt'), orders=Count('cart_id', distinct=True))
+
+    for row in lines.values('cart__date', 'item_code').annotate(**totals).order_by():
+        yield DailySalesRollup(
+            date=row['cart__date'], dimension=ITEM, key=row['item_code'],
+            units=row['units'], revenue=row['revenue'], orders=row['orders'],
+        )
+
+    catcode = Subquery(
+        MedicalItem.objects.filter(mcode=OuterRef('item_code')).values('category__catcode')[:1],
+        output_field=CharField(),
+    )
+    for row in (
+        lines.annotate(catcode=Coalesce(catcode, Value('')))
+        .values('cart__date', 'catcode').annotate(**totals).order_by()
+    ):
+        yield DailySalesRollup(
+            date=row['cart__date'], dimension=CATEGORY, key=row['catcode'],
+            units=row['units'], revenue=row['revenue'], orders=row['orders'],
+        )
+
+    units = {
+        (row['cart__date'], row['cart__payment_mode'] or ''): row['units']
+        for row in lines.values('cart__date', 'cart__payment_mode').annotate(units=Sum('qty')).order_by()
+    }
+    payment_rows = defaultdict(lambda: [Decimal('0'), 0])
+    for row in confirmed.values('date', 'payment_mode').annotate(revenue=Sum('net_amount'), orders=Count('id')).order_by():
+        # NULL and '' payment modes share the '' key.
+        payment_rows[(row['date'], row['payment_mode'] or '')][0] += row['revenue']
+        payment_rows[(row['date'], row['payment_mode'] or '')][1] += row['orders']
+    for (day, mode), (revenue, orders) in payment_rows.items():
+        yield DailySalesRollup(
+            date=day, dimension=PAYMENT_MODE, key=mode,
+            units=units.get((day, mode), 0), revenue=revenue, orders=orders,
+        )
+
+
+def rebuild(start, end, chunk_days=31, log=None):
+    """
+    Recompute the rollups for start..end (inclusive) from the orders, chunk_days at a time,
+    each chunk in its own transaction. Returns the number of rollup rows written.
+    """
+    written = 0
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+        with transaction.atomic():
+            DailySalesRollup.objects.filter(date__range=(chunk_start, chunk_end)).delete()
+            rows = DailySalesRollup.objects.bulk_create(list(_rollup_rows(chunk_start, chunk_end)), batch_size=2000)
+        written += len(rows)
+        if log:
+            log(f'  {chunk_start}..{chunk_end}: {len(rows)} rows')
+        chunk_start = chunk_end + timedelta(days=1)
+    return written
+
+
+def _money(value):
+    # SQLite sums decimals as floats; report whole paise like the order tables.
+    return (value or Decimal('0')).quantize(Decimal('0.01'))
+
+
+def report(dimension, start, end, order_by='revenue', limit=20):
+    """Totals per key of one dimension over start..end, best first, with item / category names."""
+    rows = list(
+        DailySalesRollup.objects.filter(dimension=dimension, date__range=(start, end))
+        .values('key')
+        .annotate(units=Sum('units'), revenue=Sum('revenue'), orders=Sum('orders'))
+        .order_by(f'-{order_by}', 'key')[:limit]
+    )
+    keys = [row['key'] for row in rows]
+    if dimension == ITEM:
+        names = dict(MedicalItem.objects.filter(mcode__in=keys).values_list('mcode', 'sku_name'))
+    elif dimension == CATEGORY:
+        names = dict(Category.objects.filter(catcode__in=keys).values_list('catcode', 'name'))
+    else:
+        names = {}
+    for row in rows:
+        row['name'] = names.get(row['key'])
+        row['revenue'] = _money(row['revenue'])
+    return rows
+
+
+def daily_totals(start, end):
+    """Revenue, units and orders per day over start..end (from the payment-mode rollups)."""
+    rows = list(
+        DailySalesRollup.objects.filter(dimension=PAYMENT_MODE, date__range=(start, end))
+        .values('date')
+        .annotate(units=Sum('units'), revenue=Sum('revenue'), orders=Sum('orders'))
+        .order_by('date')
+    )
+    for row in rows:
+        row['revenue'] = _money(row['revenue'])
+    return rows
+
+
+def refresh_bestsellers(top=50, per_category=20, today=None):
+    """
+    Replace BestsellerRank with the top items by units sold (then revenue) over the last 7, 30
+    and 90 days up to today: `top` overall and `per_category` in each category. Returns the
+    number of ranking rows written.
+    """
+    today = today or now().date()
+    computed_at = now()
+    ranks = []
+    items = None
+    for window in sorted(BESTSELLER_WINDOWS, reverse=True):
+        totals = list(
+            DailySalesRollup.objects.filter(
+                dimension=ITEM, date__gt=today - timedelta(days=window), date__lte=today
+            ).values('key').annotate(units=Sum('units'), revenue=Sum('revenue')).order_by()
+        )
+        if items is None:
+            # The widest window covers every item any narrower one can rank.
+            items = {
+                mcode: (item_id, category_id)
+                for mcode, item_id, category_id in MedicalItem.objects.filter(
+                    mcode__in=[row['key'] for row in totals]
+                ).values_list('mcode', 'id', 'category_id')
+            }
+        ranked = sorted(
+            (row for row in totals if row['key'] in items),
+            key=lambda row: (-row['units'], -row['revenue'], row['key']),
+        )
+        per_category_rank = defaultdict(int)
+        for position, row in enumerate(ranked, start=1):
+            item_id, category_id = items[row['key']]
+            revenue = _money(row['revenue'])
+            if position <= top:
+                ranks.append(BestsellerRank(
+                    window_days=window, category_id=None, rank=position, item_id=item_id,
+                    units=row['units'], revenue=revenue, computed_at=computed_at,
+                ))
+            if category_id is not None and per_category_rank[category_id] < per_category:
+                per_category_rank[category_id] += 1
+                ranks.append(BestsellerRank(
+                    window_days=window, category_id=category_id, rank=per_category_rank[category_id],
+                    item_id=item_id, units=row['units'], revenue=revenue, computed_at=computed_at,
+                ))
+
+    with transaction.atomic():
+        BestsellerRank.objects.all().delete()
+        BestsellerRank.objects.bulk_create(ranks, batch_size=2000)
+    return len(ranks)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class NewloginConfig(AppConfig):
     name = 'newlogin'
+
+    def ready(self):
+        # Connect the token-cache and coupon-index invalidation signal handlers.
+        from . import authentication, coupons  # noqa: F401
@@ -0,0 +1,93 @@
+"""
+Async support for DRF views.
+
+DRF 3.16 dispatches synchronously, so a slow notification or DB wait holds a whole worker.
+AsyncAPIView and AsyncViewSetMixin give views an async dispatch: handlers written as
+`async def` run on the event loop (use the async ORM and sync_to_async for blocking calls),
+while authentication, permissions, throttling and any remaining sync handlers run through
+sync_to_async. Under ASGI (uvicorn) many slow requests then share one worker; under WSGI
+Django wraps the views with async_to_sync and they behave like the sync versions.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+class AsyncDispatchMixin:
+    """APIView.dispatch as a coroutine; sync handlers (e.g. OPTIONS) are run in a thread."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication, permission and throttle checks may hit the DB and cache.
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncAPIView(AsyncDispatchMixin, APIView):
+    """APIView whose HTTP method handlers are all `async def`."""
+
+
+class AsyncViewSetMixin(AsyncDispatchMixin):
+    """
+    Async dispatch for a ViewSet. Put it first in the bases; actions may be sync or async
+    and sync ones (create, update, custom @action methods) keep working unchanged.
+    """
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        # ViewSetMixin builds a plain function that returns dispatch()'s coroutine; mark it
+        # so Django awaits it (or wraps it in async_to_sync under WSGI).
+        markcoroutinefunction(view)
+        return view
+
+    async def aget_object(self):
+        """Async get_object(): same lookup, 404 and object permission checks."""
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}).afirst()
+        except (TypeError, ValueError, ValidationError):
+            obj = None
+        if obj is None:
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class AsyncReadModelMixin:
+    """Async list() and retrieve() for a ModelViewSet using AsyncViewSetMixin (no pagination)."""
+
+    async def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        objects = [obj async for obj in queryset]
+        serializer = self.get_serializer(objects, many=True)
+        return Response(serializer.data)
+
+    async def retrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
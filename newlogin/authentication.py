@@ -0,0 +1,180 @@
+"""
+Token authentication with an in-process LRU cache of token -> (user, profile).
+
+DRF's TokenAuthentication does a Token+User join on every request, and most views then
+hit request.user.profile for another query. CachedTokenAuthentication loads all three
+in one query on a miss and serves hot tokens with zero queries until the entry expires
+(AUTH_TOKEN_CACHE_TTL) or is invalidated by the signal handlers below (token deleted /
+logout, user saved e.g. password reset, user or profile deleted).
+
+Each entry remembers the user's version stamp from the shared cache (CACHES) at load time, and
+every hit compares it with the current one. The signal handlers replace the stamp, so a logout,
+password reset or deactivation in one worker stops the token in every worker on its next
+request. That needs a cache shared by all workers (e.g. Redis); with the default per-process
+LocMemCache other workers only drop the entry when AUTH_TOKEN_CACHE_TTL runs out.
+"""
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .models import UserProfile
+
+
+class TokenCache:
+    """Thread-safe bounded LRU of token key -> (user, token, version) with a per-entry TTL."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, token, version, expires = entry
+            if expires <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return user, token, version
+
+    def set(self, key, user, token, version=None):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (user, token, version, time.monotonic() + self.ttl)
+            self._keys_by_user.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_key(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_user.get(entry[0].pk)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[entry[0].pk]
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60),
+)
+
+
+_profile_of_user = UserProfile._meta.get_field('user').remote_field
+_user_of_profile = UserProfile._meta.get_field('user')
+
+
+def _request_user(user):
+    """
+    A per-request copy of a cached user, and of its preloaded profile, so per-request attribute
+    and relation caching on request.user (or request.user.profile) never leaks across requests
+    or threads.
+    """
+    user = copy.copy(user)
+    if _profile_of_user.is_cached(user):
+        profile = _profile_of_user.get_cached_value(user)
+        if profile is not None:
+            profile = copy.copy(profile)
+            _user_of_profile.set_cached_value(profile, user)
+        _profile_of_user.set_cached_value(user, profile)
+    return user
+
+
+def _version_key(user_id):
+    return f'auth:user-version:{user_id}'
+
+
+def user_version(user_id):
+    return cache.get(_version_key(user_id))
+
+
+def bump_user_version(user_id):
+    """Give user_id a new version stamp, so every worker's cached tokens for them miss."""
+    token_cache.invalidate_user(user_id)
+
+    def stamp():
+        # A fresh unique value rather than incr(): it can't match a stamp an entry holds, and
+        # it outlives every entry cached before the bump.
+        cache.set(_version_key(user_id), uuid.uuid4().hex, timeout=token_cache.ttl + 60)
+
+    stamp()
+    # Again once the change is committed, in case another worker re-cached the old row meanwhile.
+    transaction.on_commit(stamp)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that preloads user.profile and serves repeat tokens from token_cache."""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            user, token, version = cached
+            if version == user_version(user.pk):
+                return _request_user(user), token
+            token_cache.invalidate_user(user.pk)
+
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user', 'user__profile').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        token_cache.set(key, token.user, token, user_version(token.user_id))
+        return _request_user(token.user), token
+
+
+@receiver(post_delete, sender=Token)
+def _invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate_key(instance.key)
+    bump_user_version(instance.user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def _invalidate_user(sender, instance, **kwargs):
+    bump_user_version(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def _invalidate_profile_user(sender, instance, **kwargs):
+    bump_user_version(instance.user_id)
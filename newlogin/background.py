@@ -0,0 +1,81 @@
+"""
+Bounded background worker pool for work that should not run on the request thread
+(OTP purges, invoice rendering). Jobs are handed over after the surrounding transaction commits;
+when the pool's queue is full the job runs inline instead, so load never piles up unbounded.
+Async views can also await a result from the pool (run_in_pool(), e.g. password hashing).
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(getattr(settings, 'BACKGROUND_QUEUE_SIZE', 64))
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BACKGROUND_WORKERS', 2),
+                    thread_name_prefix='newlogin-bg',
+                )
+    return _executor
+
+
+def _run(fn, args, kwargs, in_worker):
+    if in_worker:
+        close_old_connections()
+    try:
+        fn(*args, **kwargs)
+    except Exception as e:
+        logger.exception('Background job %s failed: %s', getattr(fn, '__name__', fn), e)
+    finally:
+        if in_worker:
+            _slots.release()
+            connection.close()
+
+
+def _submit(fn, args, kwargs):
+    if getattr(settings, 'BACKGROUND_WORKERS', 2) <= 0 or not _slots.acquire(blocking=False):
+        _run(fn, args, kwargs, in_worker=False)
+        return
+    _get_executor().submit(_run, fn, args, kwargs, True)
+
+
+def run_in_background(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) on the worker pool once the current transaction (if any) commits."""
+    transaction.on_commit(lambda: _submit(fn, args, kwargs))
+
+
+def _call(fn, args, kwargs):
+    close_old_connections()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _slots.release()
+        connection.close()
+
+
+async def run_in_pool(fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) on the worker pool now and await its result (exceptions propagate).
+    When the queue is full it runs inline instead, on the request's sync thread.
+    """
+    if getattr(settings, 'BACKGROUND_WORKERS', 2) <= 0 or not _slots.acquire(blocking=False):
+        return await sync_to_async(fn)(*args, **kwargs)
+    try:
+        future = _get_executor().submit(_call, fn, args, kwargs)
+    except BaseException:
+        _slots.release()
+        raise
+    return await asyncio.wrap_future(future)
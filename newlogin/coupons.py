@@ -0,0 +1,298 @@
+"""
+Coupon lookup and application to carts.
+
+ActiveCouponIndex holds the active, unexpired coupons in memory, keyed by normalized code, so
+applying a coupon and re-checking it at checkout never scan the coupon table. A process reloads
+its index (one query) when it is older than COUPON_INDEX_TTL, when the date changes, or when a
+coupon has been saved or deleted anywhere: the signal handlers below bump a version number in
+the shared cache (CACHES), which every lookup compares with the version it loaded.
+
+apply_to_cart() writes the coupon and its discount to the cart in one UPDATE that computes the
+discount from the cart's current lines, so it always matches the subtotal it was taken from.
+refresh_cart_discount() re-runs it after the lines change.
+
+redeem() counts a confirmed order against the coupon's limits without a shared hot row: the
+customer's CouponRedemption row is incremented with `count < max_per_customer` in the WHERE
+clause, and the total goes to one random CouponUsageShard stripe with `used < capacity`. The
+stripes' capacities add up to max_redemptions; sync_shards() re-spreads what is left when a
+coupon is saved.
+"""
+import logging
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.timezone import now
+
+from .models import Cart, Coupon, CouponRedemption, CouponUsageShard, OnlineOrderItem
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'coupons:index-version'
+
+
+class CouponError(Exception):
+    """A code that cannot be applied. The message is meant for the customer."""
+
+
+def normalize(code):
+    """Coupon codes match case-insensitively and ignore surrounding / repeated spaces."""
+    return ' '.join(str(code).split()).upper()
+
+
+class ActiveCouponIndex:
+    """Thread-safe in-process map of normalized code -> active Coupon, reloaded when stale."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._coupons = {}
+        self._by_id = {}
+        self._version = None
+        self._loaded_on = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, code):
+        self._refresh_if_stale()
+        return self._coupons.get(normalize(code))
+
+    def get_by_id(self, coupon_id):
+        self._refresh_if_stale()
+        return self._by_id.get(coupon_id)
+
+    def invalidate(self):
+        self._expires = 0.0
+
+    def _is_fresh(self, version):
+        return (
+            version == self._version
+            and self._loaded_on == now().date()
+            and time.monotonic() < self._expires
+        )
+
+    def _refresh_if_stale(self):
+        version = cache.get(VERSION_KEY, 0)
+        if self._is_fresh(version):
+            return
+        with self._lock:
+            if not self._is_fresh(version):
+                self._load(version)
+
+    def _load(self, version):
+        today = now().date()
+        coupons = {}
+        # Newest first: if two active coupons share a code, the newest one applies.
+        for coupon in (
+            Coupon.objects.filter(status=Coupon.STATUS_ACTIVE)
+            .filter(Q(promo_end__isnull=True) | Q(promo_end__gte=today))
+            .only('id', 'name', 'promo_start', 'promo_end', 'discount_pct', 'type', 'max_redemptions', 'max_per_customer')
+            .order_by('-id')
+        ):
+            coupons.setdefault(normalize(coupon.name), coupon)
+        self._coupons = coupons
+        self._by_id = {coupon.pk: coupon for coupon in coupons.values()}
+        self._version = version
+        self._loaded_on = today
+        self._expires = time.monotonic() + self.ttl
+
+
+coupon_index = ActiveCouponIndex(ttl=getattr(settings, 'COUPON_INDEX_TTL', 300))
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def _coupons_changed(sender, **kwargs):
+    coupon_index.invalidate()
+    if not cache.add(VERSION_KEY, 1, timeout=None):
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, timeout=None)
+
+
+@receiver(post_save, sender=Coupon)
+def _coupon_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sync_shards(instance)
+
+
+def has_ordered(customer_code):
+    return Cart.objects.filter(ccode=customer_code).exclude(delivery_status='CART').exists()
+
+
+def validate(code, customer_code):
+    """The active coupon for code if customer_code may use it today; raises CouponError otherwise."""
+    coupon = coupon_index.get(code)
+    if coupon is None:
+        raise CouponError(f'Coupon "{code}" is not valid.')
+    return check_eligibility(coupon, customer_code)
+
+
+def check_eligibility(coupon, customer_code):
+    """Returns coupon (from the index) if customer_code may use it today; raises CouponError otherwise."""
+    today = now().date()
+    if coupon.promo_start and today < coupon.promo_start:
+        raise CouponError(f'Coupon "{coupon.name}" is valid from {coupon.promo_start}.')
+    if coupon.promo_end and today > coupon.promo_end:
+        raise CouponError(f'Coupon "{coupon.name}" has expired.')
+    if coupon.type == Coupon.TYPE_NEW and has_ordered(customer_code):
+        raise CouponError(f'Coupon "{coupon.name}" is only for your first order.')
+    if coupon.type == Coupon.TYPE_EXISTING and not has_ordered(customer_code):
+        raise CouponError(f'Coupon "{coupon.name}" is for returning customers.')
+    return coupon
+
+
+def discount_for(subtotal, coupon):
+    """The discount coupon gives on subtotal, to the paisa."""
+    return (subtotal * coupon.discount_pct / Decimal('100')).quantize(Decimal('0.01'))
+
+
+def _write_discount(cart_id, coupon):
+    """One UPDATE of an open cart: coupon and discount = line subtotal x discount_pct."""
+    money = DecimalField(max_digits=12, decimal_places=2)
+    if coupon is None:
+        discount = Value(Decimal('0'), output_field=money)
+    else:
+        subtotal = Coalesce(
+            Subquery(
+                OnlineOrderItem.objects.filter(cart=OuterRef('pk'))
+                .order_by().values('cart').annotate(total=Sum('amt')).values('total'),
+                output_field=money,
+            ),
+            Value(Decimal('0'), output_field=money),
+        )
+        discount = Round(subtotal * Value(coupon.discount_pct) / Value(Decimal('100')), 2, output_field=money)
+    return Cart.objects.filter(pk=cart_id, delivery_status='CART').update(
+        coupon=coupon, discount=discount,
+    )
+
+
+def apply_to_cart(cart, code, customer_code):
+    """Validate code for the customer and apply it to the open cart. Returns the Coupon."""
+    coupon = validate(code, customer_code)
+    check_limits(coupon, customer_code)
+    if not _write_discount(cart.pk, coupon):
+        raise CouponError('Coupons can only be applied to an open cart.')
+    return coupon
+
+
+def remove_from_cart(cart):
+    return _write_discount(cart.pk, None)
+
+
+def refresh_cart_discount(cart):
+    """After a line change: recompute the discount of cart's coupon (dropping it if it was withdrawn)."""
+    if cart.coupon_id is None:
+        return
+    coupon = coupon_index.get_by_id(cart.coupon_id)
+    if coupon is None:
+        logger.info('Cart %s: coupon %s no longer active; removed.', cart.order_no, cart.coupon_id)
+    _write_discount(cart.pk, coupon)
+
+
+# ---- Redemption counting and limits ----
+
+def _shard_count():
+    return max(1, getattr(settings, 'COUPON_COUNTER_SHARDS', 16))
+
+
+def sync_shards(coupon):
+    """
+    Create coupon's counter stripes and spread what is left of max_redemptions over their
+    capacities. Runs when a coupon is saved; the stripes are locked while they are rebalanced.
+    """
+    with transaction.atomic():
+        CouponUsageShard.objects.bulk_create(
+            [CouponUsageShard(coupon_id=coupon.pk, shard=shard) for shard in range(_shard_count())],
+            ignore_conflicts=True,
+        )
+        shards = list(CouponUsageShard.objects.select_for_update().filter(coupon_id=coupon.pk).order_by('shard'))
+        if coupon.max_redemptions is None:
+            for shard in shards:
+                shard.capacity = None
+        else:
+            left = max(coupon.max_redemptions - sum(shard.used for shard in shards), 0)
+            share, extra = divmod(left, len(shards))
+            for position, shard in enumerate(shards):
+                shard.capacity = shard.used + share + (1 if position < extra else 0)
+        CouponUsageShard.objects.bulk_update(shards, ['capacity'])
+
+
+def redemption_count(coupon_id):
+    return CouponUsageShard.objects.filter(coupon_id=coupon_id).aggregate(total=Sum('used'))['total'] or 0
+
+
+def _per_customer_error(coupon):
+    if coupon.max_per_customer == 1:
+        return CouponError(f'You have already used coupon "{coupon.name}".')
+    return CouponError(f'Coupon "{coupon.name}" can be used {coupon.max_per_customer} times per customer.')
+
+
+def check_limits(coupon, customer_code):
+    """Read-only limit check for apply time (redeem() is what enforces them, at confirm)."""
+    if coupon.max_per_customer is not None:
+        used = CouponRedemption.objects.filter(
+            coupon_id=coupon.pk, customer_code=customer_code
+        ).values_list('count', flat=True).first() or 0
+        if used >= coupon.max_per_customer:
+            raise _per_customer_error(coupon)
+    if coupon.max_redemptions is not None and redemption_count(coupon.pk) >= coupon.max_redemptions:
+        raise CouponError(f'Coupon "{coupon.name}" has been fully redeemed.')
+
+
+def _count_for_customer(coupon, customer_code):
+    rows = CouponRedemption.objects.filter(coupon_id=coupon.pk, customer_code=customer_code)
+    if coupon.max_per_customer is not None:
+        rows = rows.filter(count__lt=coupon.max_per_customer)
+    if rows.update(count=F('count') + 1, last_redeemed_at=now()):
+        return
+    if coupon.max_per_customer != 0:
+        # First use by this customer, unless their row exists and is at the limit.
+        try:
+            with transaction.atomic():
+                CouponRedemption.objects.create(
+                    coupon_id=coupon.pk, customer_code=customer_code, count=1, last_redeemed_at=now(),
+                )
+            return
+        except IntegrityError:
+            # Another confirm created the row first; count against it.
+            if rows.update(count=F('count') + 1, last_redeemed_at=now()):
+                return
+    raise _per_customer_error(coupon)
+
+
+def _count_total(coupon):
+    stripes = CouponUsageShard.objects.filter(coupon_id=coupon.pk).filter(
+        Q(capacity__isnull=True) | Q(used__lt=F('capacity'))
+    )
+    if stripes.filter(shard=random.randrange(_shard_count())).update(used=F('used') + 1):
+        return
+    # That stripe is full (or missing): try the ones that still have room.
+    open_shards = list(stripes.values_list('shard', flat=True))
+    random.shuffle(open_shards)
+    for shard in open_shards:
+        if stripes.filter(shard=shard).update(used=F('used') + 1):
+            return
+    if not CouponUsageShard.objects.filter(coupon_id=coupon.pk).exists():
+        # Coupon created before counting existed, or by a bulk insert without signals.
+        sync_shards(coupon)
+        return _count_total(coupon)
+    raise CouponError(f'Coupon "{coupon.name}" has been fully redeemed.')
+
+
+def redeem(coupon, customer_code):
+    """
+    Count one confirmed order with coupon for customer_code. Raises CouponError, with nothing
+    counted, if either limit is reached. Call inside the order's transaction.
+    """
+    with transaction.atomic():
+        _count_for_customer(coupon, customer_code)
+        _count_total(coupon)
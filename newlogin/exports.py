@@ -0,0 +1,323 @@
+"""
+Streaming CSV / XLSX exports for orders, purchase orders and the medical item catalog.
+
+Rows are read in keyset-paginated batches of EXPORT_CHUNK_SIZE (keyset_rows(): each batch is
+`WHERE id < <last id read> ... LIMIT EXPORT_CHUNK_SIZE`) and go out in ~64 KB pieces through a
+StreamingHttpResponse, so memory stays flat however many rows are exported. QuerySet.iterator()
+is not used: on MySQL, mysqlclient buffers the whole result set client-side before the first row
+is returned, whatever chunk_size is. XLSX is written with the standard library's zipfile in streaming mode (inline
+strings, no shared-strings table), so no spreadsheet package is needed.
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime, time
+from decimal import Decimal
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.http import StreamingHttpResponse
+
+from .models import Cart, MedicalItem, PurchaseOrder, StockBalance, UserProfile
+
+CHUNK_BYTES = 64 * 1024
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+# ---- Datasets: (header, rows) for each export ----
+
+def keyset_rows(qs, fields, keys):
+    """
+    Rows of qs.values_list(*fields) in `keys` order ('-' for descending), read EXPORT_CHUNK_SIZE
+    at a time. Each batch starts after the previous batch's last row, so no query skips over
+    rows already read (as OFFSET would). keys must identify a row; a NULL key (an order without
+    lines, which has one row) ends the comparison at the keys before it.
+    """
+    # Pin the read alias now: ReplicaRoutingMiddleware resets it when the view returns, before
+    # the body (and so the query) is consumed.
+    return _keyset_batches(qs.using(qs.db), fields, keys, _chunk_size())
+
+
+def _after(keys, cursor):
+    """
+    Rows after cursor, the last row's key values: (k1 after v1) OR (k1 = v1 AND k2 after v2) ...
+    ANDed with k1 at or after v1, the range the index scan on k1 starts from.
+    """
+    condition, equal = Q(), Q()
+    for key, value in zip(keys, cursor):
+        if value is None:
+            break
+        name = key.lstrip('-')
+        condition |= equal & Q(**{f"{name}__{'lt' if key.startswith('-') else 'gt'}": value})
+        equal &= Q(**{name: value})
+    first = keys[0]
+    return Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": cursor[0]}) & condition
+
+
+def _keyset_batches(qs, fields, keys, chunk_size):
+    names = [key.lstrip('-') for key in keys]
+    cursor = None
+    while True:
+        # Filter before values_list(): the key columns then reuse the join that the filter added.
+        page = qs if cursor is None else qs.filter(_after(keys, cursor))
+        batch = list(page.order_by(*keys).values_list(*fields, *names)[:chunk_size])
+        for row in batch:
+            yield row[:len(fields)]
+        if len(batch) < chunk_size:
+            return
+        cursor = batch[-1][len(fields):]
+
+
+def order_rows(start=None, end=None, status=None):
+    """Confirmed orders, one row per order line (orders without lines get one row)."""
+    columns = [
+        ('order_no', 'order_no'),
+        ('invoice_no', 'inv_no'),
+        ('date', 'date'),
+        ('time', 'time'),
+        ('customer_code', 'ccode'),
+        ('customer_name', 'customer_name'),
+        ('status', 'delivery_status'),
+        ('payment_mode', 'payment_mode'),
+        ('total_amount', 'total_amount'),
+        ('discount', 'discount'),
+        ('courier_amount', 'courier_amount'),
+        ('net_amount', 'net_amount'),
+        ('mcode', 'items__item_code'),
+        ('qty', 'items__qty'),
+        ('rate', 'items__rate'),
+        ('amount', 'items__amt'),
+    ]
+    qs = Cart.objects.exclude(delivery_status='CART').exclude(order_no='')
+    if start:
+        qs = qs.filter(date__gte=start)
+    if end:
+        qs = qs.filter(date__lte=end)
+    if status:
+        qs = qs.filter(delivery_status__iexact=status)
+    qs = qs.annotate(
+        customer_name=Subquery(UserProfile.objects.filter(customer_code=OuterRef('ccode')).values('name')[:1])
+    )
+    return [name for name, _ in columns], keyset_rows(qs, [field for _, field in columns], ('-id', 'items__id'))
+
+
+def purchase_order_rows(start=None, end=None, status=None, supplier=None):
+    """Purchase orders, one row per line (orders without lines get one row)."""
+    columns = [
+        ('purchase_order_no', 'purchase_order_no'),
+        ('date', 'date'),
+        ('supplier_code', 'supplier__supplier_code'),
+        ('supplier_name', 'supplier__name'),
+        ('status', 'status'),
+        ('outstanding_lines', 'outstanding_lines'),
+        ('remarks', 'remarks'),
+        ('item_code', 'items__item_code'),
+        ('sku_code', 'items__sku_code'),
+        ('sku_name', 'items__sku_name'),
+        ('item_type', 'items__item_type'),
+        ('unit', 'items__unit'),
+        ('full_quantity', 'items__full_quantity'),
+        ('actual_quantity', 'items__actual_quantity'),
+    ]
+    qs = PurchaseOrder.objects.all()
+    if start:
+        qs = qs.filter(date__gte=start)
+    if end:
+        qs = qs.filter(date__lte=end)
+    if status:
+        qs = qs.filter(status=status)
+    if supplier:
+        qs = qs.filter(supplier__supplier_code=supplier)
+    return [name for name, _ in columns], keyset_rows(qs, [field for _, field in columns], ('-id', 'items__id'))
+
+
+def medical_item_rows(category=None):
+    """The medical item catalog with on-hand stock."""
+    columns = [
+        ('mcode', 'mcode'),
+        ('sku_code', 'sku_code'),
+        ('sku_name', 'sku_name'),
+        ('unit', 'unit'),
+        ('catcode', 'category__catcode'),
+        ('category', 'category__name'),
+        ('package_count', 'package_count'),
+        ('reorder_level', 'reorder_level'),
+        ('on_hand', 'on_hand'),
+        ('mrp', 'mrp'),
+        ('sell_discount', 'sell_discount'),
+        ('basic_prize', 'basic_prize'),
+        ('gst', 'gst'),
+        ('hsn_code', 'hsn_code'),
+        ('storage_location1', 'storage_location1'),
+        ('storage_location2', 'storage_location2'),
+        ('updated_at', 'updated_at'),
+    ]
+    on_hand = (
+        StockBalance.objects.filter(item=OuterRef('pk'))
+        .order_by().values('item').annotate(total=Sum('on_hand')).values('total')
+    )
+    qs = MedicalItem.objects.annotate(on_hand=Subquery(on_hand))
+    if category:
+        qs = qs.filter(category__catcode=category)
+    return [name for name, _ in columns], keyset_rows(qs, [field for _, field in columns], ('id',))
+
+
+# ---- Encoders ----
+
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_value(value):
+    if isinstance(value, str):
+        # Spreadsheet apps run cells starting with these as formulas (CSV injection).
+        return "'" + value if value.startswith(_FORMULA_PREFIXES) else value
+    if isinstance(value, datetime):
+        return value.isoformat(timespec='seconds')
+    return value
+
+
+def csv_chunks(header, rows):
+    """UTF-8 CSV (with BOM, so Excel reads it as UTF-8) in ~CHUNK_BYTES pieces."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('﻿')
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{sheet}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        value = value.isoformat(timespec='seconds')
+    elif isinstance(value, (date, time)):
+        value = value.isoformat()
+    text = escape(_XML_INVALID.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+class _DrainBuffer:
+    """Write-only, unseekable file for zipfile; the generator drains what was written."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def xlsx_chunks(header, rows, sheet='Export'):
+    """A one-sheet .xlsx workbook, written and yielded as it is zipped."""
+    out = _DrainBuffer()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_PARTS.items():
+            workbook.writestr(name, content.format(sheet=escape(sheet)))
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet_xml:
+            pending, size = [_SHEET_HEAD], 0
+            for row in chain([header], rows):
+                xml = '<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>'
+                pending.append(xml)
+                size += len(xml)
+                if size >= CHUNK_BYTES:
+                    sheet_xml.write(''.join(pending).encode('utf-8'))
+                    pending, size = [], 0
+                    chunk = out.drain()
+                    if chunk:
+                        yield chunk
+            pending.append(_SHEET_TAIL)
+            sheet_xml.write(''.join(pending).encode('utf-8'))
+    yield out.drain()
+
+
+async def _async_chunks(chunks):
+    # Under ASGI Django buffers a sync iterator completely before sending it. Pull one chunk
+    # at a time on the request's sync thread instead, where the queryset's connection lives.
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def streaming_response(request, filename, header, rows, file_format):
+    """StreamingHttpResponse downloading rows (from keyset_rows()) as CSV or XLSX."""
+    if file_format == 'xlsx':
+        chunks = xlsx_chunks(header, rows, sheet=filename)
+    else:
+        chunks = csv_chunks(header, rows)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = _async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    response['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,30 @@
+"""
+Password hashers whose cost comes from settings (see PASSWORD_HASHER in login/settings.py).
+
+Django rehashes a password transparently on the next successful login whenever the stored
+hash was made with a different algorithm or cost than the first entry in PASSWORD_HASHERS
+(BasePasswordHasher.must_update), so changing these settings migrates users gradually.
+Use `manage.py bench_password_hashing` to pick a cost for the hardware.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+)
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with iterations from PASSWORD_PBKDF2_ITERATIONS (Django's default if unset)."""
+    iterations = getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', None) or PBKDF2PasswordHasher.iterations
+
+
+class TunableScryptPasswordHasher(ScryptPasswordHasher):
+    """scrypt with N from PASSWORD_SCRYPT_WORK_FACTOR (must be a power of 2)."""
+    work_factor = getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', None) or ScryptPasswordHasher.work_factor
+
+
+class TunableArgon2PasswordHasher(Argon2PasswordHasher):
+    """argon2id with PASSWORD_ARGON2_TIME_COST / PASSWORD_ARGON2_MEMORY_COST (KiB). Needs argon2-cffi."""
+    time_cost = getattr(settings, 'PASSWORD_ARGON2_TIME_COST', None) or Argon2PasswordHasher.time_cost
+    memory_cost = getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST', None) or Argon2PasswordHasher.memory_cost
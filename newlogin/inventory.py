@@ -0,0 +1,167 @@
+"""
+Stock ledger and on-hand balances for MedicalItem.
+
+Every stock change is appended to StockMovement (receipts from goods receipts, sales from
+confirmed orders, manual adjustments) and applied to the StockBalance row for the same item
+and location in the same transaction. Availability checks read the item's balance rows
+through the (item, location) unique index and never sum the ledger.
+
+Stock levels are only enforced with INVENTORY_ENFORCE_STOCK. With it off, sales are still
+recorded and balances may go negative, so tracking can start before opening stock is loaded.
+"""
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils.timezone import now
+
+from .models import MedicalItem, StockBalance, StockMovement
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    """A sale or adjustment would take items below zero. `shortages` maps mcode -> (wanted, on hand)."""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(', '.join(
+            f'"{mcode}": {wanted} wanted, {available} in stock'
+            for mcode, (wanted, available) in shortages.items()
+        ))
+
+
+def enforcing():
+    return getattr(settings, 'INVENTORY_ENFORCE_STOCK', False)
+
+
+def on_hand(item_id):
+    """Total on-hand quantity of one item across its locations."""
+    return StockBalance.objects.filter(item_id=item_id).aggregate(total=Sum('on_hand'))['total'] or 0
+
+
+def record_movements(movements):
+    """
+    Append unsaved StockMovement objects to the ledger and add them to the balances: one insert
+    for missing balance rows, one UPDATE per 500 balances and one bulk insert of the movements.
+    """
+    if not movements:
+        return []
+    deltas = defaultdict(int)
+    for movement in movements:
+        deltas[(movement.item_id, movement.location)] += movement.quantity
+    with transaction.atomic():
+        StockBalance.objects.bulk_create(
+            [StockBalance(item_id=item_id, location=location) for item_id, location in deltas],
+            ignore_conflicts=True,
+        )
+        balance_deltas = {
+            pk: deltas[(item_id, location)]
+            for pk, item_id, location in StockBalance.objects.filter(
+                item_id__in={item_id for item_id, _ in deltas}
+            ).values_list('id', 'item_id', 'location')
+            if (item_id, location) in deltas
+        }
+        pks = list(balance_deltas)
+        for start in range(0, len(pks), 500):
+            batch = pks[start:start + 500]
+            StockBalance.objects.filter(id__in=batch).update(
+                on_hand=F('on_hand') + Case(
+                    *[When(id=pk, then=Value(balance_deltas[pk])) for pk in batch],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ),
+                updated_at=now(),
+            )
+        StockMovement.objects.bulk_create(movements, batch_size=500)
+    return movements
+
+
+def _items_by_mcode(mcodes):
+    return {
+        item.mcode: item
+        for item in MedicalItem.objects.filter(mcode__in=mcodes).only('id', 'mcode', 'storage_location1')
+    }
+
+
+def record_receipt(quantities, reference):
+    """
+    Book received stock, {mcode: quantity}, into each item's storage_location1. Codes that are
+    not in the medical item master (PO lines for other item tables) are skipped.
+    """
+    items = _items_by_mcode(quantities)
+    skipped = set(quantities) - set(items)
+    if skipped:
+        logger.debug('Receipt %s: no medical item for %s; not stocked.', reference, sorted(skipped))
+    return record_movements([
+        StockMovement(
+            item_id=item.id,
+            location=item.storage_location1 or '',
+            quantity=quantities[mcode],
+            kind=StockMovement.KIND_RECEIPT,
+            reference=reference,
+        )
+        for mcode, item in items.items()
+    ])
+
+
+def record_sale(quantities, reference):
+    """
+    Take a confirmed order's quantities, {mcode: quantity}, out of stock, from the locations
+    holding the most first. The items' balance rows are locked for the rest of the caller's
+    transaction. When enforcing, raises InsufficientStock (and writes nothing) if any item is
+    short; otherwise the shortfall is taken from the item's main location, leaving it negative.
+    """
+    items = _items_by_mcode(quantities)
+    with transaction.atomic():
+        balances = defaultdict(list)
+        for balance in StockBalance.objects.select_for_update().filter(
+            item_id__in=[item.id for item in items.values()]
+        ).order_by('item_id', '-on_hand', 'location'):
+            balances[balance.item_id].append(balance)
+
+        if enforcing():
+            shortages = {}
+            for mcode, wanted in quantities.items():
+                item = items.get(mcode)
+                available = sum(max(b.on_hand, 0) for b in balances[item.id]) if item else 0
+                if available < wanted:
+                    shortages[mcode] = (wanted, available)
+            if shortages:
+                raise InsufficientStock(shortages)
+
+        movements = []
+        for mcode, item in items.items():
+            remaining = quantities[mcode]
+            for balance in balances[item.id]:
+                take = min(remaining, max(balance.on_hand, 0))
+                if take:
+                    movements.append(StockMovement(
+                        item_id=item.id, location=balance.location, quantity=-take,
+                        kind=StockMovement.KIND_SALE, reference=reference,
+                    ))
+                    remaining -= take
+            if remaining:
+                movements.append(StockMovement(
+                    item_id=item.id, location=item.storage_location1 or '', quantity=-remaining,
+                    kind=StockMovement.KIND_SALE, reference=reference,
+                ))
+        return record_movements(movements)
+
+
+def record_adjustment(item, quantity, location=None, reason=''):
+    """Manual correction (stock count, damage, opening stock) of one item at one location."""
+    location = (item.storage_location1 or '') if location is None else location
+    with transaction.atomic():
+        if quantity < 0 and enforcing():
+            current = StockBalance.objects.select_for_update().filter(
+                item_id=item.id, location=location
+            ).values_list('on_hand', flat=True).first() or 0
+            if current + quantity < 0:
+                raise InsufficientStock({item.mcode: (-quantity, current)})
+        return record_movements([StockMovement(
+            item_id=item.id, location=location, quantity=quantity,
+            kind=StockMovement.KIND_ADJUSTMENT, reference=reason,
+        )])[0]
@@ -0,0 +1,344 @@
+"""
+Invoice PDFs for confirmed orders.
+
+render_invoice() renders one order's invoice with reportlab and stores it in the 'invoices'
+storage (settings.STORAGES) under its SHA-256, as <2 hex digits>/<sha256>.pdf. InvoiceDocument
+links the order to the file. reportlab runs in invariant mode, so the same order data always
+renders to the same bytes: a re-render that changes nothing reuses the stored file and keeps
+the ETag that clients have cached.
+- render_invoice_in_background() queues the render on the background pool (newlogin/background.py)
+  once order confirmation commits.
+- render_many() re-renders many orders on a process pool (render_invoices command). The parent
+  process reads the orders and writes files and rows; the worker processes only build PDFs.
+Bump TEMPLATE_VERSION when the layout changes, then run `render_invoices --stale`.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from xml.sax.saxutils import escape
+
+import django
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import connections, router
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.timezone import now
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .background import run_in_background
+from .models import Cart, Company, InvoiceDocument, MedicalItem, UserProfile
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_VERSION = 1
+
+
+def _storage():
+    return storages['invoices']
+
+
+# ---- Order data: plain dicts, so they can be sent to worker processes ----
+
+def invoice_data(carts):
+    """Everything render_pdf() needs for each confirmed cart (items prefetched), in four queries."""
+    carts = list(carts)
+    mcodes = {line.item_code for cart in carts for line in cart.items.all()}
+    items = {
+        mcode: (name, hsn_code, unit)
+        for mcode, name, hsn_code, unit in MedicalItem.objects.filter(mcode__in=mcodes)
+        .values_list('mcode', 'sku_name', 'hsn_code', 'unit')
+    }
+    profiles = {
+        profile.customer_code: profile
+        for profile in UserProfile.objects.select_related('address').filter(
+            customer_code__in={cart.ccode for cart in carts if cart.ccode}
+        )
+    }
+    company = Company.objects.order_by('id').first()
+    seller = {'name': '', 'address': [], 'gst': ''}
+    if company:
+        seller = {
+            'name': company.company_name,
+            'address': [company.address, f'{company.post}, {company.dist}', f'{company.state} - {company.pin}'],
+            'gst': company.gst,
+        }
+
+    rows = []
+    for cart in carts:
+        profile = profiles.get(cart.ccode)
+        customer = {'name': '', 'phone': '', 'address': []}
+        if profile:
+            customer['name'] = profile.name or ''
+            customer['phone'] = profile.phone or ''
+            address = getattr(profile, 'address', None)
+            if address:
+                customer['address'] = [
+                    address.address, f'{address.post}, {address.district}', f'{address.state} - {address.pin}',
+                ]
+        lines = []
+        subtotal = 0
+        for number, line in enumerate(cart.items.all(), start=1):
+            name, hsn_code, unit = items.get(line.item_code, (line.item_code, '', ''))
+            lines.append((number, line.item_code, name, hsn_code or '', unit or '', line.qty, line.rate, line.amt))
+            subtotal += line.amt
+        rows.append({
+            'cart_id': cart.pk,
+            'order_no': cart.order_no,
+            'inv_no': cart.inv_no or '',
+            'date': cart.date.strftime('%d-%m-%Y') if cart.date else '',
+            'payment_mode': cart.payment_mode or '',
+            'seller': seller,
+            'customer': customer,
+            'lines': lines,
+            'subtotal': subtotal,
+            'discount': cart.discount,
+            'courier_amount': cart.courier_amount,
+            'net_amount': cart.net_amount,
+        })
+    return rows
+
+
+# ---- Rendering (no database access; runs in worker processes) ----
+
+def _paragraph_lines(lines, style):
+    return Paragraph('<br/>'.join(escape(str(line)) for line in lines if line), style)
+
+
+def render_pdf(data):
+    """Invoice PDF bytes for one invoice_data() row. Deterministic for the same data."""
+    styles = getSampleStyleSheet()
+    normal, small = styles['Normal'], styles['BodyText']
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer, pagesize=A4, invariant=1,
+        leftMargin=15 * mm, rightMargin=15 * mm, topMargin=15 * mm, bottomMargin=15 * mm,
+        title=f"Invoice {data['inv_no']}", author=data['seller']['name'],
+    )
+    seller, customer = data['seller'], data['customer']
+    story = [
+        Paragraph(escape(seller['name'] or 'Tax Invoice'), styles['Title']),
+        _paragraph_lines(seller['address'] + ([f"GSTIN: {seller['gst']}"] if seller['gst'] else []), small),
+        Spacer(0, 6 * mm),
+        Table(
+            [[
+                Paragraph('<b>Bill to</b>', normal),
+                _paragraph_lines([
+                    f"Invoice no: {data['inv_no']}",
+                    f"Order no: {data['order_no']}",
+                    f"Date: {data['date']}",
+                    f"Payment: {data['payment_mode']}",
+                ], normal),
+            ], [
+                _paragraph_lines([customer['name'], *customer['address'], customer['phone']], normal),
+                '',
+            ]],
+            colWidths=[100 * mm, 80 * mm],
+        ),
+        Spacer(0, 6 * mm),
+    ]
+
+    header = ['#', 'Item', 'HSN', 'Qty', 'Rate', 'Amount']
+    body = [
+        [number, _paragraph_lines([name, mcode], small), hsn_code, f'{qty} {unit}'.strip(), f'{rate:.2f}', f'{amt:.2f}']
+        for number, mcode, name, hsn_code, unit, qty, rate, amt in data['lines']
+    ]
+    totals = [
+        ['', '', '', '', 'Subtotal', f"{data['subtotal']:.2f}"],
+        ['', '', '', '', 'Discount', f"-{data['discount']:.2f}"],
+        ['', '', '', '', 'Courier', f"{data['courier_amount']:.2f}"],
+        ['', '', '', '', 'Net amount', f"{data['net_amount']:.2f}"],
+    ]
+    table = Table(
+        [header] + body + totals,
+        colWidths=[10 * mm, 80 * mm, 22 * mm, 22 * mm, 22 * mm, 24 * mm],
+        repeatRows=1,
+    )
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('GRID', (0, 0), (-1, len(body)), 0.25, colors.grey),
+        ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('FONTNAME', (4, -1), (-1, -1), 'Helvetica-Bold'),
+        ('LINEABOVE', (4, -1), (-1, -1), 0.5, colors.black),
+    ]))
+    story.append(table)
+    doc.build(story)
+    return buffer.getvalue()
+
+
+# ---- Storage ----
+
+def _store(pdf):
+    """Save pdf under its SHA-256 unless that file already exists; returns the hash."""
+    sha256 = hashlib.sha256(pdf).hexdigest()
+    name = f'{sha256[:2]}/{sha256}.pdf'
+    storage = _storage()
+    if not storage.exists(name):
+        saved = storage.save(name, ContentFile(pdf))
+        if saved != name:
+            # Another worker stored the same bytes first; keep theirs.
+            storage.delete(saved)
+    return sha256
+
+
+def _save_documents(rendered):
+    """Store [(cart_id, pdf bytes)] and upsert their InvoiceDocument rows in one query."""
+    rendered_at = now()
+    documents = [
+        InvoiceDocument(
+            cart_id=cart_id, sha256=_store(pdf), size=len(pdf),
+            template_version=TEMPLATE_VERSION, rendered_at=rendered_at,
+        )
+        for cart_id, pdf in rendered
+    ]
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target (and raises NotSupportedError
+    # if given one); cart is the only unique column besides the primary key, so it is implied.
+    connection = connections[router.db_for_write(InvoiceDocument)]
+    unique_fields = ['cart'] if connection.features.supports_update_conflicts_with_target else None
+    InvoiceDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=['sha256', 'size', 'template_version', 'rendered_at'],
+    )
+    return documents
+
+
+def open_document(document):
+    """The stored PDF of an InvoiceDocument, opened for binary reading."""
+    return _storage().open(document.storage_name, 'rb')
+
+
+def is_stored(document):
+    return _storage().exists(document.storage_name)
+
+
+# ---- Serving ----
+
+_BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _requested_range(request, etag, size):
+    """
+    The single byte range asked for, as inclusive (start, end); None to send the whole file
+    (no Range, a stale If-Range, or several ranges); False if the range is unsatisfiable.
+    """
+    header = request.META.get('HTTP_RANGE', '').strip()
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        return None
+    match = _BYTE_RANGE.match(header)
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        suffix = int(last)
+        return (max(size - suffix, 0), size - 1) if suffix else False
+    start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    return (start, end) if start < size else False
+
+
+def pdf_response(request, document, filename):
+    """
+    Response for a stored invoice: 304 when If-None-Match has the current ETag (the PDF's
+    SHA-256), 206 for a single byte range, otherwise the whole PDF. Invoices are small, so
+    the file is read into memory rather than streamed.
+    """
+    etag = f'"{document.sha256}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        byte_range = _requested_range(request, etag, document.size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{document.size}'
+        else:
+            with open_document(document) as pdf:
+                content = pdf.read()
+            if byte_range:
+                start, end = byte_range
+                response = HttpResponse(content[start:end + 1], status=206, content_type='application/pdf')
+                response['Content-Range'] = f'bytes {start}-{end}/{len(content)}'
+            else:
+                response = HttpResponse(content, content_type='application/pdf')
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    # Re-renders change the file, so clients revalidate; unchanged invoices answer 304.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# ---- Entry points ----
+
+def render_invoice(cart_id):
+    """Render and store the invoice of one confirmed order. Returns its InvoiceDocument, or None."""
+    cart = (
+        Cart.objects.prefetch_related('items')
+        .exclude(delivery_status='CART').filter(pk=cart_id).first()
+    )
+    if cart is None:
+        return None
+    data = invoice_data([cart])[0]
+    return _save_documents([(cart.pk, render_pdf(data))])[0]
+
+
+def render_invoice_in_background(cart):
+    """Render cart's invoice on the background pool after the current transaction commits."""
+    run_in_background(render_invoice, cart.pk)
+
+
+def render_many(cart_ids, workers=None, batch_size=200, log=None):
+    """
+    Render the invoices of cart_ids with `workers` processes (default: one per CPU), batch_size
+    orders per batch. Returns the number of invoices rendered.
+    """
+    cart_ids = list(cart_ids)
+    workers = workers or os.cpu_count() or 1
+    rendered = 0
+    # Forked workers must not share the parent's database connections.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        for start in range(0, len(cart_ids), batch_size):
+            carts = Cart.objects.prefetch_related('items').filter(pk__in=cart_ids[start:start + batch_size])
+            batch = invoice_data(carts)
+            pdfs = pool.map(render_pdf, batch, chunksize=max(1, len(batch) // (4 * workers)))
+            rendered += len(_save_documents(zip([row['cart_id'] for row in batch], pdfs)))
+            if log:
+                log(f'  {rendered}/{len(cart_ids)}')
+    logger.info('Rendered %s invoices with %s processes', rendered, workers)
+    return rendered
+
+
+def prune_unreferenced(min_age=timedelta(hours=1)):
+    """
+    Delete stored PDFs that no InvoiceDocument points at (left behind by re-renders) and that
+    are older than min_age, so renders still being saved are left alone. Returns the count.
+    """
+    storage = _storage()
+    referenced = set(InvoiceDocument.objects.values_list('sha256', flat=True))
+    cutoff = now() - min_age
+    deleted = 0
+    try:
+        directories, _ = storage.listdir('')
+    except FileNotFoundError:
+        return 0
+    for directory in directories:
+        for name in storage.listdir(directory)[1]:
+            path = f'{directory}/{name}'
+            if name.endswith('.pdf') and name[:-4] not in referenced and storage.get_modified_time(path) < cutoff:
+                storage.delete(path)
+                deleted += 1
+    return deleted
@@ -0,0 +1,274 @@
+"""
+Benchmark the storefront and checkout hot paths against a synthetic dataset.
+Usage: python manage.py bench_hot_paths [--items 10000] [--carts 100000] [--order-lines 1000000]
+                                        [--requests 200] [--seed 1] [--keepdb] [--output bench.json]
+
+Seeds (or tops up) a deterministic synthetic catalog and order history, then times each
+endpoint in-process with the Django test client and reports p50/p99 latency, mean, req/s
+and queries per request. Results can be written as JSON to compare runs across commits.
+
+Everything runs in a throwaway test database (created and migrated like `manage.py test`
+does), never in the configured one. With --keepdb it is kept and the seeded rows are reused
+by the next run (SQLite: <tmp>/bench_hot_paths.sqlite3 unless DATABASES TEST NAME is set);
+what the benchmark itself writes (bench carts, lines, confirmed orders) is always rolled back.
+"""
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import setup_databases, teardown_databases
+from rest_framework.authtoken.models import Token
+
+from newlogin import synthetic
+from newlogin.models import Cart, CustomerAddress, UserProfile
+
+BENCH_USERNAME = 'benchuser'
+
+
+class _Rollback(Exception):
+    pass
+
+
+class _QueryCounter:
+    """execute_wrapper that counts queries (the test client's request_started resets connection.queries)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _bench_user():
+    """Staff user with token, profile and address used for every authenticated request."""
+    User = get_user_model()
+    user, _ = User.objects.get_or_create(
+        username=BENCH_USERNAME,
+        defaults={'email': f'{BENCH_USERNAME}@example.com', 'is_active': True, 'is_staff': True},
+    )
+    profile, _ = UserProfile.objects.get_or_create(user=user, defaults={'name': 'Bench Customer'})
+    address, _ = CustomerAddress.objects.get_or_create(
+        profile=profile,
+        defaults={
+            'prefix': CustomerAddress.PREFIX_MR, 'address': '1 Bench Street', 'post': 'Kottakkal',
+            'district': 'Malappuram', 'state': 'Kerala', 'pin': '676503', 'country': 'India',
+        },
+    )
+    token, _ = Token.objects.get_or_create(user=user)
+    return profile, address, token
+
+
+class Command(BaseCommand):
+    help = "Benchmark catalog, cart, checkout and admin order endpoints on a synthetic dataset"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=10000, help="Synthetic catalog items (default: 10000)")
+        parser.add_argument("--carts", type=int, default=100000, help="Synthetic confirmed orders (default: 100000)")
+        parser.add_argument(
+            "--order-lines", type=int, default=1000000, help="Synthetic order lines (default: 1000000)"
+        )
+        parser.add_argument("--seed", type=int, default=1, help="Random seed for data and request mix (default: 1)")
+        parser.add_argument(
+            "--skip-seed", action="store_true", help="Benchmark the data already in a --keepdb database"
+        )
+        parser.add_argument("--requests", type=int, default=200, help="Timed requests per endpoint (default: 200)")
+        parser.add_argument(
+            "--list-requests",
+            type=int,
+            default=5,
+            help="Timed requests for the unpaginated admin order list (default: 5)",
+        )
+        parser.add_argument("--warmup", type=int, default=10, help="Untimed requests per endpoint (default: 10)")
+        parser.add_argument(
+            "--keepdb", action="store_true", help="Keep the benchmark database (and its seeded data) for the next run"
+        )
+        parser.add_argument("--output", help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        if 'replica' in settings.DATABASES:
+            # Replica-safe views would read the real replica instead of the benchmark database.
+            raise CommandError("Run the benchmark without a read replica configured (unset DB_REPLICA_NAME/HOST).")
+        keepdb = options["keepdb"]
+        test_settings = connection.settings_dict['TEST']
+        if keepdb and connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'bench_hot_paths.sqlite3')
+        old_config = setup_databases(
+            verbosity=0, interactive=False, keepdb=keepdb, aliases={'default'}, serialized_aliases=set(),
+        )
+        try:
+            self._benchmark(options)
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=keepdb)
+
+    def _benchmark(self, options):
+        rng = random.Random(options["seed"])
+        if not options["skip_seed"]:
+            self._seed(options, rng)
+        counts = synthetic.synthetic_counts()
+        mcodes = synthetic.synthetic_mcodes()
+        if not mcodes or not counts['carts']:
+            raise CommandError("No synthetic data found; run with --keepdb and without --skip-seed first.")
+        self.stdout.write(
+            f"Dataset: {counts['items']} items, {counts['carts']} orders, {counts['order_lines']} order lines "
+            f"({connection.vendor})"
+        )
+
+        results = {}
+        try:
+            with transaction.atomic():
+                results = self._run(options, rng, mcodes, counts)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        report = {
+            'commit': _git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'seed': options["seed"],
+            'dataset': counts,
+            'results': results,
+        }
+        if options["output"]:
+            with open(options["output"], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        self.stdout.write(self.style.SUCCESS(
+            "Done (benchmark database kept)." if options["keepdb"] else "Done (benchmark database dropped)."
+        ))
+
+    def _seed(self, options, rng):
+        existing = synthetic.synthetic_counts()
+        missing_items = max(0, options["items"] - existing['items'])
+        missing_carts = max(0, options["carts"] - existing['carts'])
+        missing_lines = max(0, options["order_lines"] - existing['order_lines'])
+        if not (missing_items or missing_carts):
+            return
+        self.stdout.write("Seeding synthetic data...")
+        started = time.perf_counter()
+        profile, _, _ = _bench_user()
+        if missing_items:
+            synthetic.seed_catalog(missing_items, rng, log=self.stdout.write)
+        if missing_carts:
+            synthetic.seed_orders(
+                missing_carts, max(missing_carts, missing_lines), rng, synthetic.synthetic_mcodes(),
+                [profile.customer_code], log=self.stdout.write,
+            )
+        self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    def _run(self, options, rng, mcodes, counts):
+        requests = options["requests"]
+        warmup = options["warmup"]
+        profile, address, token = _bench_user()
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        # Open carts owned by the bench customer: one to add items to, one to summarise, and
+        # one per confirm request. Line counts follow the dataset's average order size.
+        per_cart = max(1, counts['order_lines'] // max(1, counts['carts']))
+        open_carts = 2 + warmup + requests + 1
+        order_nos = synthetic.seed_orders(
+            open_carts, open_carts * per_cart, rng, mcodes, [profile.customer_code], status='CART', days=1,
+        )
+        add_cart, summary_cart, confirm_carts = order_nos[0], order_nos[1], iter(order_nos[2:])
+        confirmed = list(
+            Cart.objects.filter(order_no__startswith=synthetic.PREFIX)
+            .exclude(delivery_status='CART').values_list('order_no', flat=True)[:1000]
+        )
+
+        def add_item():
+            return client.post(
+                '/api/cart/item/add/',
+                {'order_no': add_cart, 'mcode': rng.choice(mcodes), 'qty': rng.randint(1, 5)},
+                content_type='application/json',
+            )
+
+        def confirm():
+            return client.post(
+                '/api/orders/confirm/',
+                {'order_no': next(confirm_carts), 'address_id': address.id, 'payment_mode': 'COD'},
+                content_type='application/json',
+            )
+
+        # (name, route, warmup, timed requests, call). The admin list is unpaginated and slow
+        # at scale, so it gets a single warmup call and its own request count.
+        cases = [
+            ('catalog list', 'GET /api/medicalitems/', warmup, requests, lambda: client.get('/api/medicalitems/')),
+            ('add to cart', 'POST /api/cart/item/add/', warmup, requests, add_item),
+            (
+                'cart summary', 'GET /api/cart/summary/', warmup, requests,
+                lambda: client.get('/api/cart/summary/', {'order_no': summary_cart}),
+            ),
+            ('order confirm', 'POST /api/orders/confirm/', warmup, requests, confirm),
+            (
+                'admin order list', 'GET /api/admin/orders/', 1, options["list_requests"],
+                lambda: client.get('/api/admin/orders/'),
+            ),
+            (
+                'admin order detail', 'GET /api/admin/orders/<order_no>/', warmup, requests,
+                lambda: client.get(f'/api/admin/orders/{rng.choice(confirmed)}/'),
+            ),
+        ]
+
+        self.stdout.write(f"{'endpoint':<20} {'reqs':>5} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'req/s':>8} {'queries':>8}")
+        results = {}
+        for name, route, warmup_calls, count, call in cases:
+            for _ in range(warmup_calls):
+                call()
+            queries = _QueryCounter()
+            with connection.execute_wrapper(queries):
+                probe = call()
+            statuses = {probe.status_code: 1}
+            timings = []
+            for _ in range(count):
+                started = time.perf_counter()
+                response = call()
+                timings.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            timings.sort()
+            total = sum(timings)
+            results[name] = {
+                'route': route,
+                'requests': count,
+                'p50_ms': round(_percentile(timings, 50) * 1000, 3),
+                'p99_ms': round(_percentile(timings, 99) * 1000, 3),
+                'mean_ms': round(total / count * 1000, 3) if count else 0.0,
+                'req_per_s': round(count / total, 1) if total else 0.0,
+                'queries': queries.count,
+                'status_codes': {str(k): v for k, v in sorted(statuses.items())},
+            }
+            r = results[name]
+            line = (
+                f"{name:<20} {count:>5} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['mean_ms']:>9.2f} "
+                f"{r['req_per_s']:>8.1f} {r['queries']:>8}"
+            )
+            ok = all(200 <= int(code) < 300 for code in r['status_codes'])
+            self.stdout.write(line if ok else self.style.WARNING(f"{line}  status={r['status_codes']}"))
+        return results
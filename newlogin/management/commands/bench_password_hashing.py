@@ -0,0 +1,87 @@
+"""
+Measure password verification (one login) cost per hasher setting, to size PASSWORD_HASHER costs.
+Usage: python manage.py bench_password_hashing [--rounds 5] [--pbkdf2 100000 600000 1000000]
+                                               [--scrypt 16384 32768] [--argon2 1 2 3]
+Runs in a single thread, so logins/s is per core; multiply by worker cores for a box estimate.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+)
+from django.core.management.base import BaseCommand
+
+PASSWORD = "Bench-Passw0rd!"
+
+
+class Command(BaseCommand):
+    help = "Benchmark logins/second per core for PBKDF2, scrypt and argon2 at several cost settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rounds", type=int, default=5, help="Verifications per setting (default: 5)")
+        parser.add_argument(
+            "--pbkdf2",
+            type=int,
+            nargs="*",
+            default=[100_000, 260_000, 600_000, PBKDF2PasswordHasher.iterations],
+            help="PBKDF2 iteration counts to test",
+        )
+        parser.add_argument(
+            "--scrypt",
+            type=int,
+            nargs="*",
+            default=[2**13, 2**14, 2**15],
+            help="scrypt work factors (N) to test",
+        )
+        parser.add_argument(
+            "--argon2",
+            type=int,
+            nargs="*",
+            default=[1, 2, 3],
+            help="argon2 time costs to test (memory cost from settings or Django default)",
+        )
+
+    def _measure(self, hasher, rounds):
+        encoded = hasher.encode(PASSWORD, hasher.salt())
+        started = time.perf_counter()
+        for _ in range(rounds):
+            hasher.verify(PASSWORD, encoded)
+        return (time.perf_counter() - started) / rounds
+
+    def handle(self, *args, **options):
+        rounds = options["rounds"]
+        cases = []
+        for iterations in options["pbkdf2"]:
+            hasher = PBKDF2PasswordHasher()
+            hasher.iterations = iterations
+            cases.append(("pbkdf2", f"iterations={iterations}", hasher))
+        for work_factor in options["scrypt"]:
+            hasher = ScryptPasswordHasher()
+            hasher.work_factor = work_factor
+            cases.append(("scrypt", f"N={work_factor}", hasher))
+        try:
+            import argon2  # noqa: F401
+        except ImportError:
+            self.stdout.write(self.style.WARNING("argon2-cffi not installed; skipping argon2."))
+        else:
+            memory_cost = getattr(settings, "PASSWORD_ARGON2_MEMORY_COST", None) or Argon2PasswordHasher.memory_cost
+            for time_cost in options["argon2"]:
+                hasher = Argon2PasswordHasher()
+                hasher.time_cost = time_cost
+                hasher.memory_cost = memory_cost
+                cases.append(("argon2", f"t={time_cost} m={memory_cost}KiB", hasher))
+
+        cores = os.cpu_count() or 1
+        self.stdout.write(f"Current: PASSWORD_HASHER={getattr(settings, 'PASSWORD_HASHER', 'pbkdf2')}; {cores} CPU cores")
+        self.stdout.write(f"{'algorithm':<8} {'cost':<26} {'ms/login':>10} {'logins/s/core':>14} {'logins/s/box':>13}")
+        for algorithm, label, hasher in cases:
+            seconds = self._measure(hasher, rounds)
+            per_core = 1 / seconds if seconds else float("inf")
+            self.stdout.write(
+                f"{algorithm:<8} {label:<26} {seconds * 1000:>10.1f} {per_core:>14.1f} {per_core * cores:>13.0f}"
+            )
+        self.stdout.write(self.style.SUCCESS("Done."))
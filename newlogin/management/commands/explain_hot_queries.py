@@ -0,0 +1,95 @@
+"""
+Run EXPLAIN on the project's hot lookup queries and fail if any of them table-scans.
+Usage: python manage.py explain_hot_queries [--verbose]
+Exits non-zero when a plan contains a full table scan or sorts rows for ORDER BY (instead of
+reading them in index order), so it can gate CI / deploys.
+Supports SQLite (EXPLAIN QUERY PLAN) and MySQL (EXPLAIN FORMAT=JSON).
+"""
+import json
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.timezone import now
+
+from newlogin.models import (
+    Cart,
+    MedicalItem,
+    OneTimePassword,
+    OnlineOrderItem,
+    PurchaseOrderItem,
+    UserProfile,
+)
+from newlogin.views import AdminOrderListAPIView
+
+# SQLite: "SCAN newlogin_cart" is a full table scan; "SCAN ... USING [COVERING] INDEX" is not.
+_SQLITE_TABLE_SCAN = re.compile(r'\bSCAN (\w+)(?! USING)(?:\s|$)')
+_SQLITE_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+def hot_queries():
+    """(label, queryset) pairs: the views' own querysets where they expose them, else their filters."""
+    User = get_user_model()
+    return [
+        ('cart by order_no', Cart.objects.filter(order_no='ORD0000000000')),
+        ('cart by ccode', Cart.objects.filter(ccode='CUST0000000000')),
+        ('cart by inv_no (confirm uniqueness)', Cart.objects.filter(inv_no='INV0000000000')),
+        ('admin order list', AdminOrderListAPIView.orders()),
+        ('admin order list by status', AdminOrderListAPIView.orders('ordered')),
+        ('cart line by cart + item_code', OnlineOrderItem.objects.filter(cart_id=1, item_code='1')),
+        ('cart lines by item_code', OnlineOrderItem.objects.filter(item_code='1')),
+        ('medical item by mcode', MedicalItem.objects.filter(mcode='1')),
+        ('profile by customer_code', UserProfile.objects.filter(customer_code='CUST0000000000')),
+        ('profile by phone', UserProfile.objects.filter(phone='9999999999')),
+        ('user by username', User.objects.filter(username='9999999999')),
+        ('user by email (forgot password)', User.objects.filter(email='someone@example.com')),
+        (
+            'latest OTP for mobile',
+            OneTimePassword.objects.filter(mobile_number='9999999999').order_by('-created_at'),
+        ),
+        ('expired OTPs (purge)', OneTimePassword.objects.filter(expires_at__lt=now())),
+        ('PO lines by sku_code', PurchaseOrderItem.objects.filter(sku_code='SKU0')),
+    ]
+
+
+def table_scans(queryset):
+    """Return (plan_text, [tables fully scanned, plus 'ORDER BY sort']) for queryset on the default DB."""
+    if connection.vendor == 'mysql':
+        plan = queryset.explain(format='json')
+        scanned = re.findall(r'"table_name":\s*"(\w+)",\s*"access_type":\s*"ALL"', plan)
+        if re.search(r'"using_filesort":\s*true', plan):
+            scanned.append('ORDER BY sort')
+        return plan, scanned
+    if connection.vendor == 'sqlite':
+        plan = queryset.explain()
+        scanned = _SQLITE_TABLE_SCAN.findall(plan)
+        if _SQLITE_SORT in plan:
+            scanned.append('ORDER BY sort')
+        return plan, scanned
+    raise CommandError(f'Unsupported database vendor: {connection.vendor}')
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot lookup queries and fail if any of them does a full table scan"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verbose", action="store_true", help="Print every query plan")
+
+    def handle(self, *args, **options):
+        failures = []
+        for label, queryset in hot_queries():
+            plan, scanned = table_scans(queryset)
+            if scanned:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f"SCAN  {label}: {', '.join(scanned)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"OK    {label}"))
+            if options["verbose"] or scanned:
+                if connection.vendor == 'mysql':
+                    plan = json.dumps(json.loads(plan), indent=2)
+                for line in plan.splitlines():
+                    self.stdout.write(f"        {line}")
+        if failures:
+            raise CommandError(f"{len(failures)} hot quer{'y' if len(failures) == 1 else 'ies'} table-scan: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("All hot queries use an index."))
@@ -0,0 +1,37 @@
+"""
+Delete expired and verified one-time passwords in batches and cap the OTP table size.
+Usage: python manage.py purge_otps [--batch-size 1000] [--max-rows 100000]
+Schedule it (cron / systemd timer) for high-traffic deployments; the send-OTP API
+also queues the same purge on the background pool every OTP_PURGE_INTERVAL_SECONDS
+(set it to 0 to leave purging to this command).
+"""
+from django.core.management.base import BaseCommand
+
+from newlogin.otp_utils import purge_otps
+
+
+class Command(BaseCommand):
+    help = "Bulk-delete expired/verified OTPs in batches and trim the table to OTP_MAX_ROWS"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Rows deleted per statement (default: settings.OTP_PURGE_BATCH_SIZE)",
+        )
+        parser.add_argument(
+            "--max-rows",
+            type=int,
+            default=None,
+            help="Keep at most this many OTP rows, newest first; 0 disables the cap (default: settings.OTP_MAX_ROWS)",
+        )
+
+    def handle(self, *args, **options):
+        purged, trimmed = purge_otps(
+            batch_size=options["batch_size"],
+            max_rows=options["max_rows"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired/verified OTPs"))
+        if trimmed:
+            self.stdout.write(self.style.WARNING(f"Trimmed {trimmed} OTPs over the table cap"))
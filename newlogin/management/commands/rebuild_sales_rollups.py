@@ -0,0 +1,51 @@
+"""
+Rebuild the daily sales rollups (DailySalesRollup) from confirmed orders.
+Usage: python manage.py rebuild_sales_rollups [--from 2026-01-01] [--to 2026-01-31] [--chunk-days 31]
+
+Order confirmation keeps the rollups current; run this once after deploying them (backfill,
+defaults to the full order history) and whenever orders are edited or deleted outside the API.
+Each chunk of days is deleted and recomputed in its own transaction.
+"""
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from newlogin import analytics
+from newlogin.models import Cart
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}"; use YYYY-MM-DD.')
+
+
+class Command(BaseCommand):
+    help = "Recompute daily revenue / units / order rollups per item, category and payment mode"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", help="First day, YYYY-MM-DD (default: first order)")
+        parser.add_argument("--to", dest="end", help="Last day, YYYY-MM-DD (default: last order)")
+        parser.add_argument("--chunk-days", type=int, default=31, help="Days per transaction (default: 31)")
+
+    def handle(self, *args, **options):
+        bounds = Cart.objects.exclude(delivery_status='CART').aggregate(first=Min('date'), last=Max('date'))
+        start = _date(options["start"]) if options["start"] else bounds["first"]
+        end = _date(options["end"]) if options["end"] else bounds["last"]
+        if start is None or end is None:
+            self.stdout.write(self.style.WARNING("No confirmed orders; nothing to rebuild."))
+            return
+        if start > end:
+            raise CommandError("--from is after --to.")
+        if options["chunk_days"] < 1:
+            raise CommandError("--chunk-days must be at least 1.")
+
+        started = time.perf_counter()
+        self.stdout.write(f"Rebuilding sales rollups {start}..{end}...")
+        written = analytics.rebuild(start, end, chunk_days=options["chunk_days"], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} rollup rows in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,32 @@
+"""
+Recompute the bestseller ranking served by /api/medicalitems/bestsellers/.
+Usage: python manage.py refresh_bestsellers [--top 50] [--per-category 20]
+
+Ranks items by units sold over the last 7, 30 and 90 days, overall and per category, from the
+daily sales rollups (see rebuild_sales_rollups), so it never scans the order tables. Schedule it
+(cron / systemd timer), e.g. hourly; the API caches responses for BESTSELLERS_CACHE_TTL seconds.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from newlogin import analytics
+
+
+class Command(BaseCommand):
+    help = "Rebuild the 7/30/90-day bestseller ranking (overall and per category) from the sales rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=50, help="Items ranked overall per window (default: 50)")
+        parser.add_argument(
+            "--per-category", type=int, default=20, help="Items ranked per category per window (default: 20)"
+        )
+
+    def handle(self, *args, **options):
+        if options["top"] < 1 or options["per_category"] < 0:
+            raise CommandError("--top must be at least 1 and --per-category at least 0.")
+        started = time.perf_counter()
+        written = analytics.refresh_bestsellers(top=options["top"], per_category=options["per_category"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} bestseller ranks in {time.perf_counter() - started:.2f}s"
+        ))
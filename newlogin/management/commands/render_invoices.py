@@ -0,0 +1,70 @@
+"""
+Render invoice PDFs for confirmed orders on a process pool.
+Usage: python manage.py render_invoices [--stale | --all] [--from 2026-01-01] [--to 2026-01-31] [--workers 4] [--batch-size 200] [--prune]
+
+By default only orders without an invoice are rendered (backfill after deploying, or catching
+up on background renders lost to a restart). --stale also re-renders invoices made with an
+older invoices.TEMPLATE_VERSION; --all re-renders every order in the date range. Unchanged
+invoices render to the same bytes and keep their file and ETag. --prune then deletes stored
+PDFs that no order points at any more.
+"""
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from newlogin import invoices
+from newlogin.models import Cart
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}"; use YYYY-MM-DD.')
+
+
+class Command(BaseCommand):
+    help = "Render (or re-render) confirmed orders' invoice PDFs with a pool of worker processes"
+
+    def add_arguments(self, parser):
+        which = parser.add_mutually_exclusive_group()
+        which.add_argument("--stale", action="store_true", help="Also re-render invoices from an older template")
+        which.add_argument("--all", action="store_true", help="Re-render every invoice in the date range")
+        parser.add_argument("--from", dest="start", help="First order date, YYYY-MM-DD")
+        parser.add_argument("--to", dest="end", help="Last order date, YYYY-MM-DD")
+        parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+        parser.add_argument("--batch-size", type=int, default=200, help="Orders read per batch (default: 200)")
+        parser.add_argument("--prune", action="store_true", help="Delete stored PDFs no order points at")
+
+    def handle(self, *args, **options):
+        if options["workers"] is not None and options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        carts = Cart.objects.exclude(delivery_status='CART').exclude(order_no='')
+        if options["start"]:
+            carts = carts.filter(date__gte=_date(options["start"]))
+        if options["end"]:
+            carts = carts.filter(date__lte=_date(options["end"]))
+        if options["stale"]:
+            carts = carts.exclude(invoice_document__template_version=invoices.TEMPLATE_VERSION)
+        elif not options["all"]:
+            carts = carts.filter(invoice_document__isnull=True)
+        cart_ids = list(carts.order_by('id').values_list('id', flat=True))
+
+        started = time.perf_counter()
+        if cart_ids:
+            self.stdout.write(f"Rendering {len(cart_ids)} invoices...")
+            rendered = invoices.render_many(
+                cart_ids, workers=options["workers"], batch_size=options["batch_size"], log=self.stdout.write,
+            )
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f"Rendered {rendered} invoices in {elapsed:.1f}s ({rendered / elapsed:.0f}/s)"
+            ))
+        else:
+            self.stdout.write("No invoices to render.")
+        if options["prune"]:
+            self.stdout.write(f"Pruned {invoices.prune_unreferenced()} unreferenced PDFs.")
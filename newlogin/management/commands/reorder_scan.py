@@ -0,0 +1,66 @@
+"""
+Create draft purchase orders for medical items at or below their reorder level.
+Usage: python manage.py reorder_scan [--cover 2] [--supplier SUP2601010001] [--dry-run]
+
+Stock position is on hand (stock balances) plus quantity still open on draft / issued /
+partially delivered POs, so re-running before the drafts are received orders nothing twice.
+Items are grouped by preferred_supplier (or the supplier of their latest PO line); items
+with neither are listed and skipped. Schedule it daily (cron / systemd timer), then review
+and issue the drafts (PATCH status to "issued").
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from newlogin import reorder
+from newlogin.models import Supplier
+
+
+class Command(BaseCommand):
+    help = "Scan reorder levels against stock balances and bulk-create draft purchase orders per supplier"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cover",
+            type=int,
+            default=2,
+            help="Order up to reorder_level x cover (default: 2)",
+        )
+        parser.add_argument("--supplier", help="Only items for this supplier_code")
+        parser.add_argument("--dry-run", action="store_true", help="List shortfalls without creating drafts")
+
+    def handle(self, *args, **options):
+        if options["cover"] < 1:
+            raise CommandError("--cover must be at least 1.")
+        supplier_id = None
+        if options["supplier"]:
+            supplier_id = Supplier.objects.filter(supplier_code=options["supplier"]).values_list("id", flat=True).first()
+            if supplier_id is None:
+                raise CommandError(f'Supplier "{options["supplier"]}" not found.')
+
+        started = time.perf_counter()
+        shortfalls = reorder.find_shortfalls(cover=options["cover"], supplier_id=supplier_id)
+        scanned = time.perf_counter() - started
+        self.stdout.write(f"{len(shortfalls)} items at or below reorder level (scan {scanned:.2f}s)")
+
+        unassigned = [row for row in shortfalls if row["supplier_id"] is None]
+        if unassigned:
+            self.stdout.write(self.style.WARNING(
+                f"{len(unassigned)} items have no supplier (set preferred_supplier): "
+                + ", ".join(row["mcode"] for row in unassigned[:20])
+                + (" ..." if len(unassigned) > 20 else "")
+            ))
+        if options["dry_run"]:
+            for row in shortfalls[:50]:
+                self.stdout.write(
+                    f"  {row['mcode']:>10}  on hand {row['on_hand']:>6}  on order {row['on_order']:>6}  "
+                    f"reorder {row['reorder_level']:>6}  order {row['quantity']:>6}"
+                )
+            return
+
+        created = reorder.create_draft_orders(shortfalls)
+        for purchase_order_no, supplier_id, lines in created:
+            self.stdout.write(f"  {purchase_order_no}  supplier {supplier_id}  {lines} lines")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(created)} draft purchase orders in {time.perf_counter() - started:.2f}s"
+        ))
@@ -0,0 +1,79 @@
+"""
+Load production-scale synthetic data for local performance work.
+Usage: python manage.py seed_scale [--items 10000] [--customers 10000] [--orders 100000]
+                                   [--lines-per-order 10] [--purchase-orders 1000] [--seed 1]
+
+Generates categories, MedicalItem (+ media), User/UserProfile/CustomerAddress, confirmed
+Cart + OnlineOrderItem, open carts, Supplier and PurchaseOrder + PurchaseOrderItem rows with
+bulk_create in batches. Codes are assigned up front (SYN-prefixed) instead of going through
+the per-row generation loops in save(), and the same --seed always yields the same data.
+Each run appends a new set; point DB_NAME at a scratch database for large runs.
+"""
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from newlogin import synthetic
+
+
+class Command(BaseCommand):
+    help = "Bulk-load deterministic synthetic catalog, customers, orders and purchase orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=10000, help="Catalog items (default: 10000)")
+        parser.add_argument("--categories", type=int, default=50, help="Categories (default: 50)")
+        parser.add_argument("--customers", type=int, default=10000, help="Customers with address (default: 10000)")
+        parser.add_argument("--orders", type=int, default=100000, help="Confirmed orders (default: 100000)")
+        parser.add_argument("--lines-per-order", type=int, default=10, help="Lines per order (default: 10)")
+        parser.add_argument("--open-carts", type=int, default=0, help="Unconfirmed carts (default: 0)")
+        parser.add_argument("--suppliers", type=int, default=50, help="Suppliers (default: 50)")
+        parser.add_argument("--purchase-orders", type=int, default=1000, help="Purchase orders (default: 1000)")
+        parser.add_argument("--po-lines", type=int, default=10, help="Lines per purchase order (default: 10)")
+        parser.add_argument("--batch-size", type=int, default=2000, help="Rows per bulk_create batch (default: 2000)")
+        parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+
+    def handle(self, *args, **options):
+        if options["orders"] or options["open_carts"] or options["purchase_orders"]:
+            if not options["items"] and not synthetic.synthetic_mcodes():
+                raise CommandError("Orders need a synthetic catalog; pass --items or seed items first.")
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+        log = self.stdout.write
+        started = time.perf_counter()
+
+        if options["items"]:
+            self.stdout.write(f"Seeding {options['items']} items...")
+            with transaction.atomic():
+                synthetic.seed_catalog(
+                    options["items"], rng, batch_size=batch_size, categories=options["categories"], log=log
+                )
+        mcodes = synthetic.synthetic_mcodes()
+
+        customer_codes = []
+        if options["customers"]:
+            self.stdout.write(f"Seeding {options['customers']} customers...")
+            with transaction.atomic():
+                customer_codes = synthetic.seed_customers(options["customers"], rng, batch_size=batch_size, log=log)
+
+        for count, status in ((options["orders"], 'ORDERED'), (options["open_carts"], 'CART')):
+            if not count:
+                continue
+            self.stdout.write(f"Seeding {count} {'orders' if status != 'CART' else 'open carts'}...")
+            with transaction.atomic():
+                synthetic.seed_orders(
+                    count, count * options["lines_per_order"], rng, mcodes, customer_codes,
+                    batch_size=batch_size, status=status, log=log,
+                )
+
+        if options["purchase_orders"]:
+            self.stdout.write(f"Seeding {options['purchase_orders']} purchase orders...")
+            with transaction.atomic():
+                supplier_ids = synthetic.seed_suppliers(options["suppliers"], rng)
+                synthetic.seed_purchase_orders(
+                    options["purchase_orders"], options["po_lines"], rng, supplier_ids,
+                    batch_size=batch_size, log=log,
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,82 @@
+"""
+Flood a throttled auth endpoint from one client and report how much traffic gets through.
+Usage: python manage.py throttle_loadtest [--endpoint send-otp|login|identify-customer] [--requests 500]
+
+Email goes to the in-memory backend and SMS is disabled for the run, and all DB writes
+(OTP rows) are rolled back at the end, so it is safe to run against a dev database.
+"""
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+
+from newlogin.models import OneTimePassword
+
+ENDPOINTS = {
+    'send-otp': '/api/auth/send-otp/',
+    'login': '/api/auth/login/',
+    'identify-customer': '/api/auth/identify-customer/',
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Load-test the throttled auth endpoints and print accepted/rejected counts and req/s"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="send-otp")
+        parser.add_argument("--requests", type=int, default=500, help="Total requests to send (default: 500)")
+        parser.add_argument(
+            "--rotate-ip",
+            action="store_true",
+            help="Use a new client IP per request, so only the mobile/email/username keys throttle",
+        )
+
+    def handle(self, *args, **options):
+        endpoint = options["endpoint"]
+        total = options["requests"]
+        url = ENDPOINTS[endpoint]
+        run_id = uuid.uuid4().hex[:8]
+        mobile = f"9{int(run_id, 16) % 10**9:09d}"
+        payload = {
+            'send-otp': {'mobileNumber': mobile, 'email': f'{run_id}@loadtest.local'},
+            'login': {'username': mobile, 'password': 'wrong-password'},
+            'identify-customer': {'mobileNumber': mobile},
+        }[endpoint]
+
+        client = Client()
+        codes = {}
+        otp_before = OneTimePassword.objects.count()
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            SMS_GATEWAY_URL='',
+        ):
+            try:
+                with transaction.atomic():
+                    started = time.perf_counter()
+                    for i in range(total):
+                        ip = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" if options["rotate_ip"] else "10.0.0.1"
+                        response = client.post(
+                            url, payload, content_type='application/json', REMOTE_ADDR=ip
+                        )
+                        codes[response.status_code] = codes.get(response.status_code, 0) + 1
+                    elapsed = time.perf_counter() - started
+                    otp_created = OneTimePassword.objects.count() - otp_before
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+        throttled = codes.get(429, 0)
+        self.stdout.write(f"Endpoint:        POST {url}")
+        self.stdout.write(f"Requests:        {total} in {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+        self.stdout.write(f"Status codes:    {dict(sorted(codes.items()))}")
+        self.stdout.write(f"Throttled (429): {throttled} ({100.0 * throttled / total:.1f}%)")
+        if endpoint == 'send-otp':
+            self.stdout.write(f"OTP rows / notifications reached: {otp_created}")
+        self.stdout.write(self.style.SUCCESS("Done (DB writes rolled back)."))
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-19 05:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newlogin', '0040_coupon'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='onetimepassword',
+            index=models.Index(fields=['mobile_number', 'created_at'], name='otp_mobile_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='onetimepassword',
+            index=models.Index(fields=['expires_at'], name='otp_expires_idx'),
+        ),
+    ]
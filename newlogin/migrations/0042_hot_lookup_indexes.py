@@ -0,0 +1,52 @@
+# Generated by Django 6.0 on 2026-10-19 07:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+# auth.User belongs to django.contrib.auth, so its email index (ForgotPassword /
+# RegisterSerializer lookups) is created through the schema editor here.
+USER_EMAIL_INDEX = models.Index(fields=['email'], name='auth_user_email_idx')
+
+
+def add_user_email_index(apps, schema_editor):
+    schema_editor.add_index(apps.get_model(settings.AUTH_USER_MODEL), USER_EMAIL_INDEX)
+
+
+def remove_user_email_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model(settings.AUTH_USER_MODEL), USER_EMAIL_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newlogin', '0041_onetimepassword_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['ccode'], name='cart_ccode_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['inv_no'], name='cart_inv_no_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['delivery_status', 'date', 'time'], name='cart_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='onlineorderitem',
+            index=models.Index(fields=['item_code'], name='orderitem_item_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderitem',
+            index=models.Index(fields=['sku_code'], name='poitem_sku_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['phone'], name='profile_phone_idx'),
+        ),
+        migrations.RunPython(add_user_email_index, remove_user_email_index),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 6.0 on 2026-10-19 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_outstanding_lines(apps, schema_editor):
+    PurchaseOrder = apps.get_model('newlogin', 'PurchaseOrder')
+    PurchaseOrderItem = apps.get_model('newlogin', 'PurchaseOrderItem')
+    outstanding = (
+        PurchaseOrderItem.objects.filter(
+            purchase_order=models.OuterRef('pk'), actual_quantity__lt=models.F('full_quantity')
+        )
+        .order_by()
+        .values('purchase_order')
+        .annotate(n=models.Count('id'))
+        .values('n')
+    )
+    PurchaseOrder.objects.update(
+        outstanding_lines=Coalesce(models.Subquery(outstanding), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newlogin', '0042_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='outstanding_lines',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Lines with actual_quantity < full_quantity; maintained on edit and goods receipt.'),
+        ),
+        migrations.CreateModel(
+            name='GoodsReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grn_no', models.CharField(blank=True, editable=False, max_length=20, unique=True)),
+                ('date', models.DateField()),
+                ('remarks', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('emp', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='goods_receipts', to='newlogin.staff')),
+                ('purchase_order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipts', to='newlogin.purchaseorder')),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='GoodsReceiptItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('purchase_order_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_lines', to='newlogin.purchaseorderitem')),
+                ('receipt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='newlogin.goodsreceipt')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(count_outstanding_lines, migrations.RunPython.noop),
+    ]
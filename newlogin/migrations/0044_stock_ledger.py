@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-19 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newlogin', '0043_goods_receipts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(blank=True, default='', max_length=255)),
+                ('on_hand', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_balances', to='newlogin.medicalitem')),
+            ],
+            options={
+                'ordering': ['item_id', 'location'],
+                'unique_together': {('item', 'location')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(blank=True, default='', max_length=255)),
+                ('quantity', models.IntegerField(help_text='Positive for stock in, negative for stock out.')),
+                ('kind', models.CharField(choices=[('receipt', 'Receipt'), ('sale', 'Sale'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('reference', models.CharField(blank=True, default='', help_text='GRN no, order no or adjustment reason.', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_movements', to='newlogin.medicalitem')),
+            ],
+            options={
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['item', 'created_at'], name='stockmove_item_created_idx'), models.Index(fields=['reference'], name='stockmove_reference_idx')],
+            },
+        ),
+    ]
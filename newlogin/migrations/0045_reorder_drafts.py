@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-19 13:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newlogin', '0044_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalitem',
+            name='preferred_supplier',
+            field=models.ForeignKey(blank=True, help_text='Supplier for reorder drafts; defaults to the supplier of the latest PO line.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='preferred_items', to='newlogin.supplier'),
+        ),
+        migrations.AlterField(
+            model_name='purchaseorder',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Draft'), ('issued', 'Issued'), ('partially delived', 'Partially Delived'), ('full delived', 'Full Delived')], default='issued', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderitem',
+            index=models.Index(fields=['item_code'], name='poitem_item_code_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newlogin', '0045_reorder_drafts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('dimension', models.CharField(choices=[('item', 'Item (mcode)'), ('category', 'Category (catcode)'), ('payment_mode', 'Payment mode')], max_length=20)),
+                ('key', models.CharField(blank=True, default='', help_text="mcode, catcode or payment mode; '' for uncategorized items / no payment mode.", max_length=100)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date', 'dimension', 'key'],
+                'unique_together': {('dimension', 'date', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-19 14:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newlogin', '0046_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BestsellerRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_days', models.PositiveSmallIntegerField()),
+                ('rank', models.PositiveIntegerField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('computed_at', models.DateTimeField()),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='newlogin.category')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='newlogin.medicalitem')),
+            ],
+            options={
+                'ordering': ['window_days', 'category_id', 'rank'],
+                'indexes': [models.Index(fields=['window_days', 'category', 'rank'], name='bestseller_window_cat_idx')],
+            },
+        ),
+    ]
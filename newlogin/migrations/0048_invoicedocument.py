@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newlogin', '0047_bestseller_rank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64)),
+                ('size', models.PositiveIntegerField()),
+                ('template_version', models.PositiveSmallIntegerField(help_text='invoices.TEMPLATE_VERSION the PDF was rendered with.')),
+                ('rendered_at', models.DateTimeField()),
+                ('cart', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_document', to='newlogin.cart')),
+            ],
+            options={
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['template_version'], name='invoice_template_version_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-19 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newlogin', '0048_invoicedocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='coupon',
+            field=models.ForeignKey(blank=True, help_text='Coupon applied with POST /api/cart/coupon/apply/; discount is derived from it.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='newlogin.coupon'),
+        ),
+    ]
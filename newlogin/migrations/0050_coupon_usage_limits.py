@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-19 15:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_usage_shards(apps, schema_editor):
+    # Existing coupons have no limits yet, so every stripe starts uncapped.
+    Coupon = apps.get_model('newlogin', 'Coupon')
+    CouponUsageShard = apps.get_model('newlogin', 'CouponUsageShard')
+    shards = max(1, getattr(settings, 'COUPON_COUNTER_SHARDS', 16))
+    CouponUsageShard.objects.bulk_create(
+        [
+            CouponUsageShard(coupon_id=coupon_id, shard=shard)
+            for coupon_id in Coupon.objects.values_list('id', flat=True)
+            for shard in range(shards)
+        ],
+        batch_size=2000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newlogin', '0049_cart_coupon'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='max_per_customer',
+            field=models.PositiveIntegerField(blank=True, help_text='Confirmed orders per customer_code; empty = unlimited.', null=True),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='max_redemptions',
+            field=models.PositiveIntegerField(blank=True, help_text='Total confirmed orders that may use this coupon; empty = unlimited.', null=True),
+        ),
+        migrations.CreateModel(
+            name='CouponRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_code', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('last_redeemed_at', models.DateTimeField(blank=True, null=True)),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='newlogin.coupon')),
+            ],
+            options={
+                'ordering': ['-last_redeemed_at'],
+                'indexes': [models.Index(fields=['customer_code'], name='redemption_customer_idx')],
+                'unique_together': {('coupon', 'customer_code')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CouponUsageShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('used', models.PositiveIntegerField(default=0)),
+                ('capacity', models.PositiveIntegerField(blank=True, null=True)),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_shards', to='newlogin.coupon')),
+            ],
+            options={
+                'ordering': ['coupon_id', 'shard'],
+                'unique_together': {('coupon', 'shard')},
+            },
+        ),
+        migrations.RunPython(create_usage_shards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 17:05
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Upper
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newlogin', '0050_coupon_usage_limits'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cart',
+            name='cart_status_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['date', 'time', 'id'], name='cart_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(
+                Upper('delivery_status'), F('date'), F('time'), F('id'), name='cart_status_date_idx',
+            ),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.conf import settings
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Upper
 from django.utils.crypto import get_random_string
 from django.utils.timezone import now
 from datetime import timedelta
@@ -300,6 +302,10 @@ class MedicalItem(models.Model):
     )
     package_count = models.PositiveIntegerField(default=1)
     reorder_level = models.PositiveIntegerField(default=0)
+    preferred_supplier = models.ForeignKey(
+        Supplier, on_delete=models.SET_NULL, null=True, blank=True, related_name='preferred_items',
+        help_text='Supplier for reorder drafts; defaults to the supplier of the latest PO line.'
+    )
     mrp = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     sell_discount = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     storage_location1 = models.CharField(max_length=255, null=True, blank=True)
@@ -332,6 +338,60 @@ class MedicalItem(models.Model):
         return self.sku_name
 
 
+class StockMovement(models.Model):
+    """
+    Append-only stock ledger for MedicalItem: one signed quantity per item and location.
+    Written through newlogin.inventory, which keeps StockBalance in step in the same transaction.
+    """
+    KIND_RECEIPT = 'receipt'
+    KIND_SALE = 'sale'
+    KIND_ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (KIND_RECEIPT, 'Receipt'),
+        (KIND_SALE, 'Sale'),
+        (KIND_ADJUSTMENT, 'Adjustment'),
+    ]
+
+    item = models.ForeignKey(
+        MedicalItem, on_delete=models.PROTECT, related_name='stock_movements'
+    )
+    location = models.CharField(max_length=255, blank=True, default='')
+    quantity = models.IntegerField(help_text='Positive for stock in, negative for stock out.')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    reference = models.CharField(
+        max_length=100, blank=True, default='',
+        help_text='GRN no, order no or adjustment reason.'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['item', 'created_at'], name='stockmove_item_created_idx'),
+            models.Index(fields=['reference'], name='stockmove_reference_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.item_id}@{self.location or '-'} {self.quantity:+d}"
+
+
+class StockBalance(models.Model):
+    """Materialized on-hand quantity per item and location (the running sum of StockMovement)."""
+    item = models.ForeignKey(
+        MedicalItem, on_delete=models.CASCADE, related_name='stock_balances'
+    )
+    location = models.CharField(max_length=255, blank=True, default='')
+    on_hand = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['item_id', 'location']
+        unique_together = [['item', 'location']]
+
+    def __str__(self) -> str:
+        return f"{self.item_id}@{self.location or '-'}: {self.on_hand}"
+
+
 class MedicalItemMedia(models.Model):
     """Child table: media for MedicalItem (on_delete CASCADE)."""
     medical_item = models.OneToOneField(
@@ -349,10 +409,12 @@ class MedicalItemMedia(models.Model):
 
 
 class PurchaseOrder(models.Model):
+    STATUS_DRAFT = 'draft'
     STATUS_ISSUED = 'issued'
     STATUS_PARTIALLY_DELIVED = 'partially delived'
     STATUS_FULL_DELIVED = 'full delived'
     STATUS_CHOICES = [
+        (STATUS_DRAFT, 'Draft'),
         (STATUS_ISSUED, 'Issued'),
         (STATUS_PARTIALLY_DELIVED, 'Partially Delived'),
         (STATUS_FULL_DELIVED, 'Full Delived'),
@@ -372,6 +434,10 @@ class PurchaseOrder(models.Model):
         max_length=20, choices=STATUS_CHOICES, default=STATUS_ISSUED
     )
     remarks = models.TextField(null=True, blank=True)
+    outstanding_lines = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text='Lines with actual_quantity < full_quantity; maintained on edit and goods receipt.'
+    )
 
     def save(self, *args, **kwargs):
         if not self.purchase_order_no:
@@ -386,6 +452,27 @@ class PurchaseOrder(models.Model):
     def __str__(self) -> str:
         return f"{self.purchase_order_no} - {self.supplier.name}"
 
+    def refresh_outstanding_lines(self):
+        """
+        Recount outstanding lines and re-derive status after the lines were edited directly.
+        Goods receipts keep both up to date incrementally instead (GoodsReceiptSerializer).
+        """
+        lines = self.items.aggregate(
+            total=models.Count('id'),
+            outstanding=models.Count('id', filter=models.Q(actual_quantity__lt=models.F('full_quantity'))),
+            received=models.Count('id', filter=models.Q(actual_quantity__gt=0)),
+        )
+        self.outstanding_lines = lines['outstanding']
+        if lines['total'] and not lines['outstanding']:
+            self.status = self.STATUS_FULL_DELIVED
+        elif lines['received']:
+            self.status = self.STATUS_PARTIALLY_DELIVED
+        elif self.status != self.STATUS_DRAFT:
+            self.status = self.STATUS_ISSUED
+        PurchaseOrder.objects.filter(pk=self.pk).update(
+            outstanding_lines=self.outstanding_lines, status=self.status
+        )
+
 
 class PurchaseOrderItem(models.Model):
     TYPE_PNP = 'p&p'
@@ -408,10 +495,64 @@ class PurchaseOrderItem(models.Model):
     full_quantity = models.PositiveIntegerField(default=0)
     actual_quantity = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sku_code'], name='poitem_sku_code_idx'),
+            # Reorder scan: open quantity and latest supplier per medical item.
+            models.Index(fields=['item_code'], name='poitem_item_code_idx'),
+        ]
+
     def __str__(self) -> str:
         return f"{self.sku_name or self.sku_code} x {self.actual_quantity}"
 
 
+class GoodsReceipt(models.Model):
+    """Goods received note (GRN): one delivery against a purchase order."""
+    grn_no = models.CharField(max_length=20, unique=True, editable=False, blank=True)
+    purchase_order = models.ForeignKey(
+        PurchaseOrder, on_delete=models.CASCADE, related_name='receipts'
+    )
+    date = models.DateField()
+    emp = models.ForeignKey(
+        Staff, on_delete=models.SET_NULL, related_name='goods_receipts', null=True, blank=True
+    )
+    remarks = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-id']
+
+    def save(self, *args, **kwargs):
+        if not self.grn_no:
+            date_part = now().strftime('%y%m%d')
+            while True:
+                candidate = f"GRN{date_part}{get_random_string(4, allowed_chars='0123456789')}"
+                if not GoodsReceipt.objects.filter(grn_no=candidate).exists():
+                    self.grn_no = candidate
+                    break
+        super().save(*args, **kwargs)
+
+    def __str__(self) -> str:
+        return f"{self.grn_no} ({self.purchase_order.purchase_order_no})"
+
+
+class GoodsReceiptItem(models.Model):
+    """Quantity received against one purchase order line."""
+    receipt = models.ForeignKey(
+        GoodsReceipt, on_delete=models.CASCADE, related_name='items'
+    )
+    purchase_order_item = models.ForeignKey(
+        PurchaseOrderItem, on_delete=models.CASCADE, related_name='receipt_lines'
+    )
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self) -> str:
+        return f"{self.receipt.grn_no} / {self.purchase_order_item_id} x {self.quantity}"
+
+
 class Item(models.Model):
     """Parent table for Item API."""
     item_code = models.CharField(max_length=20, unique=True, editable=False, blank=True)
@@ -483,6 +624,11 @@ class UserProfile(models.Model):
     name = models.CharField(max_length=255)
     phone = models.CharField(max_length=20, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['phone'], name='profile_phone_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not (self.customer_code or '').strip():
             date_part = now().strftime('%y%m%d')
@@ -558,6 +704,12 @@ class Coupon(models.Model):
     discount_pct = models.DecimalField(max_digits=5, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
     type = models.CharField(max_length=20, choices=TYPE_CHOICES, default=TYPE_NEW)
+    max_redemptions = models.PositiveIntegerField(
+        null=True, blank=True, help_text='Total confirmed orders that may use this coupon; empty = unlimited.'
+    )
+    max_per_customer = models.PositiveIntegerField(
+        null=True, blank=True, help_text='Confirmed orders per customer_code; empty = unlimited.'
+    )
 
     class Meta:
         ordering = ['-id']
@@ -566,6 +718,43 @@ class Coupon(models.Model):
         return self.name
 
 
+class CouponUsageShard(models.Model):
+    """
+    One stripe of a coupon's redemption counter (newlogin/coupons.py). A confirm increments one
+    random stripe with `used < capacity` in the WHERE clause, so concurrent confirms of a popular
+    coupon lock different rows. The capacities add up to Coupon.max_redemptions (NULL = no limit).
+    """
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='usage_shards')
+    shard = models.PositiveSmallIntegerField()
+    used = models.PositiveIntegerField(default=0)
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['coupon_id', 'shard']
+        unique_together = [['coupon', 'shard']]
+
+    def __str__(self) -> str:
+        return f"{self.coupon_id}#{self.shard}: {self.used}/{self.capacity if self.capacity is not None else '-'}"
+
+
+class CouponRedemption(models.Model):
+    """Confirmed orders per coupon and customer, for Coupon.max_per_customer."""
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='redemptions')
+    customer_code = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+    last_redeemed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-last_redeemed_at']
+        unique_together = [['coupon', 'customer_code']]
+        indexes = [
+            models.Index(fields=['customer_code'], name='redemption_customer_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.coupon_id} / {self.customer_code} x {self.count}"
+
+
 class PasswordResetToken(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reset_tokens'
@@ -606,6 +795,13 @@ class OneTimePassword(models.Model):
     verified_at = models.DateTimeField(null=True, blank=True)
     customer_code = models.CharField(max_length=20, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Per-number lookups (latest OTP / rate checks) and the purge job's expiry scan.
+            models.Index(fields=['mobile_number', 'created_at'], name='otp_mobile_created_idx'),
+            models.Index(fields=['expires_at'], name='otp_expires_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.expires_at:
             # Default: OTP valid for 5 minutes (300 seconds)
@@ -646,6 +842,10 @@ class Cart(models.Model):
         max_digits=12, decimal_places=2, default=0,
         help_text='Cart-level discount amount (e.g. applied at checkout).'
     )
+    coupon = models.ForeignKey(
+        Coupon, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        help_text='Coupon applied with POST /api/cart/coupon/apply/; discount is derived from it.'
+    )
     payment_mode = models.CharField(
         max_length=20, null=True, blank=True,
         help_text='e.g. COD, ONLINE; set on order confirm.'
@@ -653,6 +853,17 @@ class Cart(models.Model):
 
     class Meta:
         ordering = ['-id']
+        indexes = [
+            models.Index(fields=['ccode'], name='cart_ccode_idx'),
+            models.Index(fields=['inv_no'], name='cart_inv_no_idx'),
+            # Admin order list (AdminOrderListAPIView.orders()), newest first: all confirmed
+            # orders, or those with one status (matched case-insensitively, on UPPER()). id is
+            # the final sort key, so no sort step.
+            models.Index(fields=['date', 'time', 'id'], name='cart_date_time_idx'),
+            models.Index(
+                Upper('delivery_status'), F('date'), F('time'), F('id'), name='cart_status_date_idx',
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.order_no:
@@ -689,6 +900,94 @@ class OnlineOrderItem(models.Model):
     class Meta:
         ordering = ['id']
         unique_together = [['cart', 'item_code']]
+        indexes = [
+            # (cart, item_code) is covered by unique_together; this serves item_code-only lookups.
+            models.Index(fields=['item_code'], name='orderitem_item_code_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.cart.order_no} / {self.item_code} x {self.qty}"
+
+
+class DailySalesRollup(models.Model):
+    """
+    Confirmed-order sales pre-aggregated per day and dimension (newlogin/analytics.py).
+    Updated when an order is confirmed; rebuilt from orders by `manage.py rebuild_sales_rollups`.
+    """
+    DIMENSION_ITEM = 'item'
+    DIMENSION_CATEGORY = 'category'
+    DIMENSION_PAYMENT_MODE = 'payment_mode'
+    DIMENSION_CHOICES = [
+        (DIMENSION_ITEM, 'Item (mcode)'),
+        (DIMENSION_CATEGORY, 'Category (catcode)'),
+        (DIMENSION_PAYMENT_MODE, 'Payment mode'),
+    ]
+
+    date = models.DateField()
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    key = models.CharField(
+        max_length=100, blank=True, default='',
+        help_text="mcode, catcode or payment mode; '' for uncategorized items / no payment mode."
+    )
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date', 'dimension', 'key']
+        unique_together = [['dimension', 'date', 'key']]
+
+    def __str__(self) -> str:
+        return f"{self.date} {self.dimension}={self.key or '-'}: {self.units} / {self.revenue}"
+
+
+class BestsellerRank(models.Model):
+    """
+    Precomputed bestseller ranking per window and category (NULL category = all categories),
+    rebuilt from DailySalesRollup by `manage.py refresh_bestsellers`.
+    """
+    window_days = models.PositiveSmallIntegerField()
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, null=True, blank=True, related_name='+'
+    )
+    rank = models.PositiveIntegerField()
+    item = models.ForeignKey(MedicalItem, on_delete=models.CASCADE, related_name='+')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['window_days', 'category_id', 'rank']
+        indexes = [
+            models.Index(fields=['window_days', 'category', 'rank'], name='bestseller_window_cat_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.window_days}d #{self.rank}: {self.item_id}"
+
+
+class InvoiceDocument(models.Model):
+    """
+    Rendered invoice PDF of a confirmed order (newlogin/invoices.py). The file lives in the
+    'invoices' storage under its SHA-256, so identical renders share one file.
+    """
+    cart = models.OneToOneField(Cart, on_delete=models.CASCADE, related_name='invoice_document')
+    sha256 = models.CharField(max_length=64)
+    size = models.PositiveIntegerField()
+    template_version = models.PositiveSmallIntegerField(
+        help_text='invoices.TEMPLATE_VERSION the PDF was rendered with.'
+    )
+    rendered_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['template_version'], name='invoice_template_version_idx'),
+        ]
+
+    @property
+    def storage_name(self) -> str:
+        return f"{self.sha256[:2]}/{self.sha256}.pdf"
+
+    def __str__(self) -> str:
+        return f"Invoice {self.cart_id} ({self.sha256[:12]})"
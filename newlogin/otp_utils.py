@@ -0,0 +1,92 @@
+"""
+OTP housekeeping: batched purge of expired/verified OTPs and a hard cap on table size.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.timezone import now
+
+from .background import run_in_background
+from .models import OneTimePassword
+
+logger = logging.getLogger(__name__)
+
+_last_purge = 0.0
+_purge_lock = threading.Lock()
+
+
+def _delete_in_batches(queryset, batch_size):
+    """Delete rows matching queryset, batch_size ids at a time. Returns rows deleted."""
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        count, _ = OneTimePassword.objects.filter(id__in=ids).delete()
+        deleted += count
+        if len(ids) < batch_size:
+            return deleted
+
+
+def purge_otps(batch_size=None, max_rows=None, verified_retention_seconds=None):
+    """
+    Delete expired and verified OTPs in batches, then trim the table to max_rows
+    (oldest first). Returns (purged, trimmed).
+    """
+    batch_size = batch_size or getattr(settings, 'OTP_PURGE_BATCH_SIZE', 1000)
+    if max_rows is None:
+        max_rows = getattr(settings, 'OTP_MAX_ROWS', 0)
+    if verified_retention_seconds is None:
+        verified_retention_seconds = getattr(settings, 'OTP_VERIFIED_RETENTION_SECONDS', 0)
+
+    current = now()
+    stale = OneTimePassword.objects.filter(
+        Q(expires_at__lt=current)
+        | Q(verified_at__lt=current - timedelta(seconds=verified_retention_seconds))
+    )
+    purged = _delete_in_batches(stale, batch_size)
+
+    trimmed = 0
+    if max_rows:
+        # Everything older than the max_rows-th newest row goes.
+        cutoff = list(
+            OneTimePassword.objects.order_by('-id')
+            .values_list('id', flat=True)[max_rows:max_rows + 1]
+        )
+        if cutoff:
+            trimmed = _delete_in_batches(
+                OneTimePassword.objects.filter(id__lte=cutoff[0]), batch_size
+            )
+    return purged, trimmed
+
+
+def _purge_job():
+    if not _purge_lock.acquire(blocking=False):
+        return
+    try:
+        purged, trimmed = purge_otps()
+        if purged or trimmed:
+            logger.info('Purged %s stale OTPs, trimmed %s over cap', purged, trimmed)
+    finally:
+        _purge_lock.release()
+
+
+def maybe_purge_otps():
+    """
+    Queue purge_otps on the background pool at most once per OTP_PURGE_INTERVAL_SECONDS per
+    process. Called from the send-OTP path so the table stays bounded without a scheduler; the
+    request itself never waits for the DELETEs.
+    """
+    global _last_purge
+    interval = getattr(settings, 'OTP_PURGE_INTERVAL_SECONDS', 300)
+    if interval <= 0:
+        return
+    current = time.monotonic()
+    if current - _last_purge < interval:
+        return
+    _last_purge = current
+    run_in_background(_purge_job)
@@ -0,0 +1,45 @@
+"""
+Fast JSON rendering for API responses.
+
+FastJSONRenderer encodes with orjson, using DRF's own JSONEncoder as the fallback for types
+orjson doesn't take (Decimal, and date/time so they keep DRF's formatting), so the output is
+the same as rest_framework.renderers.JSONRenderer. When orjson isn't installed the renderer
+behaves exactly like JSONRenderer.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_drf_default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    orjson-backed JSONRenderer. Falls back to DRF's encoder for indented output (browsable
+    API, `; indent=` media type parameter), non-default UNICODE_JSON/COMPACT_JSON settings and
+    anything orjson refuses (e.g. integers over 64 bits).
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context)
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_drf_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same JavaScript-safety escaping of U+2028/U+2029 as JSONRenderer.
+        if b'\xe2\x80' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
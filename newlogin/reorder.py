@@ -0,0 +1,138 @@
+"""
+Reorder-point scanning for MedicalItem.
+
+find_shortfalls() compares every item's stock position with its reorder_level in one query.
+The position is the on-hand total from StockBalance plus the quantity still open on draft,
+issued and partially delivered purchase orders. create_draft_orders() turns the shortfalls
+into one draft PurchaseOrder per supplier with bulk_create. Used by the reorder_scan command.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils.crypto import get_random_string
+from django.utils.timezone import now
+
+from .models import MedicalItem, PurchaseOrder, PurchaseOrderItem, StockBalance
+
+logger = logging.getLogger(__name__)
+
+OPEN_PO_STATUSES = (
+    PurchaseOrder.STATUS_DRAFT,
+    PurchaseOrder.STATUS_ISSUED,
+    PurchaseOrder.STATUS_PARTIALLY_DELIVED,
+)
+
+
+def find_shortfalls(cover=2, supplier_id=None):
+    """
+    Items whose position (on hand + open on order) is at or below reorder_level, with the
+    quantity that brings the position back up to reorder_level * cover. Each row is a dict:
+    id, mcode, sku_code, sku_name, unit, supplier_id (None if the item has no supplier yet),
+    on_hand, on_order, reorder_level, quantity.
+    """
+    on_hand = (
+        StockBalance.objects.filter(item=OuterRef('pk'))
+        .order_by().values('item').annotate(total=Sum('on_hand')).values('total')
+    )
+    open_lines = PurchaseOrderItem.objects.filter(
+        item_code=OuterRef('mcode'), purchase_order__status__in=OPEN_PO_STATUSES
+    )
+    on_order = (
+        open_lines.filter(actual_quantity__lt=F('full_quantity'))
+        .order_by().values('item_code')
+        .annotate(total=Sum(F('full_quantity') - F('actual_quantity'))).values('total')
+    )
+    last_supplier = (
+        PurchaseOrderItem.objects.filter(item_code=OuterRef('mcode'))
+        .order_by('-purchase_order__date', '-id').values('purchase_order__supplier_id')[:1]
+    )
+    zero = Value(0, output_field=IntegerField())
+    qs = (
+        MedicalItem.objects.filter(reorder_level__gt=0)
+        .annotate(
+            on_hand=Coalesce(Subquery(on_hand, output_field=IntegerField()), zero),
+            on_order=Coalesce(Subquery(on_order, output_field=IntegerField()), zero),
+            supplier_id=Coalesce('preferred_supplier_id', Subquery(last_supplier), output_field=IntegerField()),
+        )
+        .annotate(position=F('on_hand') + F('on_order'))
+        .filter(position__lte=F('reorder_level'))
+        .order_by('id')
+    )
+    if supplier_id is not None:
+        qs = qs.filter(supplier_id=supplier_id)
+    rows = list(qs.values(
+        'id', 'mcode', 'sku_code', 'sku_name', 'unit', 'supplier_id',
+        'on_hand', 'on_order', 'reorder_level', 'position',
+    ))
+    for row in rows:
+        row['quantity'] = row['reorder_level'] * cover - row.pop('position')
+    return [row for row in rows if row['quantity'] > 0]
+
+
+def _unused_po_numbers(count):
+    """count new purchase order numbers in PurchaseOrder.save()'s PO<yymmdd><4 digits> format."""
+    date_part = now().strftime('%y%m%d')
+    numbers = set()
+    while len(numbers) < count:
+        candidates = {
+            f"PO{date_part}{get_random_string(4, allowed_chars='0123456789')}"
+            for _ in range(count - len(numbers))
+        } - numbers
+        taken = set(
+            PurchaseOrder.objects.filter(purchase_order_no__in=candidates).values_list('purchase_order_no', flat=True)
+        )
+        numbers |= candidates - taken
+    return list(numbers)
+
+
+def create_draft_orders(shortfalls, date=None, remarks='Draft from reorder scan'):
+    """
+    One draft purchase order per supplier for the given shortfalls (rows without a supplier
+    are ignored). Returns [(purchase_order_no, supplier_id, line count)].
+    """
+    by_supplier = defaultdict(list)
+    for row in shortfalls:
+        if row['supplier_id'] is not None:
+            by_supplier[row['supplier_id']].append(row)
+    if not by_supplier:
+        return []
+    date = date or now().date()
+
+    with transaction.atomic():
+        numbers = _unused_po_numbers(len(by_supplier))
+        orders = [
+            PurchaseOrder(
+                purchase_order_no=number,
+                date=date,
+                supplier_id=supplier_id,
+                status=PurchaseOrder.STATUS_DRAFT,
+                remarks=remarks,
+                outstanding_lines=len(rows),
+            )
+            for number, (supplier_id, rows) in zip(numbers, by_supplier.items())
+        ]
+        PurchaseOrder.objects.bulk_create(orders, batch_size=500)
+        ids = dict(
+            PurchaseOrder.objects.filter(purchase_order_no__in=numbers).values_list('purchase_order_no', 'id')
+        )
+        PurchaseOrderItem.objects.bulk_create(
+            [
+                PurchaseOrderItem(
+                    purchase_order_id=ids[order.purchase_order_no],
+                    item_code=row['mcode'],
+                    sku_code=row['sku_code'],
+                    sku_name=row['sku_name'],
+                    unit=row['unit'],
+                    full_quantity=row['quantity'],
+                    actual_quantity=0,
+                )
+                for order in orders
+                for row in by_supplier[order.supplier_id]
+            ],
+            batch_size=2000,
+        )
+    logger.info('Reorder scan: %s draft purchase orders, %s lines', len(orders), sum(map(len, by_supplier.values())))
+    return [(order.purchase_order_no, order.supplier_id, len(by_supplier[order.supplier_id])) for order in orders]
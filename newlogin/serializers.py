@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
+from django.utils.timezone import now
 from rest_framework import serializers
 
+from . import coupons, inventory
 from .models import (
     Branch,
     Cart,
@@ -9,6 +11,8 @@ from .models import (
     Coupon,
     CustomerAddress,
     Doctor,
+    GoodsReceipt,
+    GoodsReceiptItem,
     Item,
     ItemMedia,
     MedicalItem,
@@ -21,6 +25,8 @@ from .models import (
     PurchaseOrderItem,
     PasswordResetToken,
     Staff,
+    StockBalance,
+    StockMovement,
     Supplier,
     UserProfile,
 )
@@ -131,6 +137,8 @@ class MedicineSerializer(serializers.ModelSerializer):
 
 
 class CouponSerializer(serializers.ModelSerializer):
+    redemptions = serializers.SerializerMethodField(read_only=True)
+
     class Meta:
         model = Coupon
         fields = [
@@ -141,9 +149,17 @@ class CouponSerializer(serializers.ModelSerializer):
             'discount_pct',
             'status',
             'type',
+            'max_redemptions',
+            'max_per_customer',
+            'redemptions',
         ]
         read_only_fields = ['id']
 
+    def get_redemptions(self, obj):
+        # CouponViewSet annotates the total; a freshly saved coupon is summed here.
+        total = getattr(obj, 'redemption_total', None)
+        return coupons.redemption_count(obj.pk) if total is None else total
+
 
 class SupplierSerializer(serializers.ModelSerializer):
     class Meta:
@@ -395,6 +411,7 @@ class MedicalItemSerializer(serializers.ModelSerializer):
             'catcode',
             'package_count',
             'reorder_level',
+            'preferred_supplier',
             'mrp',
             'sell_discount',
             'storage_location1',
@@ -546,6 +563,12 @@ class ConfirmOrderSerializer(serializers.Serializer):
     payment_mode = serializers.ChoiceField(choices=PAYMENT_MODE_CHOICES)
 
 
+class ApplyCouponSerializer(serializers.Serializer):
+    """Input for POST /api/cart/coupon/apply/"""
+    order_no = serializers.CharField(max_length=20)
+    coupon = serializers.CharField(max_length=100)
+
+
 class AddItemToCartSerializer(serializers.Serializer):
     """Input for POST /api/cart/item/add/"""
     order_no = serializers.CharField(max_length=20)
@@ -570,6 +593,10 @@ class OnlineOrderItemSerializer(serializers.ModelSerializer):
 
 
 class PurchaseOrderItemSerializer(serializers.ModelSerializer):
+    # Writable on nested PO updates: lines sent with their id are updated in place,
+    # lines without one are added.
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = PurchaseOrderItem
         fields = [
@@ -582,7 +609,6 @@ class PurchaseOrderItemSerializer(serializers.ModelSerializer):
             'full_quantity',
             'actual_quantity',
         ]
-        read_only_fields = ['id']
 
 
 class PurchaseOrderSerializer(serializers.ModelSerializer):
@@ -605,28 +631,206 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
             'emp_code',
             'status',
             'remarks',
+            'outstanding_lines',
             'items',
         ]
-        read_only_fields = ['id', 'purchase_order_no']
+        read_only_fields = ['id', 'purchase_order_no', 'outstanding_lines']
 
     def create(self, validated_data):
+        from django.db import transaction
         items_data = validated_data.pop('items', [])
-        purchase_order = PurchaseOrder.objects.create(**validated_data)
-        for item_data in items_data:
-            PurchaseOrderItem.objects.create(purchase_order=purchase_order, **item_data)
+        with transaction.atomic():
+            purchase_order = PurchaseOrder.objects.create(**validated_data)
+            PurchaseOrderItem.objects.bulk_create([
+                PurchaseOrderItem(purchase_order=purchase_order, **{k: v for k, v in item_data.items() if k != 'id'})
+                for item_data in items_data
+            ])
+            if items_data:
+                purchase_order.refresh_outstanding_lines()
         return purchase_order
 
     def update(self, instance, validated_data):
+        """
+        `items`, when sent, is the full list of lines: lines with an `id` are updated in place
+        (only if something changed), lines without one are added and existing lines left out
+        are deleted. One bulk_update, one bulk_create and one delete, in a single transaction.
+        Sending `items` also recounts outstanding lines and re-derives `status`.
+        """
+        from django.db import transaction
         items_data = validated_data.pop('items', None)
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        if items_data is not None:
-            instance.items.all().delete()
-            for item_data in items_data:
-                PurchaseOrderItem.objects.create(purchase_order=instance, **item_data)
+        with transaction.atomic():
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+            if items_data is not None:
+                self._sync_items(instance, items_data)
+                instance.refresh_outstanding_lines()
         return instance
 
+    def _sync_items(self, instance, items_data):
+        existing = {line.id: line for line in PurchaseOrderItem.objects.filter(purchase_order=instance)}
+        unknown = [
+            item_data['id'] for item_data in items_data
+            if item_data.get('id') is not None and item_data['id'] not in existing
+        ]
+        if unknown:
+            raise serializers.ValidationError(
+                {'items': [f'Line {line_id} does not belong to this purchase order.' for line_id in unknown]}
+            )
+
+        to_create, to_update, changed_fields, kept_ids = [], [], set(), set()
+        for item_data in items_data:
+            line_id = item_data.pop('id', None)
+            if line_id is None:
+                to_create.append(PurchaseOrderItem(purchase_order=instance, **item_data))
+                continue
+            line = existing[line_id]
+            kept_ids.add(line_id)
+            changed = {attr for attr, value in item_data.items() if getattr(line, attr) != value}
+            if changed:
+                for attr in changed:
+                    setattr(line, attr, item_data[attr])
+                to_update.append(line)
+                changed_fields |= changed
+
+        removed_ids = existing.keys() - kept_ids
+        if removed_ids:
+            PurchaseOrderItem.objects.filter(id__in=removed_ids).delete()
+        if to_update:
+            PurchaseOrderItem.objects.bulk_update(to_update, sorted(changed_fields), batch_size=500)
+        if to_create:
+            PurchaseOrderItem.objects.bulk_create(to_create, batch_size=500)
+
+
+class GoodsReceiptItemSerializer(serializers.ModelSerializer):
+    # Plain id, not a PrimaryKeyRelatedField: that would cost one query per received line.
+    purchase_order_item = serializers.IntegerField(source='purchase_order_item_id')
+    quantity = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = GoodsReceiptItem
+        fields = ['id', 'purchase_order_item', 'quantity']
+        read_only_fields = ['id']
+
+
+class GoodsReceiptSerializer(serializers.ModelSerializer):
+    """
+    Input/output for goods receipts. The purchase order is passed to save() by the view
+    (POST /api/purchase-orders/{id}/receive/).
+    """
+    items = GoodsReceiptItemSerializer(many=True, allow_empty=False)
+    date = serializers.DateField(required=False)
+    purchase_order_no = serializers.CharField(source='purchase_order.purchase_order_no', read_only=True)
+
+    class Meta:
+        model = GoodsReceipt
+        fields = ['id', 'grn_no', 'purchase_order', 'purchase_order_no', 'date', 'emp', 'remarks', 'created_at', 'items']
+        read_only_fields = ['id', 'grn_no', 'purchase_order', 'created_at']
+
+    def create(self, validated_data):
+        """
+        Post the receipt in one transaction, in a fixed number of queries however many lines:
+        lock the received lines, insert the GRN and its lines, add the quantities to
+        `actual_quantity` with one F() update, then subtract the lines this receipt completed
+        from `outstanding_lines` and derive the PO status in the same UPDATE. Received medical
+        items are booked into stock (newlogin.inventory).
+        """
+        from collections import defaultdict
+        from django.db import transaction
+        from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+        items_data = validated_data.pop('items')
+        purchase_order = validated_data['purchase_order']
+        validated_data.setdefault('date', now().date())
+        received = defaultdict(int)
+        for item_data in items_data:
+            received[item_data['purchase_order_item_id']] += item_data['quantity']
+
+        with transaction.atomic():
+            lines = {
+                line.id: line
+                for line in PurchaseOrderItem.objects.select_for_update()
+                .filter(purchase_order=purchase_order, id__in=received)
+                .only('id', 'item_code', 'full_quantity', 'actual_quantity')
+            }
+            errors = []
+            for line_id, quantity in received.items():
+                line = lines.get(line_id)
+                if line is None:
+                    errors.append(f'Line {line_id} does not belong to purchase order {purchase_order.purchase_order_no}.')
+                elif line.actual_quantity + quantity > line.full_quantity:
+                    errors.append(
+                        f'Line {line_id}: receiving {quantity} exceeds the outstanding quantity '
+                        f'{line.full_quantity - line.actual_quantity}.'
+                    )
+            if errors:
+                raise serializers.ValidationError({'items': errors})
+            stocked = defaultdict(int)
+            for line_id, quantity in received.items():
+                if lines[line_id].item_code:
+                    stocked[lines[line_id].item_code] += quantity
+            completed = sum(
+                1 for line_id, quantity in received.items()
+                if lines[line_id].actual_quantity + quantity == lines[line_id].full_quantity
+            )
+
+            receipt = GoodsReceipt.objects.create(**validated_data)
+            GoodsReceiptItem.objects.bulk_create(
+                [GoodsReceiptItem(receipt=receipt, **item_data) for item_data in items_data],
+                batch_size=500,
+            )
+            line_ids = list(received)
+            for start in range(0, len(line_ids), 500):
+                batch = line_ids[start:start + 500]
+                PurchaseOrderItem.objects.filter(id__in=batch).update(
+                    actual_quantity=F('actual_quantity') + Case(
+                        *[When(id=line_id, then=Value(received[line_id])) for line_id in batch],
+                        default=Value(0),
+                        output_field=PositiveIntegerField(),
+                    )
+                )
+            # Case/When sees the pre-update counter, so this is the status after the receipt.
+            PurchaseOrder.objects.filter(pk=purchase_order.pk).update(
+                outstanding_lines=F('outstanding_lines') - completed,
+                status=Case(
+                    When(outstanding_lines__lte=completed, then=Value(PurchaseOrder.STATUS_FULL_DELIVED)),
+                    default=Value(PurchaseOrder.STATUS_PARTIALLY_DELIVED),
+                ),
+            )
+            inventory.record_receipt(stocked, receipt.grn_no)
+        purchase_order.refresh_from_db(fields=['outstanding_lines', 'status'])
+        return receipt
+
+
+class StockBalanceSerializer(serializers.ModelSerializer):
+    mcode = serializers.CharField(source='item.mcode', read_only=True)
+    sku_name = serializers.CharField(source='item.sku_name', read_only=True)
+
+    class Meta:
+        model = StockBalance
+        fields = ['id', 'mcode', 'sku_name', 'location', 'on_hand', 'updated_at']
+
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    mcode = serializers.CharField(source='item.mcode', read_only=True)
+
+    class Meta:
+        model = StockMovement
+        fields = ['id', 'mcode', 'location', 'quantity', 'kind', 'reference', 'created_at']
+
+
+class StockAdjustmentSerializer(serializers.Serializer):
+    """Input for POST /api/stock/adjust/. location defaults to the item's storage_location1."""
+    mcode = serializers.CharField(max_length=20)
+    quantity = serializers.IntegerField()
+    location = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    reason = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+
+    def validate_quantity(self, value):
+        if value == 0:
+            raise serializers.ValidationError('Quantity must not be 0.')
+        return value
+
 
 # ---- Auth (Register, Login, Forgot / Verify / Reset password) ----
 
@@ -673,16 +877,24 @@ class RegisterSerializer(serializers.Serializer):
             raise serializers.ValidationError('A user with this mobile number already exists.')
         return value
 
-    def create(self, validated_data):
+    @staticmethod
+    def new_password():
         from django.utils.crypto import get_random_string
+        return get_random_string(12, allowed_chars='abcdefghjkmnpqrstuvwxyzABCDEFGHJKMNPQRSTUVWXYZ23456789')
+
+    def create(self, validated_data):
+        from django.contrib.auth.hashers import make_password
         email = validated_data['email']
         name = validated_data['name']
         phone = validated_data['phone']
-        password = get_random_string(12, allowed_chars='abcdefghjkmnpqrstuvwxyzABCDEFGHJKMNPQRSTUVWXYZ23456789')
-        user = User.objects.create_user(
-            username=phone,
-            email=email,
-            password=password,
+        # The caller may pass a password and its hash (from save()) so the KDF can run on
+        # another thread; either way the hash is stored with the user before it is returned.
+        password = validated_data.get('password') or self.new_password()
+        encoded = validated_data.get('password_hash') or make_password(password)
+        user = User.objects.create(
+            username=User.normalize_username(phone),
+            email=User.objects.normalize_email(email),
+            password=encoded,
         )
         UserProfile.objects.create(user=user, name=name, phone=phone)
         return {'user': user, 'password': password}
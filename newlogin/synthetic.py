@@ -0,0 +1,320 @@
+"""
+Deterministic synthetic data for scale testing and benchmarks.
+
+Rows are written with bulk_create in batches and carry their generated codes (mcode,
+order_no, ...) directly, bypassing the per-row code-generation loops in Model.save().
+All randomness comes from the caller's random.Random, so a given seed always produces
+the same dataset. Synthetic rows are tagged with the SYN prefix in their codes.
+"""
+import re
+from datetime import date, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db.models import BigIntegerField, F, Max
+from django.db.models.functions import Cast, Substr
+
+from .models import (
+    Cart,
+    Category,
+    CustomerAddress,
+    MedicalItem,
+    MedicalItemMedia,
+    OnlineOrderItem,
+    PurchaseOrder,
+    PurchaseOrderItem,
+    Supplier,
+    UserProfile,
+)
+
+PREFIX = 'SYN'
+PAYMENT_MODES = ['COD', 'ONLINE', 'CARD', 'UPI']
+
+
+def _batches(total, batch_size):
+    for start in range(0, total, batch_size):
+        yield start, min(batch_size, total - start)
+
+
+def _next_sequence(model, field, prefix=''):
+    """
+    One past the highest N among field values that are exactly prefix + digits, e.g. mcode '42'
+    or SYNCUST0000000042. Compared as numbers, so hand-entered, unpadded or out-of-order codes
+    can't make the next batch collide with an existing one.
+    """
+    number = Substr(field, len(prefix) + 1) if prefix else F(field)
+    highest = model.objects.filter(**{f'{field}__regex': rf'^{re.escape(prefix)}[0-9]+$'}).aggregate(
+        n=Max(Cast(number, BigIntegerField()))
+    )['n']
+    return (highest or 0) + 1
+
+
+def seed_categories(count):
+    """Create count categories. Returns their ids."""
+    start = _next_sequence(Category, 'catcode')
+    Category.objects.bulk_create([
+        Category(catcode=str(start + i), name=f'{PREFIX} Category {start + i}', description='Synthetic')
+        for i in range(count)
+    ])
+    return list(
+        Category.objects.filter(catcode__in=[str(start + i) for i in range(count)]).values_list('id', flat=True)
+    )
+
+
+def seed_catalog(items, rng, batch_size=2000, categories=50, log=None):
+    """Create categories plus items MedicalItem rows with media. Returns the new mcodes."""
+    category_ids = seed_categories(categories)
+    start = _next_sequence(MedicalItem, 'mcode')
+    mcodes = []
+    for offset, size in _batches(items, batch_size):
+        rows = []
+        for i in range(offset, offset + size):
+            code = start + i
+            mrp = Decimal(rng.randint(500, 250000)) / 100
+            rows.append(MedicalItem(
+                mcode=str(code),
+                sku_name=f'{PREFIX} Item {code}',
+                sku_code=f'{PREFIX}-{code:09d}',
+                unit=rng.choice(['nos', 'strip', 'bottle', 'box']),
+                unit_prefix='ml' if rng.random() < 0.3 else None,
+                prefix_qty=rng.choice([None, 10, 100, 200]),
+                category_id=rng.choice(category_ids) if category_ids else None,
+                package_count=rng.choice([1, 1, 1, 10, 15]),
+                reorder_level=rng.randint(0, 50),
+                mrp=mrp,
+                sell_discount=Decimal(rng.choice([0, 0, 5, 10, 15])),
+                storage_location1=f'R{rng.randint(1, 40)}-S{rng.randint(1, 10)}',
+                hsn_code='3004',
+                description='Synthetic catalog item.',
+                basic_prize=(mrp * Decimal('0.7')).quantize(Decimal('0.01')),
+                gst=Decimal(rng.choice([5, 12, 18])),
+            ))
+        MedicalItem.objects.bulk_create(rows)
+        ids = dict(
+            MedicalItem.objects.filter(mcode__in=[r.mcode for r in rows]).values_list('mcode', 'id')
+        )
+        MedicalItemMedia.objects.bulk_create([
+            MedicalItemMedia(medical_item_id=ids[r.mcode], img1=f'medicalitem_images/{PREFIX.lower()}-{r.mcode}.jpg')
+            for r in rows
+        ])
+        mcodes.extend(r.mcode for r in rows)
+        if log:
+            log(f'  items: {offset + size}/{items}')
+    return mcodes
+
+
+DISTRICTS = ['Malappuram', 'Kozhikode', 'Thrissur', 'Palakkad', 'Ernakulam', 'Kannur']
+
+
+def seed_customers(count, rng, batch_size=2000, log=None):
+    """
+    Create count customers: User (unusable password), UserProfile and CustomerAddress.
+    Returns the new customer codes.
+    """
+    User = get_user_model()
+    prefix = f'{PREFIX}CUST'
+    start = _next_sequence(UserProfile, 'customer_code', prefix)
+    password = make_password(None)
+    codes = []
+    for offset, size in _batches(count, batch_size):
+        numbers = range(start + offset, start + offset + size)
+        User.objects.bulk_create([
+            User(username=f'{PREFIX.lower()}{n:010d}', email=f'{PREFIX.lower()}{n}@example.com', password=password)
+            for n in numbers
+        ])
+        user_ids = dict(
+            User.objects.filter(username__in=[f'{PREFIX.lower()}{n:010d}' for n in numbers]).values_list('username', 'id')
+        )
+        UserProfile.objects.bulk_create([
+            UserProfile(
+                user_id=user_ids[f'{PREFIX.lower()}{n:010d}'],
+                customer_code=f'{prefix}{n:010d}',
+                name=f'{PREFIX} Customer {n}',
+                phone=f'6{n % 10**9:09d}',
+            )
+            for n in numbers
+        ])
+        batch_codes = [f'{prefix}{n:010d}' for n in numbers]
+        profile_ids = dict(
+            UserProfile.objects.filter(customer_code__in=batch_codes).values_list('customer_code', 'id')
+        )
+        CustomerAddress.objects.bulk_create([
+            CustomerAddress(
+                profile_id=profile_ids[code],
+                name=f'{PREFIX} Customer {code[len(prefix):].lstrip("0")}',
+                prefix=rng.choice([c for c, _ in CustomerAddress.PREFIX_CHOICES]),
+                address=f'{rng.randint(1, 999)} Synthetic Road',
+                post='Kottakkal',
+                district=rng.choice(DISTRICTS),
+                state='Kerala',
+                pin=f'67{rng.randint(0, 9999):04d}',
+                country='India',
+            )
+            for code in batch_codes
+        ])
+        codes.extend(batch_codes)
+        if log:
+            log(f'  customers: {offset + size}/{count}')
+    return codes
+
+
+def seed_suppliers(count, rng):
+    """Create count suppliers. Returns their ids."""
+    prefix = f'{PREFIX}SUP'
+    start = _next_sequence(Supplier, 'supplier_code', prefix)
+    codes = [f'{prefix}{n:08d}' for n in range(start, start + count)]
+    Supplier.objects.bulk_create([
+        Supplier(
+            supplier_code=code,
+            name=f'{PREFIX} Supplier {code[len(prefix):].lstrip("0")}',
+            company=f'{PREFIX} Pharma {rng.randint(1, 99)}',
+            district=rng.choice(DISTRICTS),
+            state='Kerala',
+            country='India',
+        )
+        for code in codes
+    ])
+    return list(Supplier.objects.filter(supplier_code__in=codes).values_list('id', flat=True))
+
+
+def seed_purchase_orders(count, lines_per_order, rng, supplier_ids, batch_size=2000, days=365, log=None):
+    """
+    Create count PurchaseOrder rows with lines_per_order PurchaseOrderItem rows each, drawn
+    from the synthetic catalog. Returns the new purchase order numbers.
+    """
+    items = list(
+        MedicalItem.objects.filter(sku_code__startswith=f'{PREFIX}-').values_list('mcode', 'sku_code', 'sku_name', 'unit')
+    )
+    if not items or not supplier_ids:
+        raise ValueError('seed_purchase_orders needs a catalog and suppliers; seed them first.')
+    prefix = f'{PREFIX}PO'
+    start = _next_sequence(PurchaseOrder, 'purchase_order_no', prefix)
+    today = date.today()
+    statuses = [c for c, _ in PurchaseOrder.STATUS_CHOICES]
+    numbers = []
+    for offset, size in _batches(count, batch_size):
+        po_rows = [
+            PurchaseOrder(
+                purchase_order_no=f'{prefix}{n:010d}',
+                date=today - timedelta(days=rng.randrange(days)),
+                supplier_id=rng.choice(supplier_ids),
+                status=rng.choice(statuses),
+            )
+            for n in range(start + offset, start + offset + size)
+        ]
+        PurchaseOrder.objects.bulk_create(po_rows)
+        ids = dict(
+            PurchaseOrder.objects.filter(
+                purchase_order_no__in=[po.purchase_order_no for po in po_rows]
+            ).values_list('purchase_order_no', 'id')
+        )
+        line_rows = []
+        for po in po_rows:
+            for mcode, sku_code, sku_name, unit in rng.sample(items, min(lines_per_order, len(items))):
+                full = rng.randint(1, 20) * 10
+                if po.status == PurchaseOrder.STATUS_FULL_DELIVED:
+                    actual = full
+                elif po.status == PurchaseOrder.STATUS_PARTIALLY_DELIVED:
+                    actual = rng.randint(0, full)
+                else:
+                    actual = 0
+                line_rows.append(PurchaseOrderItem(
+                    purchase_order_id=ids[po.purchase_order_no],
+                    item_code=mcode,
+                    sku_code=sku_code,
+                    sku_name=sku_name,
+                    item_type=PurchaseOrderItem.TYPE_PNP,
+                    unit=unit,
+                    full_quantity=full,
+                    actual_quantity=actual,
+                ))
+        PurchaseOrderItem.objects.bulk_create(line_rows, batch_size=batch_size)
+        outstanding = {}
+        for line in line_rows:
+            outstanding[line.purchase_order_id] = outstanding.get(line.purchase_order_id, 0) + (
+                line.actual_quantity < line.full_quantity
+            )
+        for po in po_rows:
+            po.id = ids[po.purchase_order_no]
+            po.outstanding_lines = outstanding.get(po.id, 0)
+        PurchaseOrder.objects.bulk_update(po_rows, ['outstanding_lines'], batch_size=batch_size)
+        numbers.extend(po.purchase_order_no for po in po_rows)
+        if log:
+            log(f'  purchase orders: {offset + size}/{count}')
+    return numbers
+
+
+def _rate(rng):
+    return Decimal(rng.randint(500, 50000)) / 100
+
+
+def seed_orders(carts, lines, rng, mcodes, customer_codes, batch_size=2000, status='ORDERED',
+                days=365, log=None):
+    """
+    Create carts Cart rows with lines OnlineOrderItem rows spread across them (at least one
+    each). Carts get ccodes from customer_codes and dates over the last `days` days.
+    Returns the new order_nos.
+    """
+    if not mcodes:
+        raise ValueError('seed_orders needs a catalog; seed items first.')
+    last = _next_sequence(Cart, 'order_no', PREFIX) - 1
+    today = date.today()
+    per_cart = max(1, lines // max(1, carts))
+    extra = max(0, lines - per_cart * carts)
+    order_nos = []
+    for offset, size in _batches(carts, batch_size):
+        cart_rows = []
+        for i in range(offset, offset + size):
+            cart_rows.append(Cart(
+                order_no=f'{PREFIX}{last + i + 1:012d}',
+                date=today - timedelta(days=rng.randrange(days)),
+                time=time(rng.randrange(24), rng.randrange(60), rng.randrange(60)),
+                ccode=rng.choice(customer_codes) if customer_codes else None,
+                inv_no=f'{PREFIX}INV{last + i + 1:012d}' if status != 'CART' else None,
+                delivery_status=status,
+                payment_mode=rng.choice(PAYMENT_MODES) if status != 'CART' else None,
+            ))
+        Cart.objects.bulk_create(cart_rows)
+        ids = dict(
+            Cart.objects.filter(order_no__in=[c.order_no for c in cart_rows]).values_list('order_no', 'id')
+        )
+        line_rows = []
+        totals = {}
+        for i, cart in enumerate(cart_rows):
+            count = per_cart + (1 if offset + i < extra else 0)
+            cart_total = Decimal('0')
+            for mcode in rng.sample(mcodes, min(count, len(mcodes))):
+                qty = rng.randint(1, 5)
+                rate = _rate(rng)
+                line_rows.append(OnlineOrderItem(
+                    cart_id=ids[cart.order_no], item_code=mcode, qty=qty, rate=rate, amt=qty * rate,
+                ))
+                cart_total += qty * rate
+            totals[cart.order_no] = cart_total
+        OnlineOrderItem.objects.bulk_create(line_rows, batch_size=batch_size)
+        if status != 'CART':
+            for cart in cart_rows:
+                cart.id = ids[cart.order_no]
+                cart.total_amount = cart.net_amount = totals[cart.order_no]
+            Cart.objects.bulk_update(cart_rows, ['total_amount', 'net_amount'], batch_size=batch_size)
+        order_nos.extend(c.order_no for c in cart_rows)
+        if log:
+            log(f'  carts: {offset + size}/{carts}')
+    return order_nos
+
+
+def synthetic_mcodes():
+    """mcodes of the synthetic catalog items already in the database."""
+    return list(MedicalItem.objects.filter(sku_code__startswith=f'{PREFIX}-').values_list('mcode', flat=True))
+
+
+def synthetic_counts():
+    """Row counts of the synthetic dataset already in the database."""
+    return {
+        'items': MedicalItem.objects.filter(sku_code__startswith=f'{PREFIX}-').count(),
+        'carts': Cart.objects.filter(order_no__startswith=PREFIX).exclude(delivery_status='CART').count(),
+        'order_lines': OnlineOrderItem.objects.filter(
+            cart__order_no__startswith=PREFIX
+        ).exclude(cart__delivery_status='CART').count(),
+    }
@@ -1,3 +1,939 @@
-from django.test import TestCase
+import hashlib
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.throttling import SimpleRateThrottle
+
+from login.middleware import QueryBudgetExceeded, ReplicaRoutingMiddleware
+
+from . import analytics, background, coupons, inventory, invoices, otp_utils, reorder
+from .authentication import CachedTokenAuthentication, bump_user_version, token_cache
+from .throttling import phone_key
+from .views import AdminOrderListAPIView
+from .models import (
+    BestsellerRank, Cart, Category, Coupon, CouponRedemption, CouponUsageShard, CustomerAddress, DailySalesRollup,
+    GoodsReceipt, InvoiceDocument, MedicalItem, OneTimePassword, OnlineOrderItem, PasswordResetToken, PurchaseOrder,
+    PurchaseOrderItem, StockBalance, StockMovement, Supplier, UserProfile,
+)
+
+HAS_REPLICA = 'replica' in settings.DATABASES
+# With DB_REPLICA_NAME set the replica is a separate, empty test database: views under test read the primary.
+read_primary = mock.patch.object(ReplicaRoutingMiddleware, '_replica_safe', mock.Mock(return_value=False))
+
+
+@override_settings(OTP_VERIFIED_RETENTION_SECONDS=3600, OTP_MAX_ROWS=0)
+class OtpPurgeTests(TestCase):
+    def otp(self, expires_in, verified_ago=None):
+        current = now()
+        return OneTimePassword.objects.create(
+            mobile_number='9876543210', code='123456', expires_at=current + timedelta(seconds=expires_in),
+            verified_at=None if verified_ago is None else current - timedelta(seconds=verified_ago),
+        )
+
+    def test_purges_expired_and_old_verified_in_batches(self):
+        stale = [self.otp(-60) for _ in range(4)] + [self.otp(300, verified_ago=7200)]
+        live = [self.otp(300), self.otp(300, verified_ago=60)]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(otp_utils.purge_otps(batch_size=2), (5, 0))
+        self.assertEqual(sum(query['sql'].startswith('DELETE') for query in queries), 3)
+        self.assertFalse(OneTimePassword.objects.filter(pk__in=[otp.pk for otp in stale]).exists())
+        self.assertEqual(set(OneTimePassword.objects.values_list('pk', flat=True)), {otp.pk for otp in live})
+
+    def test_trims_the_oldest_rows_over_max_rows(self):
+        live = [self.otp(300) for _ in range(5)]
+        self.assertEqual(otp_utils.purge_otps(batch_size=2, max_rows=3), (0, 2))
+        self.assertEqual(set(OneTimePassword.objects.values_list('pk', flat=True)), {otp.pk for otp in live[2:]})
+        self.assertEqual(otp_utils.purge_otps(max_rows=3), (0, 0))
+
+    @override_settings(OTP_PURGE_INTERVAL_SECONDS=300, BACKGROUND_WORKERS=0)
+    def test_maybe_purge_runs_once_per_interval(self):
+        otp_utils._last_purge = 0.0
+        self.otp(-60)
+        with self.captureOnCommitCallbacks(execute=True):
+            otp_utils.maybe_purge_otps()
+        self.assertFalse(OneTimePassword.objects.exists())
+        self.otp(-60)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            otp_utils.maybe_purge_otps()
+        self.assertEqual(callbacks, [])
+        self.assertEqual(OneTimePassword.objects.count(), 1)
+
+
+@mock.patch.object(SimpleRateThrottle, 'THROTTLE_RATES', {'otp_ip': '3/hour', 'otp_mobile': '2/hour', 'otp_email': '2/hour'})
+class SendOtpThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def send_otp(self, mobile, email, ip='198.51.100.1'):
+        return self.client.post(
+            '/api/auth/send-otp/', {'mobileNumber': mobile, 'email': email},
+            content_type='application/json', REMOTE_ADDR=ip,
+        )
+
+    def test_per_mobile_number(self):
+        self.assertEqual(self.send_otp('+91 98765 43210', 'a@example.com', ip='198.51.100.1').status_code, 200)
+        self.assertEqual(self.send_otp('9876543210', 'b@example.com', ip='198.51.100.2').status_code, 200)
+        self.assertEqual(self.send_otp('098765-43210', 'c@example.com', ip='198.51.100.3').status_code, 429)
+        self.assertEqual(OneTimePassword.objects.count(), 2)
+
+    def test_per_email(self):
+        self.assertEqual(self.send_otp('9000000001', 'a@example.com', ip='198.51.100.1').status_code, 200)
+        self.assertEqual(self.send_otp('9000000002', 'A@Example.com', ip='198.51.100.2').status_code, 200)
+        self.assertEqual(self.send_otp('9000000003', 'a@example.com', ip='198.51.100.3').status_code, 429)
+        self.assertEqual(OneTimePassword.objects.count(), 2)
+
+    def test_per_ip(self):
+        for n in range(3):
+            self.assertEqual(self.send_otp(f'900000000{n}', f'{n}@example.com').status_code, 200)
+        self.assertEqual(self.send_otp('9000000009', 'new@example.com').status_code, 429)
+        self.assertEqual(OneTimePassword.objects.count(), 3)
+
+    def test_phone_key(self):
+        self.assertEqual(phone_key('+91 (987) 654-3210'), '9876543210')
+        self.assertEqual(phone_key('9876543210'), '9876543210')
+        self.assertEqual(phone_key('Admin'), 'admin')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(username='9876543210', password='old-password')
+        UserProfile.objects.create(user=self.user, name='Asha')
+        self.key = Token.objects.create(user=self.user).key
+        self.auth = CachedTokenAuthentication()
+
+    def authenticate(self):
+        return self.auth.authenticate_credentials(self.key)[0]
+
+    def test_repeat_tokens_are_served_from_the_cache(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate().profile.name, 'Asha')
+
+    def test_each_request_gets_its_own_user_and_profile(self):
+        self.authenticate()
+        first = self.authenticate()
+        first.profile.name = 'Changed by one request'
+        second = self.authenticate()
+        self.assertIsNot(second, first)
+        self.assertIsNot(second.profile, first.profile)
+        self.assertEqual(second.profile.name, 'Asha')
+        self.assertIs(second.profile.user, second)
+
+    def test_logout_invalidates_the_token(self):
+        self.authenticate()
+        response = self.client.post('/api/auth/logout/', HTTP_AUTHORIZATION=f'Token {self.key}')
+        self.assertEqual(response.status_code, 200)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_password_reset_reloads_the_user(self):
+        self.authenticate()
+        reset = PasswordResetToken.objects.create(user=self.user)
+        response = self.client.post(
+            '/api/auth/reset-password/', {'token': reset.token, 'new_password': 'new-password'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.authenticate().check_password('new-password'))
+
+    def test_account_delete_invalidates_the_token(self):
+        self.authenticate()
+        response = self.client.post('/api/auth/register-delete/', HTTP_AUTHORIZATION=f'Token {self.key}')
+        self.assertEqual(response.status_code, 200)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_version_bump_from_another_worker(self):
+        self.authenticate()
+        # Another worker bumps the shared stamp; this process's entry is left as it was.
+        with mock.patch.object(token_cache, 'invalidate_user'):
+            bump_user_version(self.user.pk)
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+
+class RegisterTests(TestCase):
+    def test_password_is_stored_before_it_is_returned(self):
+        response = self.client.post(
+            '/api/auth/register/', {'name': 'Asha', 'email': 'asha@example.com', 'mobileNumber': '9876543210'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        user = get_user_model().objects.get(username='9876543210')
+        self.assertTrue(user.check_password(response.json()['password']))
+
+    @override_settings(BACKGROUND_WORKERS=2)
+    async def test_run_in_pool_uses_the_worker_pool(self):
+        name = await background.run_in_pool(lambda: threading.current_thread().name)
+        self.assertTrue(name.startswith('newlogin-bg'), name)
+        with self.assertRaises(ZeroDivisionError):
+            await background.run_in_pool(lambda: 1 / 0)
+
+
+@skipUnless(HAS_REPLICA, 'set DB_REPLICA_NAME to run the read-replica tests')
+class ReplicaRoutingTests(TestCase):
+    """Primary and replica are separate test databases here, so a replica read can't see a new row."""
+    databases = {'default', 'replica'} if HAS_REPLICA else {'default'}
+
+    def setUp(self):
+        cache.clear()
+
+    def categories(self, client):
+        response = client.get('/api/categories/')
+        self.assertEqual(response.status_code, 200)
+        return {row['name'] for row in response.json()}
+
+    def create_category(self, client, name):
+        response = client.post('/api/categories/', {'name': name}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_reads_go_to_the_replica(self):
+        Category.objects.create(name='PRIMARY')
+        self.assertEqual(self.categories(self.client), set())
+
+    def test_client_reads_its_own_writes(self):
+        writer = self.client_class(HTTP_AUTHORIZATION='Token writer')
+        self.create_category(writer, 'MINE')
+        self.assertIn('MINE', self.categories(writer))
+        # Other clients are not pinned and still read the replica.
+        self.assertNotIn('MINE', self.categories(self.client_class(HTTP_AUTHORIZATION='Token other')))
+
+    def test_pin_is_not_shared_by_forwarded_for(self):
+        self.create_category(self.client_class(HTTP_X_FORWARDED_FOR='203.0.113.7'), 'ANON')
+        reader = self.client_class(HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertNotIn('ANON', self.categories(reader))
+
+
+@read_primary
+class AdminOrderListTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_user(username='admin', password='x', is_staff=True))
+
+    def test_status_filter_is_case_insensitive_and_statuses_are_kept(self):
+        for delivery_status in ('Ordered', 'ORDERED', 'delivered', 'CART'):
+            Cart.objects.create(delivery_status=delivery_status)
+        response = self.client.get('/api/admin/orders/', {'status': 'ordered'})
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(self.client.get('/api/admin/orders/').json()['count'], 3)
+        self.assertEqual(
+            sorted(Cart.objects.values_list('delivery_status', flat=True)), ['CART', 'ORDERED', 'Ordered', 'delivered'],
+        )
+
+    def test_cart_api_stores_the_status_as_sent(self):
+        cart = Cart.objects.create()
+        response = self.client.patch(f'/api/carts/{cart.pk}/', {'delivery_status': 'Shipped'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['delivery_status'], 'Shipped')
+
+
+@read_primary
+@override_settings(QUERY_PROFILING=True, QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(TestCase):
+    """The budgeted views stay within query_budget; session and token queries don't count."""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(get_user_model().objects.create_user(username='admin', password='x', is_staff=True))
+        category = Category.objects.create(name='PAIN')
+        self.item = MedicalItem.objects.create(sku_name='Paracetamol', sku_code='PCM', unit='strip', category=category)
+        user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='x')
+        profile = UserProfile.objects.create(user=user, name='Buyer', phone='9876543210')
+        CustomerAddress.objects.create(
+            profile=profile, prefix='Mr', address='1 Main St', post='Post', district='District',
+            state='State', pin='600001', country='India',
+        )
+        for quantity in (1, 2, 3):
+            cart = Cart.objects.create(
+                ccode=profile.customer_code, delivery_status='ORDERED', payment_mode='COD', date=now().date(),
+            )
+            OnlineOrderItem.objects.create(cart=cart, item_code=self.item.mcode, qty=quantity, rate=10, amt=10 * quantity)
+        BestsellerRank.objects.create(window_days=30, rank=1, item=self.item, units=6, computed_at=now())
+        BestsellerRank.objects.create(window_days=30, category=category, rank=1, item=self.item, units=6, computed_at=now())
+
+    def get(self, path, client=None, **params):
+        with self.assertLogs('login.query_profile') as logs:
+            response = (client or self.client).get(path, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertFalse(json.loads(logs.records[0].getMessage())['over_budget'])
+        return response
+
+    def test_admin_order_list(self):
+        self.assertEqual(self.get('/api/admin/orders/').json()['count'], 3)
+        self.get('/api/admin/orders/', status='ordered')
+        token = Token.objects.create(user=get_user_model().objects.get(username='admin'))
+        self.get('/api/admin/orders/', client=self.client_class(HTTP_AUTHORIZATION=f'Token {token.key}'))
+
+    def test_admin_order_detail(self):
+        cart = Cart.objects.exclude(order_no='').first()
+        self.assertEqual(self.get(f'/api/admin/orders/{cart.order_no}/').json()['customer']['name'], 'Buyer')
+        self.get(f'/api/admin/orders/{cart.pk}/')
+
+    def test_catalog(self):
+        self.get('/api/medicalitems/')
+        self.get(f'/api/medicalitems/{self.item.pk}/')
+
+    def test_bestsellers(self):
+        self.assertEqual(self.get('/api/medicalitems/bestsellers/').json()[0]['rank'], 1)
+        self.get('/api/medicalitems/bestsellers/', category=self.item.category.catcode)
+
+    async def test_catalog_under_asgi(self):
+        with self.assertLogs('login.query_profile'):
+            response = await self.async_client.get('/api/medicalitems/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    def test_view_queries_over_budget_raise(self):
+        with mock.patch.object(AdminOrderListAPIView, 'query_budget', 0):
+            with self.assertLogs('login.query_profile', 'WARNING'), self.assertRaisesMessage(QueryBudgetExceeded, 'budget is 0'):
+                self.client.get('/api/admin/orders/')
+
+    @override_settings(QUERY_PROFILING=False)
+    def test_profiling_off(self):
+        with mock.patch.object(AdminOrderListAPIView, 'query_budget', 0), self.assertNoLogs('login.query_profile'):
+            self.assertNotIn('Server-Timing', self.client.get('/api/admin/orders/'))
+
+
+class PurchaseOrderFixtures:
+    def purchase_order(self, *lines):
+        """An issued PO with one line per (item_code, full_quantity)."""
+        purchase_order = PurchaseOrder.objects.create(date=now().date(), supplier=Supplier.objects.create(name='Supplier'))
+        for item_code, full_quantity in lines:
+            PurchaseOrderItem.objects.create(purchase_order=purchase_order, item_code=item_code, full_quantity=full_quantity)
+        purchase_order.refresh_outstanding_lines()
+        return purchase_order
+
+    def receive(self, purchase_order, quantities):
+        """POST a goods receipt of {line: quantity}."""
+        return self.client.post(
+            f'/api/purchase-orders/{purchase_order.pk}/receive/',
+            {'items': [{'purchase_order_item': line.pk, 'quantity': quantity} for line, quantity in quantities.items()]},
+            content_type='application/json',
+        )
+
+
+class GoodsReceiptTests(PurchaseOrderFixtures, TestCase):
+    def test_receipts_maintain_purchase_order_status(self):
+        purchase_order = self.purchase_order(('P1', 10), ('P2', 5))
+        first, second = purchase_order.items.order_by('id')
+        self.assertEqual(purchase_order.outstanding_lines, 2)
+
+        self.assertEqual(self.receive(purchase_order, {first: 10, second: 2}).status_code, 201)
+        purchase_order.refresh_from_db()
+        self.assertEqual(purchase_order.status, PurchaseOrder.STATUS_PARTIALLY_DELIVED)
+        self.assertEqual(purchase_order.outstanding_lines, 1)
+
+        self.assertEqual(self.receive(purchase_order, {second: 3}).status_code, 201)
+        purchase_order.refresh_from_db()
+        self.assertEqual(purchase_order.status, PurchaseOrder.STATUS_FULL_DELIVED)
+        self.assertEqual(purchase_order.outstanding_lines, 0)
+        self.assertEqual(list(purchase_order.items.order_by('id').values_list('actual_quantity', flat=True)), [10, 5])
+        self.assertEqual(GoodsReceipt.objects.filter(purchase_order=purchase_order).count(), 2)
+
+    def test_over_receipt_is_rejected(self):
+        purchase_order = self.purchase_order(('P1', 10))
+        line = purchase_order.items.get()
+        self.assertEqual(self.receive(purchase_order, {line: 4}).status_code, 201)
+
+        response = self.receive(purchase_order, {line: 7})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exceeds the outstanding quantity 6', response.json()['items'][0])
+        line.refresh_from_db()
+        self.assertEqual(line.actual_quantity, 4)
+        self.assertEqual(GoodsReceipt.objects.filter(purchase_order=purchase_order).count(), 1)
+
+    def test_lines_of_another_purchase_order_are_rejected(self):
+        purchase_order = self.purchase_order(('P1', 10))
+        other_line = self.purchase_order(('P1', 10)).items.get()
+        response = self.receive(purchase_order, {other_line: 1})
+        self.assertEqual(response.status_code, 400)
+        other_line.refresh_from_db()
+        self.assertEqual(other_line.actual_quantity, 0)
+
+
+class PurchaseOrderUpdateTests(PurchaseOrderFixtures, TestCase):
+    def patch(self, purchase_order, items):
+        return self.client.patch(f'/api/purchase-orders/{purchase_order.pk}/', {'items': items}, content_type='application/json')
+
+    def test_patch_updates_adds_and_removes_lines(self):
+        purchase_order = self.purchase_order(('P1', 10), ('P2', 5), ('P3', 7))
+        kept, changed, removed = purchase_order.items.order_by('id')
+        response = self.patch(purchase_order, [
+            {'id': kept.pk, 'item_code': 'P1', 'full_quantity': 10},
+            {'id': changed.pk, 'item_code': 'P2', 'full_quantity': 8},
+            {'item_code': 'P4', 'full_quantity': 2},
+        ])
+        self.assertEqual(response.status_code, 200)
+
+        lines = {line.item_code: line for line in purchase_order.items.all()}
+        self.assertEqual(sorted(lines), ['P1', 'P2', 'P4'])
+        self.assertEqual((lines['P1'].pk, lines['P1'].full_quantity), (kept.pk, 10))
+        self.assertEqual((lines['P2'].pk, lines['P2'].full_quantity), (changed.pk, 8))
+        self.assertNotIn(lines['P4'].pk, {kept.pk, changed.pk, removed.pk})
+        self.assertFalse(PurchaseOrderItem.objects.filter(pk=removed.pk).exists())
+        self.assertEqual({row['item_code']: row['id'] for row in response.json()['items']}, {code: line.pk for code, line in lines.items()})
+        purchase_order.refresh_from_db()
+        self.assertEqual(purchase_order.outstanding_lines, 3)
+
+    def test_unchanged_lines_are_not_written(self):
+        purchase_order = self.purchase_order(('P1', 10), ('P2', 5))
+        items = [{'id': line.pk, 'item_code': line.item_code, 'full_quantity': line.full_quantity} for line in purchase_order.items.all()]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.patch(purchase_order, items).status_code, 200)
+        table = PurchaseOrderItem._meta.db_table
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('UPDATE', 'INSERT', 'DELETE')) and table in q['sql']]
+        self.assertEqual(writes, [])
+
+    def test_lines_of_another_purchase_order_are_rejected(self):
+        purchase_order = self.purchase_order(('P1', 10))
+        other_line = self.purchase_order(('P1', 4)).items.get()
+        response = self.patch(purchase_order, [{'id': other_line.pk, 'item_code': 'P1', 'full_quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['items'], [f'Line {other_line.pk} does not belong to this purchase order.'])
+        other_line.refresh_from_db()
+        self.assertEqual(other_line.full_quantity, 4)
+        self.assertEqual(purchase_order.items.get().full_quantity, 10)
+
+
+class OrderFixtures:
+    def confirm(self, quantity, coupon=None):
+        """Confirm an order of quantity x self.item at 10 each, with coupon on the cart, through the API."""
+        user = get_user_model().objects.create_user(username=f'buyer{Cart.objects.count()}', password='x')
+        profile = UserProfile.objects.create(user=user, name='Buyer')
+        address = CustomerAddress.objects.create(
+            profile=profile, prefix='Mr', address='1 Main St', post='Post', district='District',
+            state='State', pin='600001', country='India',
+        )
+        cart = Cart.objects.create(ccode=profile.customer_code, coupon=coupon)
+        OnlineOrderItem.objects.create(cart=cart, item_code=self.item.mcode, qty=quantity, rate=10, amt=10 * quantity)
+        response = self.client.post(
+            '/api/orders/confirm/',
+            {'order_no': cart.order_no, 'address_id': address.pk, 'payment_mode': 'COD'},
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}',
+        )
+        cart.refresh_from_db()
+        return response, cart
+
+
+class StockLedgerTests(PurchaseOrderFixtures, OrderFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.item = MedicalItem.objects.create(sku_name='Paracetamol', sku_code='PCM', unit='strip', storage_location1='A1')
+
+    def balances(self, item=None):
+        return dict(StockBalance.objects.filter(item=item or self.item).values_list('location', 'on_hand'))
+
+    def assertBalancesMatchLedger(self):
+        for location, on_hand in self.balances().items():
+            moved = sum(StockMovement.objects.filter(item=self.item, location=location).values_list('quantity', flat=True))
+            self.assertEqual(on_hand, moved, location)
+
+    def test_receipt_books_stock_into_the_main_location(self):
+        purchase_order = self.purchase_order((self.item.mcode, 10), ('NOT-STOCKED', 3))
+        lines = {line.item_code: line for line in purchase_order.items.all()}
+        self.receive(purchase_order, {lines[self.item.mcode]: 6, lines['NOT-STOCKED']: 3})
+        self.receive(purchase_order, {lines[self.item.mcode]: 4})
+
+        self.assertEqual(self.balances(), {'A1': 10})
+        self.assertEqual(inventory.on_hand(self.item.pk), 10)
+        grn_nos = set(GoodsReceipt.objects.values_list('grn_no', flat=True))
+        movements = StockMovement.objects.filter(item=self.item)
+        self.assertEqual(set(movements.values_list('reference', flat=True)), grn_nos)
+        self.assertEqual(set(movements.values_list('kind', flat=True)), {StockMovement.KIND_RECEIPT})
+        self.assertEqual(StockMovement.objects.count(), 2)
+
+    def test_sale_takes_from_the_fullest_location_first(self):
+        inventory.record_adjustment(self.item, 3)
+        inventory.record_adjustment(self.item, 5, location='B2')
+        inventory.record_sale({self.item.mcode: 6}, 'ORD1')
+
+        self.assertEqual(self.balances(), {'A1': 2, 'B2': 0})
+        self.assertEqual(
+            sorted(StockMovement.objects.filter(kind=StockMovement.KIND_SALE).values_list('location', 'quantity')),
+            [('A1', -1), ('B2', -5)],
+        )
+        self.assertBalancesMatchLedger()
+
+    def test_sale_without_enforcement_goes_negative(self):
+        inventory.record_adjustment(self.item, 2, location='B2')
+        inventory.record_sale({self.item.mcode: 5}, 'ORD1')
+        self.assertEqual(self.balances(), {'A1': -3, 'B2': 0})
+        self.assertEqual(inventory.on_hand(self.item.pk), -3)
+        self.assertBalancesMatchLedger()
+
+    @override_settings(INVENTORY_ENFORCE_STOCK=True)
+    def test_enforced_sale_refuses_a_shortage(self):
+        inventory.record_adjustment(self.item, 2)
+        with self.assertRaises(inventory.InsufficientStock) as raised:
+            inventory.record_sale({self.item.mcode: 5}, 'ORD1')
+        self.assertEqual(raised.exception.shortages, {self.item.mcode: (5, 2)})
+        self.assertEqual(self.balances(), {'A1': 2})
+        self.assertFalse(StockMovement.objects.filter(kind=StockMovement.KIND_SALE).exists())
+
+    @override_settings(INVENTORY_ENFORCE_STOCK=True)
+    def test_confirm_books_the_sale(self):
+        inventory.record_adjustment(self.item, 5)
+        response, cart = self.confirm(3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(cart.delivery_status, 'ORDERED')
+        self.assertEqual(self.balances(), {'A1': 2})
+        self.assertEqual(
+            list(StockMovement.objects.filter(reference=cart.order_no).values_list('kind', 'quantity')),
+            [(StockMovement.KIND_SALE, -3)],
+        )
+
+        response, cart = self.confirm(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['items'], [{'mcode': self.item.mcode, 'qty': 3, 'available': 2}])
+        self.assertEqual(cart.delivery_status, 'CART')
+        self.assertEqual(self.balances(), {'A1': 2})
+        self.assertFalse(StockMovement.objects.filter(reference=cart.order_no).exists())
+        self.assertBalancesMatchLedger()
+
+    def test_stock_endpoints_are_staff_only(self):
+        adjustment = {'mcode': self.item.mcode, 'quantity': 4, 'reason': 'Opening stock'}
+        customer = get_user_model().objects.create_user(username='customer', password='x')
+        for client in (self.client, self.client_class(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=customer).key}')):
+            self.assertEqual(client.post('/api/stock/adjust/', adjustment, content_type='application/json').status_code, 403)
+            self.assertEqual(client.get('/api/stock/balances/').status_code, 403)
+            self.assertEqual(client.get('/api/stock/movements/').status_code, 403)
+        self.assertFalse(StockMovement.objects.exists())
+
+        self.client.force_login(get_user_model().objects.create_user(username='admin', password='x', is_staff=True))
+        response = self.client.post('/api/stock/adjust/', adjustment, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['on_hand'], 4)
+        self.assertEqual(self.client.get('/api/stock/balances/', {'mcode': self.item.mcode}).status_code, 200)
+        self.assertEqual(self.client.get('/api/stock/movements/').status_code, 200)
+
+
+class ReorderTests(TestCase):
+    def setUp(self):
+        self.acme, self.zenith = Supplier.objects.create(name='Acme'), Supplier.objects.create(name='Zenith')
+
+    def item(self, code, reorder_level=10, on_hand=0, **fields):
+        item = MedicalItem.objects.create(
+            sku_name=code, sku_code=code, unit='strip', storage_location1='A1', reorder_level=reorder_level, **fields,
+        )
+        if on_hand:
+            inventory.record_adjustment(item, on_hand)
+        return item
+
+    def purchase_order(self, supplier, lines, date=None, status=PurchaseOrder.STATUS_ISSUED):
+        """A PO with one line per (item, full_quantity, actual_quantity)."""
+        purchase_order = PurchaseOrder.objects.create(date=date or now().date(), supplier=supplier, status=status)
+        for item, full_quantity, actual_quantity in lines:
+            PurchaseOrderItem.objects.create(
+                purchase_order=purchase_order, item_code=item.mcode, full_quantity=full_quantity, actual_quantity=actual_quantity,
+            )
+        purchase_order.refresh_outstanding_lines()
+        return purchase_order
+
+    def shortfalls(self, **kwargs):
+        return {row['sku_code']: row for row in reorder.find_shortfalls(**kwargs)}
+
+    def test_shortfall_tops_the_position_up_to_the_cover(self):
+        low = self.item('LOW', on_hand=4, preferred_supplier=self.acme)
+        self.item('AT-LEVEL', on_hand=10)
+        self.item('ABOVE', on_hand=11)
+        self.item('UNTRACKED', reorder_level=0)
+
+        self.assertEqual(sorted(self.shortfalls()), ['AT-LEVEL', 'LOW'])
+        row = self.shortfalls()['LOW']
+        self.assertEqual((row['on_hand'], row['on_order'], row['quantity'], row['supplier_id']), (4, 0, 16, self.acme.pk))
+        self.assertEqual(self.shortfalls(cover=3)['LOW']['quantity'], 26)
+        self.assertEqual(self.shortfalls(cover=3)['AT-LEVEL']['quantity'], 20)
+        self.assertEqual(sorted(self.shortfalls(supplier_id=self.acme.pk)), [low.sku_code])
+
+    def test_open_orders_count_as_on_order(self):
+        drafted = self.item('DRAFTED', on_hand=2)
+        issued = self.item('ISSUED', on_hand=2)
+        partial = self.item('PARTIAL', on_hand=2)
+        delivered = self.item('DELIVERED', on_hand=2)
+        self.purchase_order(self.acme, [(drafted, 6, 0)], status=PurchaseOrder.STATUS_DRAFT)
+        self.purchase_order(self.acme, [(issued, 6, 0)])
+        self.purchase_order(self.acme, [(partial, 10, 4), (delivered, 3, 0)])
+        self.purchase_order(self.acme, [(delivered, 6, 6)])
+
+        shortfalls = self.shortfalls()
+        self.assertEqual({code: row['on_order'] for code, row in shortfalls.items()}, {
+            'DRAFTED': 6, 'ISSUED': 6, 'PARTIAL': 6, 'DELIVERED': 3,
+        })
+        self.assertEqual({code: row['quantity'] for code, row in shortfalls.items()}, {
+            'DRAFTED': 12, 'ISSUED': 12, 'PARTIAL': 12, 'DELIVERED': 15,
+        })
+
+        self.assertEqual(len(reorder.create_draft_orders(shortfalls.values())), 1)
+        # The drafts just created are on order, so a second scan has nothing to add.
+        self.assertEqual(reorder.find_shortfalls(), [])
+        self.assertEqual(reorder.create_draft_orders(reorder.find_shortfalls()), [])
+        self.assertEqual(PurchaseOrder.objects.filter(status=PurchaseOrder.STATUS_DRAFT).count(), 2)
+
+    def test_one_draft_per_supplier(self):
+        preferred = self.item('PREFERRED', preferred_supplier=self.acme)
+        overridden = self.item('OVERRIDDEN', preferred_supplier=self.acme)
+        last_po = self.item('LAST-PO')
+        self.item('NO-SUPPLIER')
+        # Delivered history: the latest PO line's supplier is the fallback, the preferred supplier wins.
+        self.purchase_order(self.acme, [(last_po, 5, 5)], date=now().date() - timedelta(days=30))
+        self.purchase_order(self.zenith, [(last_po, 5, 5), (overridden, 5, 5)], date=now().date() - timedelta(days=7))
+
+        shortfalls = reorder.find_shortfalls()
+        self.assertEqual(len(shortfalls), 4)
+        created = reorder.create_draft_orders(shortfalls)
+        self.assertEqual(sorted((supplier_id, count) for _, supplier_id, count in created), [(self.acme.pk, 2), (self.zenith.pk, 1)])
+
+        drafts = PurchaseOrder.objects.filter(status=PurchaseOrder.STATUS_DRAFT)
+        self.assertEqual(set(drafts.values_list('purchase_order_no', flat=True)), {number for number, _, _ in created})
+        lines = PurchaseOrderItem.objects.filter(purchase_order__in=drafts).values_list(
+            'purchase_order__supplier_id', 'item_code', 'full_quantity',
+        )
+        self.assertEqual(sorted(lines), sorted([
+            (self.acme.pk, preferred.mcode, 20), (self.acme.pk, overridden.mcode, 20), (self.zenith.pk, last_po.mcode, 20),
+        ]))
+        self.assertEqual(set(drafts.values_list('outstanding_lines', flat=True)), {1, 2})
+
+
+@read_primary
+class SalesReportTests(OrderFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='PAIN')
+        self.item = MedicalItem.objects.create(sku_name='Paracetamol', sku_code='PCM', unit='strip', category=category)
+
+    def rollups(self):
+        return sorted(DailySalesRollup.objects.values_list('date', 'dimension', 'key', 'units', 'revenue', 'orders'))
+
+    def test_confirm_records_what_rebuild_computes(self):
+        self.confirm(3, coupon=Coupon.objects.create(name='SAVE10', discount_pct=10))
+        self.confirm(2)
+        self.item = MedicalItem.objects.create(sku_name='Bandage', sku_code='BND', unit='roll')
+        self.confirm(1)
+        recorded = self.rollups()
+        # Two items, their two categories ('' for none) and the one payment mode.
+        self.assertEqual(len(recorded), 5)
+
+        today = now().date()
+        analytics.rebuild(today, today)
+        self.assertEqual(self.rollups(), recorded)
+
+    def test_report_is_staff_only(self):
+        self.confirm(3)
+        customer = get_user_model().objects.get(username__startswith='buyer')
+        self.client.force_login(customer)
+        self.assertEqual(self.client.get('/api/reports/sales/').status_code, 403)
+
+        self.client.force_login(get_user_model().objects.create_user(username='admin', password='x', is_staff=True))
+        response = self.client.get('/api/reports/sales/', {'by': 'item'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['key'], row['units']) for row in response.json()['results']], [(self.item.mcode, 3)])
+
+
+@read_primary
+class BestsellerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = now().date()
+        self.pain, self.skin = Category.objects.create(name='PAIN'), Category.objects.create(name='SKIN')
+        self.items = {
+            code: MedicalItem.objects.create(sku_name=code, sku_code=code, unit='strip', category=category)
+            for code, category in (('A', self.pain), ('B', self.pain), ('C', self.skin), ('D', None))
+        }
+
+    def sold(self, code, units, days_ago=0, revenue=None):
+        DailySalesRollup.objects.create(
+            date=self.today - timedelta(days=days_ago), dimension=DailySalesRollup.DIMENSION_ITEM,
+            key=self.items[code].mcode, units=units, revenue=10 * units if revenue is None else revenue,
+        )
+
+    def ranked(self, window, category=None):
+        ranks = BestsellerRank.objects.filter(window_days=window, category=category).order_by('rank')
+        return [(rank.item.sku_code, rank.units) for rank in ranks]
+
+    def bestsellers(self, **params):
+        response = self.client.get('/api/medicalitems/bestsellers/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['sku_code'] for row in response.json()]
+
+    def test_refresh_ranks_each_window_and_category(self):
+        self.sold('A', 5)
+        self.sold('B', 3)
+        self.sold('B', 10, days_ago=20)
+        self.sold('C', 4, days_ago=60)
+        self.sold('D', 1, revenue=50)
+        self.sold('C', 1, days_ago=1)
+        self.sold('A', 99, days_ago=90)  # just outside the widest window
+
+        analytics.refresh_bestsellers(today=self.today)
+        self.assertEqual(self.ranked(7), [('A', 5), ('B', 3), ('D', 1), ('C', 1)])
+        self.assertEqual(self.ranked(30), [('B', 13), ('A', 5), ('D', 1), ('C', 1)])
+        self.assertEqual(self.ranked(90), [('B', 13), ('A', 5), ('C', 5), ('D', 1)])
+        self.assertEqual(self.ranked(7, self.pain), [('A', 5), ('B', 3)])
+        self.assertEqual(self.ranked(90, self.skin), [('C', 5)])
+
+        analytics.refresh_bestsellers(top=2, per_category=1, today=self.today)
+        self.assertEqual(self.ranked(90), [('B', 13), ('A', 5)])
+        self.assertEqual(self.ranked(90, self.pain), [('B', 13)])
+        self.assertEqual(self.ranked(90, self.skin), [('C', 5)])
+
+    def test_endpoint_filters_by_window_and_category(self):
+        self.sold('A', 5)
+        self.sold('B', 10, days_ago=20)
+        self.sold('C', 4, days_ago=60)
+        analytics.refresh_bestsellers(today=self.today)
+
+        self.assertEqual(self.bestsellers(window=7), ['A'])
+        self.assertEqual(self.bestsellers(), ['B', 'A'])
+        self.assertEqual(self.bestsellers(window=90), ['B', 'A', 'C'])
+        self.assertEqual(self.bestsellers(window=90, category=self.pain.catcode), ['B', 'A'])
+        self.assertEqual(self.bestsellers(window=90, category=self.skin.catcode), ['C'])
+        response = self.client.get('/api/medicalitems/bestsellers/', {'window': 90})
+        self.assertEqual([(row['rank'], row['units_sold']) for row in response.json()], [(1, 10), (2, 5), (3, 4)])
+        self.assertEqual(self.client.get('/api/medicalitems/bestsellers/', {'window': 14}).status_code, 400)
+        self.assertEqual(self.client.get('/api/medicalitems/bestsellers/', {'limit': 'ten'}).status_code, 400)
+
+    def test_limit_is_capped(self):
+        item = self.items['A']
+        BestsellerRank.objects.bulk_create([
+            BestsellerRank(window_days=30, rank=rank, item=item, units=100 - rank, computed_at=now()) for rank in range(1, 61)
+        ])
+        self.assertEqual(len(self.bestsellers(limit=2)), 2)
+        self.assertEqual(len(self.bestsellers()), 20)
+        self.assertEqual(len(self.bestsellers(limit=500)), 50)
+        self.assertEqual(len(self.bestsellers(limit=0)), 1)
+
+    def test_one_query_then_cached(self):
+        self.sold('A', 5)
+        self.sold('B', 3)
+        analytics.refresh_bestsellers(today=self.today)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.bestsellers(), ['A', 'B'])
+
+        BestsellerRank.objects.filter(item=self.items['B']).update(rank=0)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.bestsellers(), ['A', 'B'])
+        # Each window, category and limit is cached separately.
+        self.assertEqual(self.bestsellers(limit=5), ['B', 'A'])
+
+
+@override_settings(STORAGES={**settings.STORAGES, 'invoices': {'BACKEND': 'django.core.files.storage.InMemoryStorage'}})
+class InvoiceTests(OrderFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.item = MedicalItem.objects.create(sku_name='Paracetamol', sku_code='PCM', unit='strip')
+        self.cart = self.confirm(3)[1]
+        self.customer = get_user_model().objects.get(username__startswith='buyer')
+        self.url = f'/api/orders/{self.cart.order_no}/invoice.pdf'
+
+    def test_render_is_stored_by_content_and_upserted(self):
+        document = invoices.render_invoice(self.cart.pk)
+        with invoices.open_document(document) as pdf:
+            content = pdf.read()
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertEqual((document.sha256, document.size), (hashlib.sha256(content).hexdigest(), len(content)))
+
+        # Same order data, same bytes: the row is kept and the ETag doesn't change.
+        self.assertEqual(invoices.render_invoice(self.cart.pk).sha256, document.sha256)
+        Cart.objects.filter(pk=self.cart.pk).update(courier_amount=40)
+        changed = invoices.render_invoice(self.cart.pk)
+        self.assertNotEqual(changed.sha256, document.sha256)
+        self.assertEqual(list(InvoiceDocument.objects.values_list('cart_id', 'sha256')), [(self.cart.pk, changed.sha256)])
+        self.assertIsNone(invoices.render_invoice(Cart.objects.create().pk))
+
+    def test_upsert_without_a_conflict_target(self):
+        # MySQL can't name the conflicting column (NotSupportedError); cart is implied there.
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(InvoiceDocument.objects, 'bulk_create') as bulk_create:
+            invoices.render_invoice(self.cart.pk)
+        self.assertIsNone(bulk_create.call_args.kwargs['unique_fields'])
+        self.assertTrue(bulk_create.call_args.kwargs['update_conflicts'])
+
+    def test_customer_gets_the_pdf_then_not_modified(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(response.content).hexdigest()}"')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+        revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b'')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_byte_ranges(self):
+        self.client.force_login(self.customer)
+        full = self.client.get(self.url)
+        content, size = full.content, len(full.content)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual((response.status_code, response.content), (206, content[:10]))
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{size}')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual((response.status_code, response.content), (206, content[-5:]))
+        self.assertEqual(response['Content-Range'], f'bytes {size - 5}-{size - 1}/{size}')
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes=10-{size + 100}')
+        self.assertEqual((response.status_code, response.content), (206, content[10:]))
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+        # A range against an older version gets the whole current file.
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, response.content), (200, content))
+
+    def test_only_the_customer_or_staff_can_read_it(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        other = get_user_model().objects.create_user(username='other', password='x')
+        UserProfile.objects.create(user=other, name='Other')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(get_user_model().objects.create_user(username='nobody', password='x'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        token = Token.objects.get(user=self.customer)
+        self.assertEqual(self.client_class(HTTP_AUTHORIZATION=f'Token {token.key}').get(self.url).status_code, 200)
+        self.client.force_login(get_user_model().objects.create_user(username='admin', password='x', is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        cart = Cart.objects.create()
+        self.assertEqual(self.client.get(f'/api/orders/{cart.order_no}/invoice.pdf').status_code, 404)
+
+
+class ConfirmOrderCouponTests(OrderFixtures, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.item = MedicalItem.objects.create(sku_name='Paracetamol', sku_code='PCM', unit='strip', storage_location1='A1')
+
+    def test_confirm_applies_and_redeems_the_carts_coupon(self):
+        coupon = Coupon.objects.create(name='SAVE10', discount_pct=10)
+        # A newer coupon with the same code must not stand in for the one on the cart.
+        Coupon.objects.create(name='save10', discount_pct=50, type=Coupon.TYPE_EXISTING)
+        response, cart = self.confirm(3, coupon=coupon)
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(cart.coupon_id)
+
+        Coupon.objects.filter(name='save10').delete()
+        response, cart = self.confirm(3, coupon=coupon)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((cart.discount, cart.total_amount), (Decimal('3.00'), Decimal('27.00')))
+        self.assertEqual(coupons.redemption_count(coupon.pk), 1)
+
+    def test_withdrawn_coupon_is_removed_and_nothing_is_booked(self):
+        coupon = Coupon.objects.create(name='SAVE10', discount_pct=10, status=Coupon.STATUS_INACTIVE)
+        response, cart = self.confirm(3, coupon=coupon)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('no longer valid', response.json()['error'])
+        self.assertEqual((cart.delivery_status, cart.coupon_id, cart.discount), ('CART', None, 0))
+        self.assertEqual(coupons.redemption_count(coupon.pk), 0)
+        self.assertFalse(StockMovement.objects.exists())
+
+
+@override_settings(COUPON_COUNTER_SHARDS=4)
+class CouponRedemptionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def coupon(self, **limits):
+        return Coupon.objects.create(name='SAVE10', discount_pct=10, type=Coupon.TYPE_EXISTING, **limits)
+
+    def capacities(self, coupon):
+        return list(CouponUsageShard.objects.filter(coupon=coupon).values_list('capacity', flat=True))
+
+    def test_per_customer_limit(self):
+        coupon = self.coupon(max_per_customer=2)
+        coupons.redeem(coupon, 'C1')
+        coupons.redeem(coupon, 'C1')
+        with self.assertRaisesMessage(coupons.CouponError, 'can be used 2 times per customer'):
+            coupons.redeem(coupon, 'C1')
+        coupons.redeem(coupon, 'C2')
+        self.assertEqual(CouponRedemption.objects.get(coupon=coupon, customer_code='C1').count, 2)
+        self.assertEqual(coupons.redemption_count(coupon.pk), 3)
+
+    def test_total_limit(self):
+        coupon = self.coupon(max_redemptions=3)
+        for customer_code in ('C1', 'C2', 'C3'):
+            coupons.redeem(coupon, customer_code)
+        with self.assertRaisesMessage(coupons.CouponError, 'has been fully redeemed'):
+            coupons.redeem(coupon, 'C4')
+        # The refused redemption counts nothing, for the customer either.
+        self.assertEqual(coupons.redemption_count(coupon.pk), 3)
+        self.assertFalse(CouponRedemption.objects.filter(coupon=coupon, customer_code='C4').exists())
+
+    def test_shards_are_rebalanced_when_the_limit_changes(self):
+        coupon = self.coupon(max_redemptions=10)
+        self.assertEqual(sum(self.capacities(coupon)), 10)
+        for customer_code in ('C1', 'C2', 'C3'):
+            coupons.redeem(coupon, customer_code)
+
+        coupon.max_redemptions = 5
+        coupon.save()
+        self.assertEqual(sum(self.capacities(coupon)), 5)
+        for shard in CouponUsageShard.objects.filter(coupon=coupon):
+            self.assertGreaterEqual(shard.capacity, shard.used)
+        coupons.redeem(coupon, 'C4')
+        coupons.redeem(coupon, 'C5')
+        with self.assertRaises(coupons.CouponError):
+            coupons.redeem(coupon, 'C6')
+
+        # Below what is already used: no stripe has room left.
+        coupon.max_redemptions = 2
+        coupon.save()
+        for shard in CouponUsageShard.objects.filter(coupon=coupon):
+            self.assertEqual(shard.capacity, shard.used)
+        with self.assertRaises(coupons.CouponError):
+            coupons.redeem(coupon, 'C7')
+
+        coupon.max_redemptions = None
+        coupon.save()
+        self.assertEqual(self.capacities(coupon), [None] * 4)
+        coupons.redeem(coupon, 'C7')
+        self.assertEqual(coupons.redemption_count(coupon.pk), 6)
+
+    def concurrent_first_use(self, coupon, customer_code):
+        """
+        Another confirm inserts the customer's row just after redeem()'s first UPDATE found
+        none, so redeem()'s own insert hits the unique constraint.
+        """
+        CouponRedemption.objects.create(coupon=coupon, customer_code=customer_code, count=1)
+        update = QuerySet.update
+        missed = []
+
+        def update_before_other_confirm(queryset, **kwargs):
+            if queryset.model is CouponRedemption and not missed:
+                missed.append(queryset)
+                return 0
+            return update(queryset, **kwargs)
+
+        return mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update_before_other_confirm)
+
+    def test_concurrent_first_use_counts_against_the_other_row(self):
+        coupon = self.coupon(max_per_customer=2)
+        with self.concurrent_first_use(coupon, 'C1'):
+            coupons.redeem(coupon, 'C1')
+        self.assertEqual(CouponRedemption.objects.get(coupon=coupon, customer_code='C1').count, 2)
+        self.assertEqual(coupons.redemption_count(coupon.pk), 1)
+
+    def test_concurrent_first_use_at_the_limit_is_refused(self):
+        coupon = self.coupon(max_per_customer=1)
+        with self.concurrent_first_use(coupon, 'C1'), self.assertRaisesMessage(coupons.CouponError, 'already used'):
+            coupons.redeem(coupon, 'C1')
+        self.assertEqual(CouponRedemption.objects.get(coupon=coupon, customer_code='C1').count, 1)
+        self.assertEqual(coupons.redemption_count(coupon.pk), 0)
@@ -0,0 +1,113 @@
+"""
+Sliding-window throttles for the unauthenticated auth endpoints (send-otp, login, identify-customer).
+
+Built on DRF's SimpleRateThrottle, which keeps a per-key list of request timestamps in the
+Django cache (CACHES['default']). Throttles run in APIView.initial(), so rejected requests
+never reach the DB or the email/SMS notification path. Rates live in
+REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].
+
+Phone numbers are keyed by their last PHONE_KEY_DIGITS digits, so "+91 98765 43210",
+"098765-43210" and "9876543210" share one budget.
+"""
+import json
+import re
+
+from django.http.request import RawPostDataException
+from rest_framework.throttling import SimpleRateThrottle
+
+# National number length (India); a longer number's extra leading digits are the country or
+# trunk prefix.
+PHONE_KEY_DIGITS = 10
+
+_PHONE = re.compile(r'\+?[\d\s().-]+')
+
+
+def phone_key(value):
+    """Digits-only national number for values that look like a phone number; else lower-cased."""
+    if _PHONE.fullmatch(value):
+        digits = re.sub(r'\D', '', value)
+        if digits:
+            return digits[-PHONE_KEY_DIGITS:]
+    return value.lower()
+
+
+def _request_field(request, names):
+    """Return the first non-empty value among names from the request body (JSON or form)."""
+    data = request.data
+    if not data:
+        try:
+            data = json.loads(request.body.decode('utf-8')) if request.body else None
+        except (RawPostDataException, ValueError, UnicodeDecodeError):
+            data = None
+    if not hasattr(data, 'get'):
+        return None
+    for name in names:
+        value = data.get(name)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return None
+
+
+class ClientIpRateThrottle(SimpleRateThrottle):
+    """Throttle by client IP (X-Forwarded-For aware via DRF's NUM_PROXIES handling)."""
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class RequestFieldRateThrottle(SimpleRateThrottle):
+    """Throttle by a normalized request body field; requests without the field are not throttled here."""
+    fields = ()
+
+    def normalize(self, value):
+        return value.lower()
+
+    def get_cache_key(self, request, view):
+        value = _request_field(request, self.fields)
+        if value is None:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.normalize(value)}
+
+
+class PhoneFieldRateThrottle(RequestFieldRateThrottle):
+    """Throttle by a phone number field (or a username that is one), keyed by phone_key()."""
+
+    def normalize(self, value):
+        return phone_key(value)
+
+
+class SendOtpIpThrottle(ClientIpRateThrottle):
+    scope = 'otp_ip'
+
+
+class SendOtpMobileThrottle(PhoneFieldRateThrottle):
+    scope = 'otp_mobile'
+    fields = ('mobileNumber',)
+
+
+class SendOtpEmailThrottle(RequestFieldRateThrottle):
+    scope = 'otp_email'
+    fields = ('email',)
+
+
+class LoginIpThrottle(ClientIpRateThrottle):
+    scope = 'login_ip'
+
+
+class LoginUsernameThrottle(PhoneFieldRateThrottle):
+    scope = 'login_username'
+    fields = ('username',)
+
+
+class IdentifyCustomerIpThrottle(ClientIpRateThrottle):
+    scope = 'identify_ip'
+
+
+class IdentifyCustomerMobileThrottle(PhoneFieldRateThrottle):
+    scope = 'identify_mobile'
+    fields = ('mobileNumber',)
+
+
+SEND_OTP_THROTTLES = [SendOtpIpThrottle, SendOtpMobileThrottle, SendOtpEmailThrottle]
+LOGIN_THROTTLES = [LoginIpThrottle, LoginUsernameThrottle]
+IDENTIFY_CUSTOMER_THROTTLES = [IdentifyCustomerIpThrottle, IdentifyCustomerMobileThrottle]
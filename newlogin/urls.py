@@ -6,6 +6,7 @@ from .views import (
     AdminLoginAPIView,
     AdminOrderDetailAPIView,
     AdminOrderListAPIView,
+    ApplyCouponAPIView,
     BranchViewSet,
     CartViewSet,
     ConfirmOrderAPIView,
@@ -17,25 +18,34 @@ from .views import (
     CompanyViewSet,
     CustomerAddressAPIView,
     DoctorViewSet,
+    ExportAPIView,
     ForgotPasswordAPIView,
+    GoodsReceiptViewSet,
     IdentifyCustomerAPIView,
     MedicalItemViewSet,
     SendOtpAPIView,
     VerifyOtpAPIView,
     LoginAPIView,
+    LogoutAPIView,
+    OrderInvoiceAPIView,
     OrderSummaryAPIView,
     PatientViewSet,
     PurchaseOrderViewSet,
     RegisterAPIView,
     RegisterDeleteAPIView,
     ResetPasswordAPIView,
+    SalesReportAPIView,
     StaffViewSet,
+    StockAdjustmentAPIView,
+    StockBalanceViewSet,
+    StockMovementViewSet,
     SupplierViewSet,
     VerifyPasswordAPIView,
 )
 
 router = DefaultRouter(trailing_slash='/?')
 router.register(r'purchase-orders', PurchaseOrderViewSet, basename='purchaseorder')
+router.register(r'goods-receipts', GoodsReceiptViewSet, basename='goodsreceipt')
 router.register(r'suppliers', SupplierViewSet, basename='supplier')
 router.register(r'categories', CategoryViewSet, basename='category')
 router.register(r'companies', CompanyViewSet, basename='company')
@@ -46,6 +56,8 @@ router.register(r'patients', PatientViewSet, basename='patient')
 router.register(r'medicalitems', MedicalItemViewSet, basename='medicalitem')
 router.register(r'carts', CartViewSet, basename='cart')
 router.register(r'coupons', CouponViewSet, basename='coupon')
+router.register(r'stock/balances', StockBalanceViewSet, basename='stockbalance')
+router.register(r'stock/movements', StockMovementViewSet, basename='stockmovement')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -59,16 +71,24 @@ urlpatterns = [
     path('cart/item/delete', DeleteCartItemAPIView.as_view(), name='cart-item-delete-no-slash'),
     path('cart/summary/', OrderSummaryAPIView.as_view(), name='cart-summary'),
     path('cart/summary', OrderSummaryAPIView.as_view(), name='cart-summary-no-slash'),
+    path('cart/coupon/apply/', ApplyCouponAPIView.as_view(), name='cart-coupon-apply'),
+    path('cart/coupon/apply', ApplyCouponAPIView.as_view(), name='cart-coupon-apply-no-slash'),
     path('customer/address/', CustomerAddressAPIView.as_view(), name='customer-address'),
     path('customer/address', CustomerAddressAPIView.as_view(), name='customer-address-no-slash'),
+    path('stock/adjust/', StockAdjustmentAPIView.as_view(), name='stock-adjust'),
+    path('stock/adjust', StockAdjustmentAPIView.as_view(), name='stock-adjust-no-slash'),
     path('orders/confirm/', ConfirmOrderAPIView.as_view(), name='orders-confirm'),
     path('orders/confirm', ConfirmOrderAPIView.as_view(), name='orders-confirm-no-slash'),
+    path('orders/<str:order_no>/invoice.pdf', OrderInvoiceAPIView.as_view(), name='order-invoice'),
     path('admin/login/', AdminLoginAPIView.as_view(), name='admin-login'),
     path('admin/login', AdminLoginAPIView.as_view(), name='admin-login-no-slash'),
     path('admin/orders/', AdminOrderListAPIView.as_view(), name='admin-order-list'),
     path('admin/orders', AdminOrderListAPIView.as_view(), name='admin-order-list-no-slash'),
     path('admin/orders/<str:order_id>/', AdminOrderDetailAPIView.as_view(), name='admin-order-detail'),
     path('admin/orders/<str:order_id>', AdminOrderDetailAPIView.as_view(), name='admin-order-detail-no-slash'),
+    path('reports/sales/', SalesReportAPIView.as_view(), name='reports-sales'),
+    path('reports/sales', SalesReportAPIView.as_view(), name='reports-sales-no-slash'),
+    path('exports/<slug:dataset>.<slug:file_format>', ExportAPIView.as_view(), name='exports'),
     path('auth/register/', RegisterAPIView.as_view(), name='register'),
     path('auth/register', RegisterAPIView.as_view(), name='register-no-slash'),
     path('auth/register-delete/', RegisterDeleteAPIView.as_view(), name='register-delete'),
@@ -79,6 +99,8 @@ urlpatterns = [
     path('auth/login/%20/', LoginAPIView.as_view(), name='login-trailing-space-encoded-slash'),
     path('auth/login/ ', LoginAPIView.as_view(), name='login-trailing-space'),
     path('auth/login/ /', LoginAPIView.as_view(), name='login-trailing-space-slash'),
+    path('auth/logout/', LogoutAPIView.as_view(), name='logout'),
+    path('auth/logout', LogoutAPIView.as_view(), name='logout-no-slash'),
     path('auth/forgot-password/', ForgotPasswordAPIView.as_view(), name='forgot-password'),
     path('auth/forgot-password', ForgotPasswordAPIView.as_view(), name='forgot-password-no-slash'),
     path('auth/identify-customer/', IdentifyCustomerAPIView.as_view(), name='identify-customer'),
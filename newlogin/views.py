@@ -1,18 +1,25 @@
+import asyncio
 import json
 from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model
-from django.db.models import Q, Sum
-from datetime import datetime
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Upper
+from datetime import date, datetime
 from django.utils.crypto import get_random_string
 from django.utils.timezone import now
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.authtoken.models import Token
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.parsers import JSONParser
 from rest_framework.views import APIView
-from rest_framework.authentication import TokenAuthentication, SessionAuthentication
+from rest_framework.authentication import SessionAuthentication
 
 
 class PlainTextJSONParser(JSONParser):
@@ -20,13 +27,16 @@ class PlainTextJSONParser(JSONParser):
     media_type = 'text/plain'
 
 from .models import (
+    BestsellerRank,
     Branch,
     Cart,
     Category,
     Company,
     Coupon,
+    CouponUsageShard,
     CustomerAddress,
     Doctor,
+    GoodsReceipt,
     Item,
     MedicalItem,
     Medicine,
@@ -36,11 +46,19 @@ from .models import (
     PasswordResetToken,
     PurchaseOrder,
     Staff,
+    StockBalance,
+    StockMovement,
     Supplier,
     UserProfile,
 )
+from . import analytics, coupons, exports, inventory, invoices
+from .async_views import AsyncAPIView, AsyncReadModelMixin, AsyncViewSetMixin
+from .authentication import CachedTokenAuthentication
+from .background import run_in_pool
+from .throttling import IDENTIFY_CUSTOMER_THROTTLES, LOGIN_THROTTLES, SEND_OTP_THROTTLES
 from .serializers import (
     AddItemToCartSerializer,
+    ApplyCouponSerializer,
     BranchSerializer,
     CartItemIdentifySerializer,
     CartSerializer,
@@ -54,6 +72,7 @@ from .serializers import (
     CouponSerializer,
     DoctorSerializer,
     ForgotPasswordSerializer,
+    GoodsReceiptSerializer,
     MedicalItemSerializer,
     MedicineSerializer,
     AdminLoginSerializer,
@@ -67,6 +86,9 @@ from .serializers import (
     RegisterSerializer,
     ResetPasswordSerializer,
     SendOtpSerializer,
+    StockAdjustmentSerializer,
+    StockBalanceSerializer,
+    StockMovementSerializer,
     VerifyOtpSerializer,
     StaffSerializer,
     SupplierSerializer,
@@ -81,9 +103,10 @@ class CompanyViewSet(viewsets.ModelViewSet):
     serializer_class = CompanySerializer
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(AsyncViewSetMixin, AsyncReadModelMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all().order_by('-id')
     serializer_class = CategorySerializer
+    read_replica_actions = ('list', 'retrieve', 'catcodes', 'medicines')
 
     @action(detail=False, methods=['get'], url_path='catcodes')
     def catcodes(self, request):
@@ -121,9 +144,44 @@ class PatientViewSet(viewsets.ModelViewSet):
     serializer_class = PatientSerializer
 
 
-class MedicalItemViewSet(viewsets.ModelViewSet):
-    queryset = MedicalItem.objects.all().order_by('-id').select_related('media')
+class MedicalItemViewSet(AsyncViewSetMixin, AsyncReadModelMixin, viewsets.ModelViewSet):
+    queryset = MedicalItem.objects.all().order_by('-id').select_related('media', 'category')
     serializer_class = MedicalItemSerializer
+    read_replica_actions = ('list', 'retrieve', 'bestsellers')
+    query_budget = {'list': 1, 'retrieve': 1, 'bestsellers': 1}
+
+    @action(detail=False, methods=['get'], url_path='bestsellers')
+    def bestsellers(self, request):
+        """
+        GET /api/medicalitems/bestsellers/?window=30&category=<catcode>&limit=20 – top items by
+        units sold over the last 7/30/90 days (refresh_bestsellers), with media, cached briefly.
+        """
+        try:
+            window = int(request.query_params.get('window', 30))
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 50)
+        except ValueError:
+            return Response({'error': 'window and limit must be numbers.'}, status=status.HTTP_400_BAD_REQUEST)
+        if window not in analytics.BESTSELLER_WINDOWS:
+            return Response(
+                {'error': f'window must be one of {", ".join(map(str, analytics.BESTSELLER_WINDOWS))}.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        catcode = request.query_params.get('category', '').strip()
+
+        # Media URLs are absolute, so the host is part of the key.
+        cache_key = f'bestsellers:{window}:{catcode}:{limit}:{request.build_absolute_uri("/")}'
+        data = cache.get(cache_key)
+        if data is None:
+            ranks = BestsellerRank.objects.filter(window_days=window).select_related('item__media', 'item__category')
+            if catcode:
+                ranks = ranks.filter(category__catcode=catcode)
+            else:
+                ranks = ranks.filter(category__isnull=True)
+            ranks = list(ranks.order_by('rank')[:limit])
+            items = self.get_serializer([rank.item for rank in ranks], many=True).data
+            data = [{'rank': rank.rank, 'units_sold': rank.units, **item} for rank, item in zip(ranks, items)]
+            cache.set(cache_key, data, settings.BESTSELLERS_CACHE_TTL)
+        return Response(data)
 
 
 class SupplierViewSet(viewsets.ModelViewSet):
@@ -135,6 +193,105 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
     queryset = PurchaseOrder.objects.all().order_by('-id').prefetch_related('items').select_related('supplier', 'emp')
     serializer_class = PurchaseOrderSerializer
 
+    @action(detail=True, methods=['post'], url_path='receive')
+    def receive(self, request, pk=None):
+        """POST /api/purchase-orders/{id}/receive/ – post a goods receipt (GRN) against this PO's lines."""
+        purchase_order = PurchaseOrder.objects.filter(pk=pk).first()
+        if not purchase_order:
+            return Response(
+                {'error': f'Purchase order with id "{pk}" not found.'},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        if purchase_order.status == PurchaseOrder.STATUS_DRAFT:
+            return Response(
+                {'error': 'Draft purchase orders must be issued before goods can be received.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        serializer = GoodsReceiptSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        receipt = serializer.save(purchase_order=purchase_order)
+        return Response(
+            {
+                'message': 'Goods receipt posted.',
+                'receipt': serializer.data,
+                'status': purchase_order.status,
+                'outstanding_lines': purchase_order.outstanding_lines,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class GoodsReceiptViewSet(viewsets.ReadOnlyModelViewSet):
+    """Posted goods receipts; created through POST /api/purchase-orders/{id}/receive/."""
+    queryset = GoodsReceipt.objects.all().order_by('-id').prefetch_related('items').select_related('purchase_order')
+    serializer_class = GoodsReceiptSerializer
+
+
+class StockBalanceViewSet(viewsets.ReadOnlyModelViewSet):
+    """GET /api/stock/balances/ – on-hand quantity per item and location; ?mcode= filters to one item."""
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+    queryset = StockBalance.objects.all().select_related('item').order_by('item_id', 'location')
+    serializer_class = StockBalanceSerializer
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        mcode = self.request.query_params.get('mcode')
+        return qs.filter(item__mcode=mcode) if mcode else qs
+
+
+class StockMovementViewSet(viewsets.ReadOnlyModelViewSet):
+    """GET /api/stock/movements/ – the stock ledger, newest first; ?mcode= and ?reference= filter."""
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+    queryset = StockMovement.objects.all().select_related('item').order_by('-id')
+    serializer_class = StockMovementSerializer
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        mcode = self.request.query_params.get('mcode')
+        reference = self.request.query_params.get('reference')
+        if mcode:
+            qs = qs.filter(item__mcode=mcode)
+        if reference:
+            qs = qs.filter(reference=reference)
+        return qs
+
+
+class StockAdjustmentAPIView(APIView):
+    """POST /api/stock/adjust/ – book a manual stock correction or opening stock for one item."""
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+    parser_classes = [JSONParser, PlainTextJSONParser]
+
+    def post(self, request):
+        serializer = StockAdjustmentSerializer(data=_parse_post_json(request))
+        serializer.is_valid(raise_exception=True)
+        mcode = serializer.validated_data['mcode']
+        product = MedicalItem.objects.filter(mcode=mcode).first()
+        if not product:
+            return Response(
+                {'error': f'Medical item with mcode "{mcode}" not found in medical item master.'},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        try:
+            movement = inventory.record_adjustment(
+                product,
+                serializer.validated_data['quantity'],
+                location=serializer.validated_data.get('location'),
+                reason=serializer.validated_data['reason'],
+            )
+        except inventory.InsufficientStock as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {
+                'message': 'Stock adjusted.',
+                'movement': StockMovementSerializer(movement).data,
+                'on_hand': inventory.on_hand(product.id),
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
 
 class CartViewSet(viewsets.ModelViewSet):
     queryset = Cart.objects.all().order_by('-id')
@@ -142,7 +299,15 @@ class CartViewSet(viewsets.ModelViewSet):
 
 
 class CouponViewSet(viewsets.ModelViewSet):
-    queryset = Coupon.objects.all().order_by('-id')
+    queryset = Coupon.objects.annotate(
+        redemption_total=Coalesce(
+            Subquery(
+                CouponUsageShard.objects.filter(coupon=OuterRef('pk'))
+                .order_by().values('coupon').annotate(total=Sum('used')).values('total')
+            ),
+            0,
+        )
+    ).order_by('-id')
     serializer_class = CouponSerializer
     parser_classes = [JSONParser, PlainTextJSONParser]
 
@@ -150,6 +315,7 @@ class CouponViewSet(viewsets.ModelViewSet):
 class AddItemToCartAPIView(APIView):
     """POST /api/cart/item/add/ - Add or update item in cart. Rate from medical item master (MedicalItem)."""
     parser_classes = [JSONParser, PlainTextJSONParser]
+    query_budget = 8
 
     def post(self, request):
         serializer = AddItemToCartSerializer(data=_parse_post_json(request))
@@ -171,6 +337,10 @@ class AddItemToCartAPIView(APIView):
                 {'error': f'Medical item with mcode "{mcode}" not found in medical item master.'},
                 status=status.HTTP_404_NOT_FOUND,
             )
+        if inventory.enforcing():
+            available = inventory.on_hand(product.id)
+            if available < qty:
+                return _out_of_stock_response(mcode, available)
 
         # Use MRP minus sell_discount% as the effective selling price so that
         # cart item amounts, order summary, and admin order totals all align.
@@ -188,6 +358,7 @@ class AddItemToCartAPIView(APIView):
             item_code=mcode,
             defaults={'qty': qty, 'rate': rate, 'amt': amt},
         )
+        coupons.refresh_cart_discount(cart)
         return Response(
             {
                 'message': 'Updated item in cart.' if not created else 'Item added to cart.',
@@ -221,9 +392,17 @@ def _resolve_cart_line(cart, mcode):
     return line, None if line else 'cart'
 
 
+def _out_of_stock_response(mcode, available):
+    return Response(
+        {'error': f'Only {max(available, 0)} of medical item "{mcode}" in stock.', 'available': max(available, 0)},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+
+
 class IncrementCartItemAPIView(APIView):
     """POST /api/cart/item/increment/ - Increase qty of an item in cart by 1."""
     parser_classes = [JSONParser, PlainTextJSONParser]
+    query_budget = 5
 
     def post(self, request):
         serializer = CartItemIdentifySerializer(data=_parse_post_json(request))
@@ -248,9 +427,14 @@ class IncrementCartItemAPIView(APIView):
                 {'error': f'Item with mcode "{mcode}" not found in cart.'},
                 status=status.HTTP_404_NOT_FOUND,
             )
+        if inventory.enforcing():
+            available = inventory.on_hand(MedicalItem.objects.filter(mcode=mcode).values_list('id', flat=True).first())
+            if available < line.qty + 1:
+                return _out_of_stock_response(mcode, available)
         line.qty += 1
         line.amt = line.qty * line.rate
         line.save()
+        coupons.refresh_cart_discount(cart)
         return Response(
             {'message': 'Item quantity increased.', 'item': OnlineOrderItemSerializer(line).data},
             status=status.HTTP_200_OK,
@@ -260,6 +444,7 @@ class IncrementCartItemAPIView(APIView):
 class DecrementCartItemAPIView(APIView):
     """POST /api/cart/item/decrement/ - Decrease qty of an item in cart by 1 (min 1)."""
     parser_classes = [JSONParser, PlainTextJSONParser]
+    query_budget = 4
 
     def post(self, request):
         serializer = CartItemIdentifySerializer(data=_parse_post_json(request))
@@ -292,6 +477,7 @@ class DecrementCartItemAPIView(APIView):
         line.qty -= 1
         line.amt = line.qty * line.rate
         line.save()
+        coupons.refresh_cart_discount(cart)
         return Response(
             {'message': 'Item quantity decreased.', 'item': OnlineOrderItemSerializer(line).data},
             status=status.HTTP_200_OK,
@@ -321,6 +507,7 @@ class DeleteCartItemAPIView(APIView):
                 status=status.HTTP_404_NOT_FOUND,
             )
         line.delete()
+        coupons.refresh_cart_discount(cart)
         return Response(
             {'message': 'Item removed from cart.'},
             status=status.HTTP_200_OK,
@@ -344,8 +531,85 @@ class DeleteCartItemAPIView(APIView):
         )
 
 
+class ApplyCouponAPIView(APIView):
+    """
+    POST /api/cart/coupon/apply/ – {"order_no", "coupon"}: check the code against the active coupons
+    for the logged-in customer and apply its discount to the open cart. DELETE with ?order_no=
+    (or a JSON body) removes the coupon. The discount follows later line changes.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, PlainTextJSONParser]
+    query_budget = 5
+
+    def _open_cart(self, request, order_no):
+        """(cart, customer_code, None) for the customer's open cart, or (None, None, error response)."""
+        customer_code = (getattr(getattr(request.user, 'profile', None), 'customer_code', None) or '').strip()
+        if not customer_code:
+            return None, None, Response(
+                {'error': 'Customer code not found for this user.'},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        cart = Cart.objects.filter(order_no=order_no).first()
+        if not cart:
+            return None, None, Response(
+                {'error': f'Cart with order_no "{order_no}" not found.'},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        if (cart.ccode or '').strip() not in ('', customer_code):
+            return None, None, Response(
+                {'error': 'This cart belongs to another customer.'},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        if cart.delivery_status != 'CART':
+            return None, None, Response(
+                {'error': 'Order was already confirmed.', 'order_no': cart.order_no},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return cart, customer_code, None
+
+    def _summary(self, cart, message):
+        subtotal = cart.items.aggregate(s=Sum('amt'))['s'] or Decimal('0')
+        cart.refresh_from_db(fields=['coupon', 'discount'])
+        return Response(
+            {
+                'message': message,
+                'order_no': cart.order_no,
+                'coupon_code': cart.coupon.name if cart.coupon_id else None,
+                'subtotal': subtotal,
+                'discount': cart.discount,
+                'total': subtotal - cart.discount,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    def post(self, request):
+        serializer = ApplyCouponSerializer(data=_parse_post_json(request))
+        serializer.is_valid(raise_exception=True)
+        cart, customer_code, error = self._open_cart(request, serializer.validated_data['order_no'])
+        if error is not None:
+            return error
+        try:
+            coupon = coupons.apply_to_cart(cart, serializer.validated_data['coupon'], customer_code)
+        except coupons.CouponError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._summary(cart, f'Coupon "{coupon.name}" applied.')
+
+    def delete(self, request):
+        order_no = request.query_params.get('order_no') or _parse_post_json(request).get('order_no')
+        if not order_no:
+            return Response({'error': 'order_no is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        cart, _, error = self._open_cart(request, order_no)
+        if error is not None:
+            return error
+        coupons.remove_from_cart(cart)
+        return self._summary(cart, 'Coupon removed.')
+
+
 class OrderSummaryAPIView(APIView):
     """GET /api/cart/summary/ – Order summary for a cart: subtotal, discount, total."""
+    query_budget = 3
+
     def get(self, request):
         order_no = request.query_params.get('order_no')
         if not order_no and request.body:
@@ -359,7 +623,7 @@ class OrderSummaryAPIView(APIView):
                 {'error': 'Query parameter order_no is required, or send JSON body with order_no.'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        cart = Cart.objects.prefetch_related('items').filter(order_no=order_no).first()
+        cart = Cart.objects.select_related('coupon').prefetch_related('items').filter(order_no=order_no).first()
         if not cart:
             return Response(
                 {'error': f'Cart with order_no "{order_no}" not found.'},
@@ -374,6 +638,7 @@ class OrderSummaryAPIView(APIView):
                 'items': OnlineOrderItemSerializer(cart.items.all(), many=True).data,
                 'subtotal': subtotal,
                 'discount': discount,
+                'coupon_code': cart.coupon.name if cart.coupon else None,
                 'total': total,
             },
             status=status.HTTP_200_OK,
@@ -387,7 +652,7 @@ class OrderSummaryAPIView(APIView):
                 {'error': 'Body field order_no is required.'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        cart = Cart.objects.prefetch_related('items').filter(order_no=order_no).first()
+        cart = Cart.objects.select_related('coupon').prefetch_related('items').filter(order_no=order_no).first()
         if not cart:
             return Response(
                 {'error': f'Cart with order_no "{order_no}" not found.'},
@@ -402,6 +667,7 @@ class OrderSummaryAPIView(APIView):
                 'items': OnlineOrderItemSerializer(cart.items.all(), many=True).data,
                 'subtotal': subtotal,
                 'discount': discount,
+                'coupon_code': cart.coupon.name if cart.coupon else None,
                 'total': total,
             },
             status=status.HTTP_200_OK,
@@ -413,7 +679,7 @@ class OrderSummaryAPIView(APIView):
 
 class CustomerAddressAPIView(APIView):
     """Get or create/update customer address. When authenticated, customer_code is taken from backend (logged-in user)."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = []  # optional auth: support both with and without token
     parser_classes = [JSONParser, PlainTextJSONParser]
 
@@ -514,7 +780,7 @@ class CustomerAddressAPIView(APIView):
 
 class ConfirmOrderAPIView(APIView):
     """POST /api/orders/confirm/ – Confirm cart as order. Authenticated; validates cart, address; recalculates totals; locks cart."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     parser_classes = [JSONParser, PlainTextJSONParser]
 
@@ -548,7 +814,7 @@ class ConfirmOrderAPIView(APIView):
         payment_mode = serializer.validated_data['payment_mode']
 
         # 2. Fetch cart by order_no (must be CART to confirm; if already ORDERED, return existing order info)
-        cart = Cart.objects.prefetch_related('items').filter(order_no=order_no).first()
+        cart = Cart.objects.filter(order_no=order_no).first()
         if not cart:
             return Response(
                 {'error': f'Cart with order_no "{order_no}" not found.'},
@@ -582,14 +848,7 @@ class ConfirmOrderAPIView(APIView):
             )
         cart.ccode = normalized_customer_code
 
-        # 4. Ensure cart has items
-        if not cart.items.exists():
-            return Response(
-                {'error': 'Cart has no items. Add items before confirming.'},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # 5. Ensure address belongs to user
+        # 4. Ensure address belongs to user
         try:
             address = CustomerAddress.objects.get(id=address_id)
         except CustomerAddress.DoesNotExist:
@@ -603,31 +862,86 @@ class ConfirmOrderAPIView(APIView):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        # 6. Recalculate totals (backend only)
-        subtotal = cart.items.aggregate(s=Sum('amt'))['s'] or Decimal('0')
-        discount = getattr(cart, 'discount', None) or Decimal('0')
-        total_amount = subtotal - discount
-        courier_amount = Decimal('0')
-        net_amount = total_amount + courier_amount
-
-        # 7. Generate inv_no
-        date_part = now().strftime('%y%m%d')
-        while True:
-            inv_no = f"INV{date_part}{get_random_string(4, allowed_chars='0123456789')}"
-            if not Cart.objects.filter(inv_no=inv_no).exists():
-                break
-
-        # 8. Lock cart: update inv_no, delivery_status, amounts, ccode, payment_mode, and timestamp
-        cart.inv_no = inv_no
-        cart.delivery_status = 'ORDERED'
-        cart.total_amount = total_amount
-        cart.courier_amount = courier_amount
-        cart.net_amount = net_amount
-        cart.payment_mode = payment_mode
-        # Ensure the admin views show the exact confirmation time.
-        cart.date = now().date()
-        cart.time = now().time()
-        cart.save()
+        with transaction.atomic():
+            # 5. Lock the cart first, so two concurrent confirms can't both book the sale and the
+            # lines and coupon totalled below can't change before the order is saved.
+            if not Cart.objects.select_for_update().filter(pk=cart.pk, delivery_status='CART').exists():
+                return Response(
+                    {'error': 'Order was already confirmed.', 'order_no': cart.order_no},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            cart.refresh_from_db(fields=['coupon', 'discount'])
+            lines = list(OnlineOrderItem.objects.filter(cart=cart))
+            if not lines:
+                return Response(
+                    {'error': 'Cart has no items. Add items before confirming.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            # 6. Recalculate totals (backend only)
+            subtotal = sum((line.amt for line in lines), Decimal('0'))
+            discount = cart.discount or Decimal('0')
+            if cart.coupon_id:
+                # Re-check the cart's coupon (by id) against the active-coupon index; it may have
+                # been withdrawn or expired, or the customer may have ordered since it was applied.
+                coupon = coupons.coupon_index.get_by_id(cart.coupon_id)
+                try:
+                    if coupon is None:
+                        raise coupons.CouponError('The coupon on this cart is no longer valid.')
+                    coupons.check_eligibility(coupon, normalized_customer_code)
+                    # Count the use against the coupon's limits; rolled back with the order below.
+                    coupons.redeem(coupon, normalized_customer_code)
+                except coupons.CouponError as e:
+                    coupons.remove_from_cart(cart)
+                    return Response(
+                        {'error': f'{e} It has been removed; review the total and confirm again.'},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                discount = coupons.discount_for(subtotal, coupon)
+            total_amount = subtotal - discount
+            courier_amount = Decimal('0')
+            net_amount = total_amount + courier_amount
+
+            # 7. Take the items out of stock.
+            quantities = {}
+            for line in lines:
+                quantities[line.item_code] = quantities.get(line.item_code, 0) + line.qty
+            try:
+                inventory.record_sale(quantities, cart.order_no)
+            except inventory.InsufficientStock as e:
+                transaction.set_rollback(True)
+                return Response(
+                    {
+                        'error': 'Some items are out of stock.',
+                        'items': [
+                            {'mcode': mcode, 'qty': wanted, 'available': max(available, 0)}
+                            for mcode, (wanted, available) in e.shortages.items()
+                        ],
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            # 8. Generate inv_no
+            date_part = now().strftime('%y%m%d')
+            while True:
+                inv_no = f"INV{date_part}{get_random_string(4, allowed_chars='0123456789')}"
+                if not Cart.objects.filter(inv_no=inv_no).exists():
+                    break
+
+            # 9. Lock cart: update inv_no, delivery_status, amounts, ccode, payment_mode, and timestamp
+            cart.inv_no = inv_no
+            cart.delivery_status = 'ORDERED'
+            cart.discount = discount
+            cart.total_amount = total_amount
+            cart.courier_amount = courier_amount
+            cart.net_amount = net_amount
+            cart.payment_mode = payment_mode
+            # Ensure the admin views show the exact confirmation time.
+            cart.date = now().date()
+            cart.time = now().time()
+            cart.save()
+            analytics.record_order(cart, lines)
+            invoices.render_invoice_in_background(cart)
 
         return Response(
             {
@@ -644,24 +958,69 @@ class ConfirmOrderAPIView(APIView):
         )
 
 
+class OrderInvoiceAPIView(APIView):
+    """
+    GET /api/orders/{order_no}/invoice.pdf – invoice PDF of a confirmed order, for the customer who
+    placed it or staff. Rendered in the background after confirm (or here, if that has not finished).
+    The ETag is the PDF's SHA-256; If-None-Match and single byte ranges are supported.
+    """
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = 2
+
+    def get(self, request, order_no):
+        cart = (
+            Cart.objects.select_related('invoice_document')
+            .exclude(delivery_status='CART').filter(order_no=order_no).first()
+        )
+        if cart is not None and not (request.user.is_staff or request.user.is_superuser):
+            customer_code = UserProfile.objects.filter(user=request.user).values_list('customer_code', flat=True).first()
+            if not customer_code or customer_code != (cart.ccode or '').strip():
+                cart = None
+        if cart is None:
+            return Response({'error': f'Order "{order_no}" not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        document = getattr(cart, 'invoice_document', None)
+        if document is None or not invoices.is_stored(document):
+            document = invoices.render_invoice(cart.pk)
+        return invoices.pdf_response(request, document, f'{cart.inv_no or cart.order_no}.pdf')
+
+
 class AdminOrderListAPIView(APIView):
     """GET /api/admin/orders/ – List all orders (confirmed orders only, i.e. delivery_status != 'CART'). Requires authentication for customer recognition."""
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
-
-    def get(self, request):
-        # Only list confirmed orders (exclude carts still in progress)
+    read_replica_actions = ('get',)
+    query_budget = 1
+
+    @staticmethod
+    def orders(status_filter=''):
+        """The list's queryset (explain_hot_queries checks its plan)."""
+        # Only list confirmed orders (exclude carts still in progress). The customer and the
+        # item count come from correlated subqueries, so the whole list is one query.
+        profile = UserProfile.objects.filter(customer_code=OuterRef('ccode')).order_by('id')
         carts = (
             Cart.objects
             .exclude(delivery_status='CART')
             .exclude(order_no='')
-            .prefetch_related('items')
+            .annotate(
+                customer_id=Subquery(profile.values('id')[:1]),
+                customer_name=Subquery(profile.values('name')[:1]),
+                item_count=Subquery(
+                    OnlineOrderItem.objects.filter(cart=OuterRef('pk'))
+                    .order_by().values('cart').annotate(total=Sum('qty')).values('total')
+                ),
+            )
             .order_by('-date', '-time', '-id')
         )
-        # Optional filter by status (e.g. ?status=ordered)
-        status_filter = request.query_params.get('status', '').strip().lower()
+        # Optional filter by status (e.g. ?status=ordered), case-insensitive. Comparing UPPER()
+        # rather than using iexact lets cart_status_date_idx serve it already sorted.
         if status_filter:
-            carts = carts.filter(delivery_status__iexact=status_filter)
+            carts = carts.alias(status_upper=Upper('delivery_status')).filter(status_upper=status_filter.upper())
+        return carts
+
+    def get(self, request):
+        carts = self.orders(request.query_params.get('status', '').strip())
 
         results = []
         for cart in carts:
@@ -676,15 +1035,10 @@ class AdminOrderListAPIView(APIView):
             order_status = (cart.delivery_status or 'cart').lower()
             payment_status = 'paid' if (order_status == 'ordered' and cart.payment_mode) else 'pending'
             payment_method = (cart.payment_mode or '').lower() or None
-            customer_name = ''
-            customer_id = None
-            if cart.ccode:
-                profile = UserProfile.objects.filter(customer_code=cart.ccode).first()
-                if profile:
-                    customer_id = profile.id
-                    customer_name = profile.name or ''
+            customer_id = cart.customer_id if cart.ccode else None
+            customer_name = (cart.customer_name or '') if customer_id else ''
             # Use total quantity across all lines (not just line count)
-            item_count = cart.items.aggregate(c=Sum('qty'))['c'] or 0
+            item_count = cart.item_count or 0
             results.append({
                 'order_id': cart.order_no,
                 'cart_id': cart.id,
@@ -700,18 +1054,105 @@ class AdminOrderListAPIView(APIView):
         return Response({'count': len(results), 'results': results}, status=status.HTTP_200_OK)
 
 
+class SalesReportAPIView(APIView):
+    """
+    GET /api/reports/sales/ – sales from the daily rollups (never the order tables).
+    ?by=day (default) | item | category | payment_mode, ?from= / ?to= (YYYY-MM-DD, default: this
+    month), and for item/category/payment_mode ?order=revenue|units|orders and ?limit= (default 20).
+    Staff only.
+    """
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+    read_replica_actions = ('get',)
+    query_budget = 3
+
+    def get(self, request):
+        params = request.query_params
+        by = params.get('by', 'day')
+        if by not in ('day', 'item', 'category', 'payment_mode'):
+            return Response(
+                {'error': 'by must be one of day, item, category, payment_mode.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        today = now().date()
+        try:
+            start = date.fromisoformat(params['from']) if params.get('from') else today.replace(day=1)
+            end = date.fromisoformat(params['to']) if params.get('to') else today
+        except ValueError:
+            return Response({'error': 'from and to must be dates (YYYY-MM-DD).'}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response({'error': 'from is after to.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if by == 'day':
+            results = analytics.daily_totals(start, end)
+        else:
+            order = params.get('order', 'revenue')
+            if order not in ('revenue', 'units', 'orders'):
+                return Response(
+                    {'error': 'order must be one of revenue, units, orders.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            try:
+                limit = min(max(int(params.get('limit', 20)), 1), 500)
+            except ValueError:
+                return Response({'error': 'limit must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+            results = analytics.report(by, start, end, order_by=order, limit=limit)
+        return Response({'by': by, 'from': start, 'to': end, 'results': results})
+
+
+class ExportAPIView(APIView):
+    """
+    GET /api/exports/{dataset}.{csv|xlsx} – download orders (one row per line), purchase-orders
+    (one row per line) or medicalitems, streamed as it is read (see newlogin/exports.py).
+    orders: ?from= / ?to= (YYYY-MM-DD) and ?status=; purchase-orders: ?from= / ?to=, ?status=
+    and ?supplier= (supplier_code); medicalitems: ?category= (catcode). Staff only.
+    """
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+    read_replica_actions = ('get',)
+    query_budget = 2
+
+    def get(self, request, dataset, file_format):
+        if file_format not in exports.CONTENT_TYPES:
+            return Response({'error': 'Export format must be csv or xlsx.'}, status=status.HTTP_404_NOT_FOUND)
+        params = request.query_params
+        try:
+            start = date.fromisoformat(params['from']) if params.get('from') else None
+            end = date.fromisoformat(params['to']) if params.get('to') else None
+        except ValueError:
+            return Response({'error': 'from and to must be dates (YYYY-MM-DD).'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if dataset == 'orders':
+            header, rows = exports.order_rows(start, end, status=params.get('status', '').strip())
+        elif dataset == 'purchase-orders':
+            header, rows = exports.purchase_order_rows(
+                start, end, status=params.get('status', '').strip(), supplier=params.get('supplier', '').strip(),
+            )
+        elif dataset == 'medicalitems':
+            header, rows = exports.medical_item_rows(category=params.get('category', '').strip())
+        else:
+            return Response(
+                {'error': 'Unknown export. Use orders, purchase-orders or medicalitems.'},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        filename = f"{dataset}-{now().strftime('%Y%m%d')}"
+        return exports.streaming_response(request, filename, header, rows, file_format)
+
+
 class AdminOrderDetailAPIView(APIView):
     """GET /api/admin/orders/{order_id}/ – Order details. order_id = Cart.id (int) or order_no (string). Requires authentication for customer recognition."""
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    read_replica_actions = ('get',)
+    query_budget = 4
 
     def get(self, request, order_id):
         cart = None
         try:
             pk = int(order_id)
-            cart = Cart.objects.prefetch_related('items').filter(pk=pk).first()
+            cart = Cart.objects.select_related('coupon').prefetch_related('items').filter(pk=pk).first()
         except (ValueError, TypeError):
-            cart = Cart.objects.prefetch_related('items').filter(order_no=order_id).first()
+            cart = Cart.objects.select_related('coupon').prefetch_related('items').filter(order_no=order_id).first()
         if not cart:
             return Response(
                 {'error': f'Order with id or order_no "{order_id}" not found.'},
@@ -748,7 +1189,10 @@ class AdminOrderDetailAPIView(APIView):
             'country': '',
         }
         if cart.ccode:
-            profile = UserProfile.objects.filter(customer_code=cart.ccode).first()
+            profile = (
+                UserProfile.objects.select_related('user', 'address')
+                .filter(customer_code=cart.ccode).order_by('id').first()
+            )
             if profile:
                 customer['customer_id'] = profile.id
                 customer['name'] = profile.name or ''
@@ -767,13 +1211,19 @@ class AdminOrderDetailAPIView(APIView):
                 except CustomerAddress.DoesNotExist:
                     pass
 
+        lines = list(cart.items.all())
+        # One lookup for every line: a line's code may be an Item's sku_code or item_code, and
+        # the first match in Item's default order wins, as it did per line.
+        codes = {line.item_code for line in lines}
+        items_by_code = {}
+        for item in Item.objects.filter(Q(sku_code__in=codes) | Q(item_code__in=codes)) if codes else ():
+            items_by_code.setdefault(item.sku_code, item)
+            items_by_code.setdefault(item.item_code, item)
         items_payload = []
-        for line in cart.items.all():
+        for line in lines:
             product_name = line.item_code
             product_id = None
-            item_obj = Item.objects.filter(
-                Q(sku_code=line.item_code) | Q(item_code=line.item_code)
-            ).first()
+            item_obj = items_by_code.get(line.item_code)
             if item_obj:
                 product_name = item_obj.sku_name or line.item_code
                 product_id = item_obj.id
@@ -787,13 +1237,13 @@ class AdminOrderDetailAPIView(APIView):
                 'subtotal': float(line.amt),
             })
 
-        subtotal = cart.items.aggregate(s=Sum('amt'))['s'] or Decimal('0')
+        subtotal = sum((line.amt for line in lines), Decimal('0'))
         summary = {
             'subtotal': float(subtotal),
             'tax': 0.0,
             'shipping_fee': float(cart.courier_amount or 0),
             'discount': float(cart.discount or 0),
-            'coupon_code': None,
+            'coupon_code': cart.coupon.name if cart.coupon else None,
             'final_total': float(cart.net_amount or 0),
         }
 
@@ -813,12 +1263,12 @@ class AdminOrderDetailAPIView(APIView):
         }, status=status.HTTP_200_OK)
 
 
-class RegisterAPIView(APIView):
+class RegisterAPIView(AsyncAPIView):
     """Register a new user (POST) and fetch current user's registration details (GET)."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = []  # POST is open; GET requires token (checked inside)
 
-    def get(self, request):
+    async def get(self, request):
         """GET /api/auth/register/ – return current logged-in user's registration details."""
         if not request.user.is_authenticated:
             return Response(
@@ -842,19 +1292,28 @@ class RegisterAPIView(APIView):
         serializer = RegisterDetailSerializer(payload)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-    def post(self, request):
+    async def post(self, request):
         serializer = RegisterSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        result = serializer.save()
+        # Validation checks email/phone uniqueness and save() creates the user and profile.
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        # Hash on the bounded background pool (not the event loop or the shared sync thread), then
+        # create the user with the finished hash, so the password sent below is stored before it
+        # goes out.
+        password = RegisterSerializer.new_password()
+        encoded = await run_in_pool(make_password, password)
+        result = await sync_to_async(serializer.save)(password=password, password_hash=encoded)
         user = result['user']
         password = result['password']
-        token, _ = Token.objects.get_or_create(user=user)
+        token, _ = await Token.objects.aget_or_create(user=user)
         name = getattr(user.profile, 'name', None) or ''
         from .notification_utils import send_registration_email, send_registration_sms
-        email_sent, email_error = send_registration_email(
-            user.email, user.username, password, name=name or None
+        # SMTP and the SMS gateway are blocking; send both at once off the event loop.
+        (email_sent, email_error), _ = await asyncio.gather(
+            sync_to_async(send_registration_email, thread_sensitive=False)(
+                user.email, user.username, password, name=name or None
+            ),
+            sync_to_async(send_registration_sms, thread_sensitive=False)(user.username, user.username, password),
         )
-        send_registration_sms(user.username, user.username, password)
         msg = 'User registered successfully. Username and password sent to your email and mobile.'
         if not email_sent:
             msg = 'User registered successfully. Credentials are below; email could not be sent.'
@@ -876,6 +1335,7 @@ class RegisterAPIView(APIView):
 class IdentifyCustomerAPIView(APIView):
     """POST /api/auth/identify-customer/ – Identify if a mobileNumber belongs to an existing customer."""
     permission_classes = [AllowAny]
+    throttle_classes = IDENTIFY_CUSTOMER_THROTTLES
     parser_classes = [JSONParser, PlainTextJSONParser]
 
     def post(self, request):
@@ -915,12 +1375,13 @@ class IdentifyCustomerAPIView(APIView):
         )
 
 
-class SendOtpAPIView(APIView):
+class SendOtpAPIView(AsyncAPIView):
     """POST /api/auth/send-otp/ – Generate and store an OTP for the given mobileNumber/email."""
     permission_classes = [AllowAny]
+    throttle_classes = SEND_OTP_THROTTLES
     parser_classes = [JSONParser, PlainTextJSONParser]
 
-    def post(self, request):
+    async def post(self, request):
         serializer = SendOtpSerializer(data=_parse_post_json(request))
         serializer.is_valid(raise_exception=True)
         mobile = serializer.validated_data['mobileNumber'].strip()
@@ -929,7 +1390,7 @@ class SendOtpAPIView(APIView):
         # Generate a 6-digit numeric OTP and store it for potential future verification.
         from django.utils.crypto import get_random_string
         code = get_random_string(6, allowed_chars='0123456789')
-        otp = OneTimePassword.objects.create(
+        otp = await OneTimePassword.objects.acreate(
             mobile_number=mobile,
             email=email or None,
             code=code,
@@ -941,10 +1402,17 @@ class SendOtpAPIView(APIView):
         expiry_seconds = max(0, int((otp.expires_at - tz_now()).total_seconds()))
         otp_reference_id = f"OTP{otp.id:06d}"
 
-        # Send OTP via email and SMS (if configured)
+        # Send OTP via email and SMS (if configured), concurrently and off the event loop.
         from .notification_utils import send_otp_email, send_otp_sms
-        send_otp_email(email, code)
-        send_otp_sms(mobile, code)
+        await asyncio.gather(
+            sync_to_async(send_otp_email, thread_sensitive=False)(email, code),
+            sync_to_async(send_otp_sms, thread_sensitive=False)(mobile, code),
+        )
+
+        # Keep the OTP table bounded: queues a background purge at most once per
+        # OTP_PURGE_INTERVAL_SECONDS, so this request does not run the DELETEs.
+        from .otp_utils import maybe_purge_otps
+        await sync_to_async(maybe_purge_otps)()
 
         return Response(
             {
@@ -957,12 +1425,12 @@ class SendOtpAPIView(APIView):
         )
 
 
-class VerifyOtpAPIView(APIView):
+class VerifyOtpAPIView(AsyncAPIView):
     """POST /api/auth/verify-otp/ – Verify an OTP and generate a customerCode."""
     permission_classes = [AllowAny]
     parser_classes = [JSONParser, PlainTextJSONParser]
 
-    def post(self, request):
+    async def post(self, request):
         serializer = VerifyOtpSerializer(data=_parse_post_json(request))
         serializer.is_valid(raise_exception=True)
         ref = serializer.validated_data['otpReferenceId'].strip()
@@ -975,7 +1443,7 @@ class VerifyOtpAPIView(APIView):
             )
         otp_id = int(ref[3:])
 
-        otp = OneTimePassword.objects.filter(id=otp_id).first()
+        otp = await OneTimePassword.objects.filter(id=otp_id).afirst()
         if not otp:
             return Response(
                 {'error': 'OTP not found.'},
@@ -993,7 +1461,7 @@ class VerifyOtpAPIView(APIView):
             )
 
         # Determine if this is a new customer (no User with this mobileNumber).
-        user = User.objects.filter(username=otp.mobile_number).first()
+        user = await User.objects.filter(username=otp.mobile_number).afirst()
         is_new_customer = user is None
 
         # Generate or reuse a customer_code for this OTP.
@@ -1002,31 +1470,31 @@ class VerifyOtpAPIView(APIView):
             date_part = now().strftime('%y%m%d')
             while True:
                 candidate = f"CUST{date_part}{get_random_string(4, allowed_chars='0123456789')}"
-                if not UserProfile.objects.filter(customer_code=candidate).exists():
+                if not await UserProfile.objects.filter(customer_code=candidate).aexists():
                     otp.customer_code = candidate
                     break
 
         from django.utils.timezone import now as tz_now
         otp.verified_at = tz_now()
-        otp.save()
+        await otp.asave()
 
         # Issue a token for both new and existing customers.
         if user is None:
             # New customer: create minimal User and UserProfile so we can issue a Token.
-            from django.utils.crypto import get_random_string
-            password = get_random_string(12, allowed_chars='abcdefghjkmnpqrstuvwxyzABCDEFGHJKMNPQRSTUVWXYZ23456789')
-            user = User.objects.create_user(
+            # OTP customers authenticate by token, so no password is hashed here; the
+            # account has an unusable password until one is set via reset-password.
+            user = await sync_to_async(User.objects.create_user)(
                 username=otp.mobile_number,
                 email=(otp.email or '').strip() or f"{otp.mobile_number}@otp.local",
-                password=password,
+                password=None,
             )
-            UserProfile.objects.create(
+            await UserProfile.objects.acreate(
                 user=user,
                 name='',
                 phone=otp.mobile_number,
                 customer_code=otp.customer_code,
             )
-        token, _ = Token.objects.get_or_create(user=user)
+        token, _ = await Token.objects.aget_or_create(user=user)
 
         return Response(
             {
@@ -1042,6 +1510,7 @@ class VerifyOtpAPIView(APIView):
 class AdminLoginAPIView(APIView):
     """POST /api/admin/login/ – Admin login with username and password. Returns auth token. User must be staff or superuser."""
     permission_classes = [AllowAny]
+    throttle_classes = LOGIN_THROTTLES
     parser_classes = [JSONParser, PlainTextJSONParser]
 
     def post(self, request):
@@ -1070,6 +1539,8 @@ class AdminLoginAPIView(APIView):
 
 
 class LoginAPIView(APIView):
+    throttle_classes = LOGIN_THROTTLES
+
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -1090,6 +1561,16 @@ class LoginAPIView(APIView):
         })
 
 
+class LogoutAPIView(APIView):
+    """POST /api/auth/logout/ – Delete the caller's auth token (also evicts it from the token cache)."""
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        Token.objects.filter(key=request.auth.key).delete()
+        return Response({'message': 'Logged out successfully.'}, status=status.HTTP_200_OK)
+
+
 class ForgotPasswordAPIView(APIView):
     def post(self, request):
         serializer = ForgotPasswordSerializer(data=request.data)
@@ -1153,7 +1634,7 @@ class ResetPasswordAPIView(APIView):
 
 class RegisterDeleteAPIView(APIView):
     """Delete the authenticated user's account (register delete)."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
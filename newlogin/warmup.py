@@ -0,0 +1,39 @@
+"""
+Start-up warm-up for the catalog read paths.
+
+Called from gunicorn's when_ready hook (see gunicorn.conf.py) in the master process after the
+app is preloaded, so every forked worker inherits the imported views/serializers and the
+database pages behind the catalog are already in the OS page cache / buffer pool.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def warm_catalog():
+    """Import every view via the URLconf and run the catalog list queries once."""
+    from .serializers import CategorySerializer, MedicalItemSerializer
+    from .views import CategoryViewSet, MedicalItemViewSet
+
+    started = time.perf_counter()
+    limit = getattr(settings, 'WARMUP_CATALOG_ITEMS', 1000)
+    try:
+        # URL patterns (and so all view modules) are otherwise imported on the first request.
+        get_resolver().url_patterns
+        categories = CategorySerializer(CategoryViewSet.queryset, many=True).data
+        items = MedicalItemSerializer(MedicalItemViewSet.queryset[:limit], many=True).data
+        logger.info(
+            'Catalog warm-up: %s categories, %s items in %.0f ms',
+            len(categories), len(items), (time.perf_counter() - started) * 1000,
+        )
+    except Exception as e:
+        # A cold start is slower, not broken; never block the server from booting.
+        logger.exception('Catalog warm-up failed: %s', e)
+    finally:
+        # Connections must not be shared with forked workers.
+        connections.close_all()